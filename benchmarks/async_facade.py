@@ -0,0 +1,121 @@
+"""
+Compares an asyncio web tier calling the synchronous MessageBoards API directly
+from its event loop against calling it through the asyncio facade.
+
+Both modes serve the same requests, many at a time, across several boards.
+For each mode, the benchmark reports requests per second and the longest
+time the event loop was unable to run other tasks, measured by a heartbeat
+task. The benchmark runs against the in-memory store and against SQLite
+database files.
+
+Run with ``python -m benchmarks.async_facade``
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from typing import Awaitable, Callable, List, Tuple
+from uuid import UUID, uuid4
+
+from messageboard.application import MessageBoards
+from messageboard.async_application import AsyncMessageBoards
+
+BOARDS = 50
+REQUESTS = 2_000
+CONCURRENCY = 64
+MAX_WORKERS = 8
+HEARTBEAT_INTERVAL = 0.001
+
+PostMessage = Callable[[UUID, str, None, UUID], Awaitable[int]]
+
+
+async def serve(post_message: PostMessage, board_ids: List[UUID]) -> float:
+    """
+    Serve the requests, at most CONCURRENCY at a time, and return requests/sec
+    """
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    author_id = uuid4()
+
+    async def request(i: int) -> None:
+        async with semaphore:
+            await post_message(board_ids[i % BOARDS], "text", None, author_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request(i) for i in range(REQUESTS)))
+    return REQUESTS / (time.perf_counter() - start)
+
+
+async def measure(
+    post_message: PostMessage, board_ids: List[UUID]
+) -> Tuple[float, float]:
+    """
+    Serve the requests while a heartbeat task measures event loop stalls
+    """
+    longest_stall = 0.0
+    stopped = False
+
+    async def heartbeat() -> None:
+        nonlocal longest_stall
+        while not stopped:
+            before = time.perf_counter()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            stall = time.perf_counter() - before - HEARTBEAT_INTERVAL
+            longest_stall = max(longest_stall, stall)
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    rate = await serve(post_message, board_ids)
+    stopped = True
+    await heartbeat_task
+    return rate, longest_stall
+
+
+def create_boards(message_boards: MessageBoards) -> List[UUID]:
+    admin_id = uuid4()
+    return [
+        message_boards.create_message_board(f"Board {i}", admin_id)
+        for i in range(BOARDS)
+    ]
+
+
+def run_sync() -> Tuple[float, float]:
+    message_boards = MessageBoards()
+    board_ids = create_boards(message_boards)
+
+    async def post_message(
+        board_id: UUID, text: str, reply_to: None, author_id: UUID
+    ) -> int:
+        return message_boards.post_message(board_id, text, reply_to, author_id)
+
+    return asyncio.run(measure(post_message, board_ids))
+
+
+def run_async() -> Tuple[float, float]:
+    message_boards = MessageBoards()
+    board_ids = create_boards(message_boards)
+
+    async def run() -> Tuple[float, float]:
+        async with AsyncMessageBoards(message_boards, max_workers=MAX_WORKERS) as app:
+            return await measure(app.post_message, board_ids)
+
+    return asyncio.run(run())
+
+
+def report(store: str, mode: str, result: Tuple[float, float]) -> None:
+    rate, longest_stall = result
+    print(f"{store:<8} {mode:<6} {rate:>10.0f} {longest_stall * 1000:>14.1f}")
+
+
+def main() -> None:
+    print(f"{'store':<8} {'mode':<6} {'req/s':>10} {'max stall (ms)':>14}")
+    report("memory", "sync", run_sync())
+    report("memory", "async", run_async())
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["INFRASTRUCTURE_FACTORY"] = "eventsourcing.sqlite:Factory"
+        for mode, run in (("sync", run_sync), ("async", run_async)):
+            os.environ["SQLITE_DBNAME"] = os.path.join(directory, f"{mode}.sqlite")
+            report("sqlite", mode, run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Compares the size of stored MessageBoard events, and the time to encode
+and decode them, between the library's JSON transcoding and the compact
+binary codec, with and without compression of message text. Replay is
+measured by loading boards from SQLite, which decodes every event.
+
+Run with ``python -m benchmarks.event_codec``
+"""
+
+import os
+import random
+import tempfile
+import time
+from typing import Callable, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from eventsourcing.persistence import StoredEvent
+
+from messageboard.application import MessageBoards
+
+BOARDS = 20
+POSTS_PER_BOARD = 2_000
+REPEATS = 3
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while message boards fill up "
+    "with replies about event sourcing and projections"
+).split()
+CODECS = {
+    "json": {"COMPACT_EVENTS": "no"},
+    "binary": {"COMPACT_EVENTS": "yes"},
+    "binary+zlib": {"COMPACT_EVENTS": "yes", "COMPRESS_MESSAGE_TEXT": "yes"},
+}
+
+
+def message_text(rng: random.Random) -> str:
+    """
+    Text of 5 to 100 words, so about a quarter are long enough to compress
+    """
+    return " ".join(rng.choices(WORDS, k=rng.randint(5, 100)))
+
+
+def populate(app: MessageBoards) -> List[UUID]:
+    rng = random.Random(0)
+    admin_id = uuid4()
+    author_ids = [uuid4() for _ in range(100)]
+    board_ids = []
+    for i in range(BOARDS):
+        board_id = app.create_message_board(f"Board {i}", admin_id)
+        board_ids.append(board_id)
+        posts: List[Tuple[str, Optional[int], UUID]] = []
+        for j in range(POSTS_PER_BOARD):
+            reply_to = rng.randrange(j) if j and rng.random() < 0.5 else None
+            posts.append((message_text(rng), reply_to, rng.choice(author_ids)))
+        app.post_messages(board_id, posts)
+    return board_ids
+
+
+def best_time(function: Callable[[], object]) -> float:
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    print(
+        f"{'codec':<12} {'bytes/event':>12} {'encode (us)':>12} "
+        f"{'decode (us)':>12} {'replay (events/s)':>18}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for name, env in CODECS.items():
+            os.environ.update(
+                INFRASTRUCTURE_FACTORY="eventsourcing.sqlite:Factory",
+                SQLITE_DBNAME=os.path.join(directory, f"{name}.db"),
+                **env,
+            )
+            app = MessageBoards()
+            board_ids = populate(app)
+            stored: List[StoredEvent] = [
+                event
+                for board_id in board_ids
+                for event in app.recorder.select_events(board_id)
+            ]
+            size = sum(len(event.state) for event in stored) / len(stored)
+
+            domain_events = [app.mapper.to_domain_event(event) for event in stored]
+            decode = best_time(
+                lambda: [app.mapper.to_domain_event(event) for event in stored]
+            ) / len(stored)
+            encode = best_time(
+                lambda: [app.mapper.from_domain_event(event) for event in domain_events]
+            ) / len(stored)
+            replay = len(stored) / best_time(
+                lambda: [app.repository.get(board_id) for board_id in board_ids]
+            )
+            print(
+                f"{name:<12} {size:>12.0f} {encode * 1e6:>12.1f} "
+                f"{decode * 1e6:>12.1f} {replay:>18,.0f}"
+            )
+            for key in env:
+                del os.environ[key]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Measures command throughput when several threads post to the same board,
+with conflict retries only and with per-board command combining.
+
+Run with ``python -m benchmarks.hot_board``
+"""
+
+import time
+from threading import Thread
+from typing import List, Tuple
+from uuid import uuid4
+
+from eventsourcing.persistence import RecordConflictError
+
+from messageboard.application import MessageBoards
+
+THREADS = (1, 4, 16)
+POSTS_PER_THREAD = 200
+SNAPSHOTTING_INTERVAL = 100
+
+
+def run(app: MessageBoards, threads: int) -> Tuple[float, int]:
+    """
+    Post from several threads at once, and return the rate of successful posts
+    and the number of posts that failed with version conflicts
+    """
+    board_id = app.create_message_board("Benchmark board", uuid4())
+    author_id = uuid4()
+    failures: List[Exception] = []
+
+    def post_messages() -> None:
+        for _ in range(POSTS_PER_THREAD):
+            try:
+                app.post_message(board_id, "message text", None, author_id)
+            except RecordConflictError as e:
+                failures.append(e)
+
+    workers = [Thread(target=post_messages) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    return (threads * POSTS_PER_THREAD - len(failures)) / elapsed, len(failures)
+
+
+def main() -> None:
+    print(
+        f"{'threads':>8} {'retries/s':>12} {'conflicts':>10} "
+        f"{'combined/s':>12} {'conflicts':>10}"
+    )
+    for threads in THREADS:
+        retrying = MessageBoards(
+            snapshotting_interval=SNAPSHOTTING_INTERVAL, aggregate_cache_maxsize=10
+        )
+        combining = MessageBoards(
+            snapshotting_interval=SNAPSHOTTING_INTERVAL,
+            aggregate_cache_maxsize=10,
+            combine_commands=True,
+        )
+        retrying_rate, retrying_conflicts = run(retrying, threads)
+        combining_rate, combining_conflicts = run(combining, threads)
+        print(
+            f"{threads:>8} {retrying_rate:>12.0f} {retrying_conflicts:>10} "
+            f"{combining_rate:>12.0f} {combining_conflicts:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
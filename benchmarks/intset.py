@@ -0,0 +1,76 @@
+"""
+Compares the memory use, snapshot size and lookup time of IntRangeSet against
+the builtin set for moderation state on a heavily moderated board.
+
+Run with ``python -m benchmarks.intset``
+"""
+
+import json
+import random
+import timeit
+import tracemalloc
+from typing import Callable, Iterable, MutableSet, Tuple
+
+from messageboard.intset import IntRangeSet
+
+MESSAGE_COUNT = 1_000_000
+LOOKUPS = 100_000
+
+
+def awaiting_moderation() -> Iterable[int]:
+    """
+    The newest 10% of messages are awaiting moderation, with a few approved
+    """
+    start = MESSAGE_COUNT - MESSAGE_COUNT // 10
+    return (i for i in range(start, MESSAGE_COUNT) if i % 50 != 0)
+
+
+def rejected() -> Iterable[int]:
+    """
+    Older messages were rejected in bursts from spammers
+    """
+    return (i for i in range(MESSAGE_COUNT // 2) if (i // 100) % 10 == 0)
+
+
+def build(
+    factory: Callable[[], MutableSet[int]], values: Iterable[int]
+) -> Tuple[MutableSet[int], int]:
+    tracemalloc.start()
+    int_set = factory()
+    for value in values:
+        int_set.add(value)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return int_set, size
+
+
+def encoded_size(int_set: MutableSet[int]) -> int:
+    if isinstance(int_set, IntRangeSet):
+        return len(json.dumps(int_set.bounds()))
+    return len(json.dumps(list(int_set)))
+
+
+def lookup_time(int_set: MutableSet[int]) -> float:
+    keys = [random.randrange(MESSAGE_COUNT) for _ in range(LOOKUPS)]
+    elapsed = timeit.timeit(lambda: [k in int_set for k in keys], number=1)
+    return elapsed / LOOKUPS
+
+
+def main() -> None:
+    print(
+        f"{'state':<15} {'type':<12} {'members':>9} {'memory (B)':>12} "
+        f"{'snapshot (B)':>13} {'lookup (ns)':>12}"
+    )
+    for name, values in (("awaiting", awaiting_moderation), ("rejected", rejected)):
+        factory: Callable[[], MutableSet[int]]
+        for factory in (set, IntRangeSet):
+            int_set, memory = build(factory, values())
+            print(
+                f"{name:<15} {factory.__name__:<12} {len(int_set):>9} "
+                f"{memory:>12} {encoded_size(int_set):>13} "
+                f"{lookup_time(int_set) * 1e9:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Measures projection rebuild time from a SQLite event store, with the serial
+rebuild and split by board across pools of worker processes. The speedup is
+relative to a pool of one process, since the serial rebuild also records
+tracking for every notification.
+
+Run with ``python -m benchmarks.parallel_rebuild``
+"""
+
+import os
+import tempfile
+import time
+from typing import Callable, List
+from uuid import uuid4
+
+from messageboard.application import MessageBoards
+from messageboard.projections.rebuild import PROJECTIONS, rebuild, rebuild_parallel
+
+BOARDS = 64
+POSTS_PER_BOARD = 1_000
+BATCH_SIZE = 100
+PROCESSES = sorted({1, 2, 4, os.cpu_count() or 1})
+
+
+def populate() -> None:
+    app = MessageBoards()
+    author_id = uuid4()
+    for i in range(BOARDS):
+        board_id = app.create_message_board(f"Board {i}", uuid4())
+        batch = [("message text", None, author_id)] * BATCH_SIZE
+        for _ in range(POSTS_PER_BOARD // BATCH_SIZE):
+            app.post_messages(board_id, batch)
+
+
+def timed(function: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["INFRASTRUCTURE_FACTORY"] = "eventsourcing.sqlite:Factory"
+        os.environ["MESSAGEBOARDS_SQLITE_DBNAME"] = os.path.join(directory, "mb.db")
+        populate()
+        print(f"{BOARDS * POSTS_PER_BOARD} posts on {BOARDS} boards")
+        print(f"{os.cpu_count()} cores available")
+        print(f"{'projection':<18} {'processes':>9} {'seconds':>9} {'speedup':>8}")
+        for name, projection_cls in PROJECTIONS.items():
+            env_key = f"{name.upper()}_SQLITE_DBNAME"
+            os.environ[env_key] = os.path.join(directory, f"{name}-serial.db")
+            elapsed = timed(lambda: rebuild(projection_cls))
+            print(f"{name:<18} {'serial':>9} {elapsed:>9.2f}")
+            results: List[float] = []
+            for processes in PROCESSES:
+                os.environ[env_key] = os.path.join(directory, f"{name}-{processes}.db")
+                elapsed = timed(lambda: rebuild_parallel(projection_cls, processes))
+                results.append(elapsed)
+                print(
+                    f"{name:<18} {processes:>9} {elapsed:>9.2f} "
+                    f"{results[0] / elapsed:>7.2f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
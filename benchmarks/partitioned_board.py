@@ -0,0 +1,84 @@
+"""
+Measures how the throughput of posting to one hot board scales with the
+number of partitions of the board. Writer threads post to the same board
+concurrently, and every post that conflicts with another writer's is
+retried, so the conflicts per post show how much of the writers' work is
+wasted on the board being ordered by one aggregate.
+
+The application is set up by the environment, as usual, so the benchmark
+can be run against any persistence mode. Boards are cached, as a hot
+board would be.
+
+Run with ``python -m benchmarks.partitioned_board``
+"""
+
+import os
+import time
+from threading import Thread
+from typing import List, Tuple
+from uuid import uuid4
+
+from messageboard.application import MessageBoards
+from messageboard.metrics import InMemoryMetrics
+
+PARTITIONS = (1, 2, 4, 8)
+WRITERS = 8
+POSTS_PER_WRITER = 500
+DEFAULT_SETTINGS = {
+    MessageBoards.AGGREGATE_CACHE_MAXSIZE: "100",
+    MessageBoards.SNAPSHOTTING_INTERVAL: "100",
+    # Writers retry until they succeed, so no post is lost to conflicts
+    MessageBoards.COMMAND_MAX_RETRIES: "1000",
+}
+
+
+def run(partitions: int) -> Tuple[float, float]:
+    """
+    Returns the posts per second and the conflicts per post of writers
+    posting to a board with a number of partitions
+    """
+    metrics = InMemoryMetrics()
+    app = MessageBoards(metrics=metrics)
+    author_id = uuid4()
+    board_id = app.create_message_board("Hot board", author_id, partitions)
+    # Learn the number of partitions before the writers start
+    app.post_message(board_id, "first", None, author_id)
+    message_ids: List[int] = []
+
+    def write() -> None:
+        for _ in range(POSTS_PER_WRITER):
+            message_ids.append(
+                app.post_message(board_id, "message text", None, author_id)
+            )
+
+    threads = [Thread(target=write) for _ in range(WRITERS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    posts = WRITERS * POSTS_PER_WRITER
+    assert len(set(message_ids)) == posts
+    conflicts = metrics.counter("messageboard_command_conflicts_total")
+    return posts / elapsed, conflicts / posts
+
+
+def main() -> None:
+    for key, value in DEFAULT_SETTINGS.items():
+        os.environ.setdefault(key, value)
+    print(f"{WRITERS} writers posting {POSTS_PER_WRITER} messages each to one board")
+    print(f"{'partitions':>10} {'posts/s':>10} {'speedup':>8} {'conflicts/post':>15}")
+    baseline = None
+    for partitions in PARTITIONS:
+        rate, conflicts = run(partitions)
+        if baseline is None:
+            baseline = rate
+        print(
+            f"{partitions:>10} {rate:>10,.0f} {rate / baseline:>7.2f}x "
+            f"{conflicts:>15.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
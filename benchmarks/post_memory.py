@@ -0,0 +1,137 @@
+"""
+Measures the memory used by PostRepository for a large number of posts,
+against the previous layout of one Post dataclass per message with a list
+of replies and a str for the text.
+
+Each layout is built in its own process, and the benchmark reports the
+growth of the process's resident memory, and the bytes per post. Posts go
+straight to the projection's batch path, without an event store.
+
+Run with ``python -m benchmarks.post_memory [--posts N]``
+"""
+
+import argparse
+import gc
+import multiprocessing
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from eventsourcing.persistence import Tracking
+from eventsourcing.system import ProcessEvent
+
+from messageboard.domain import FIRST_MESSAGE_ID, MessageBoard
+from messageboard.projections.posts_repo import PostRepository
+
+POSTS = 10_000_000
+POSTS_PER_BOARD = 10_000
+AUTHORS = 10_000
+BATCH_SIZE = 10_000
+REPLY_EVERY = 3
+
+
+@dataclass
+class ObjectPost:
+    test: str
+    author: UUID
+    published: bool
+    replies: List["ObjectPost"] = field(default_factory=list)
+
+
+def generate_events(posts: int) -> Iterator[List[MessageBoard.MessagePostedEvent]]:
+    """
+    Yields batches of posted events, with every third post a reply
+    """
+    authors = [uuid4() for _ in range(AUTHORS)]
+    timestamp = datetime.now(tz=timezone.utc)
+    batch = []
+    board_id = uuid4()
+    for i in range(posts):
+        message_id = i % POSTS_PER_BOARD + FIRST_MESSAGE_ID
+        if message_id == FIRST_MESSAGE_ID:
+            board_id = uuid4()
+        reply_to: Optional[int] = None
+        if message_id % REPLY_EVERY == 2:
+            reply_to = message_id - 1
+        batch.append(
+            MessageBoard.MessagePostedEvent(  # type: ignore
+                originator_id=board_id,
+                originator_version=message_id + 3,
+                timestamp=timestamp,
+                message_id=message_id,
+                text=f"Message {i} posted to the board by author {i % AUTHORS}",
+                reply_to=reply_to,
+                author_id=authors[i % AUTHORS],
+                requires_moderation=False,
+            )
+        )
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_compact(posts: int) -> object:
+    repo = PostRepository()
+    process_event = ProcessEvent(Tracking("MessageBoards", 0))
+    for batch in generate_events(posts):
+        repo.process_batch(batch, process_event)  # type: ignore
+    return repo
+
+
+def build_objects(posts: int) -> object:
+    posts_by_board: Dict[UUID, Dict[int, ObjectPost]] = {}
+    for batch in generate_events(posts):
+        for event in batch:
+            post = ObjectPost(event.text, event.author_id, True)
+            board_posts = posts_by_board.setdefault(event.originator_id, {})
+            board_posts[event.message_id] = post
+            if event.reply_to is not None:
+                board_posts[event.reply_to].replies.append(post)
+    return posts_by_board
+
+
+def resident_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def measure(
+    build: Callable[[int], object],
+    posts: int,
+    results: "multiprocessing.Queue[Tuple[int, float]]",
+) -> None:
+    gc.collect()
+    before = resident_bytes()
+    start = time.perf_counter()
+    built = build(posts)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    results.put((resident_bytes() - before, elapsed))
+    del built
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=POSTS)
+    posts = parser.parse_args().posts
+    print(f"{posts} posts on {max(1, posts // POSTS_PER_BOARD)} boards")
+    print(f"{'layout':<8} {'MiB':>10} {'bytes/post':>11} {'seconds':>9}")
+    for name, build in (("compact", build_compact), ("objects", build_objects)):
+        results: "multiprocessing.Queue[Tuple[int, float]]" = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure, args=(build, posts, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"{name:<8} failed with exit code {process.exitcode}")
+            continue
+        used, elapsed = results.get()
+        print(f"{name:<8} {used / 2**20:>10.0f} {used / posts:>11.1f} {elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Measures how fast the projections catch up with an existing notification
+log, processing one event at a time and in batches of several sizes, with
+the projection's tracking records kept in memory and in SQLite.
+
+Run with ``python -m benchmarks.projection_batches``
+"""
+
+import os
+import tempfile
+import time
+from typing import List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from messageboard.application import MessageBoards
+from messageboard.projections.posts_by_user_index import PostsByUserIndex
+from messageboard.projections.posts_repo import PostRepository
+
+BOARDS = 50
+POSTS_PER_BOARD = 400
+MODERATED_EVERY = 10
+BATCH_SIZES = (1, 10, 100, 1_000)
+
+
+def populate() -> MessageBoards:
+    """
+    Post to each board, with a reply to every other post and every tenth
+    post from a moderated user approved
+    """
+    app = MessageBoards()
+    admin_id = uuid4()
+    author_id = uuid4()
+    moderated_author_id = uuid4()
+    for i in range(BOARDS):
+        board_id = app.create_message_board(f"Board {i}", admin_id)
+        app.moderate_user(board_id, moderated_author_id, admin_id)
+        posts: List[Tuple[str, Optional[int], UUID]] = []
+        for j in range(POSTS_PER_BOARD):
+            if j % MODERATED_EVERY == 0:
+                posts.append(("message text", None, moderated_author_id))
+            else:
+                reply_to = j - 1 if j % 2 and (j - 1) % MODERATED_EVERY else None
+                posts.append(("message text", reply_to, author_id))
+        app.post_messages(board_id, posts)
+        app.approve_messages(
+            board_id, list(range(0, POSTS_PER_BOARD, MODERATED_EVERY)), admin_id
+        )
+    return app
+
+
+def main() -> None:
+    app = populate()
+    events = app.recorder.max_notification_id()
+    print(f"{events} notifications")
+    print(f"{'projection':<18} {'store':<8} {'batch':>6} {'events/s':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for store in ("memory", "sqlite"):
+            for projection_cls in (PostRepository, PostsByUserIndex):
+                name = projection_cls.__name__
+                for batch_size in BATCH_SIZES:
+                    os.environ["PROCESSING_BATCH_SIZE"] = str(batch_size)
+                    if store == "sqlite":
+                        prefix = name.upper()
+                        os.environ[f"{prefix}_INFRASTRUCTURE_FACTORY"] = (
+                            "eventsourcing.sqlite:Factory"
+                        )
+                        os.environ[f"{prefix}_SQLITE_DBNAME"] = os.path.join(
+                            directory, f"{name}-{batch_size}.db"
+                        )
+                    projection = projection_cls()
+                    projection.follow(MessageBoards.__name__, app.log, catch_up=False)
+                    start = time.perf_counter()
+                    projection.pull_and_process(MessageBoards.__name__)
+                    rate = events / (time.perf_counter() - start)
+                    print(f"{name:<18} {store:<8} {batch_size:>6} {rate:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures hot reads of rendered posts from PostRepository with and without a
+query cache. Reads pick threads with a skewed distribution, so most reads
+are of a few hot threads, and a post is approved every ``WRITE_EVERY``
+reads, which invalidates the rendered thread it is in.
+
+Run with ``python -m benchmarks.query_cache``
+"""
+
+import random
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from eventsourcing.domain import AggregateEvent
+from eventsourcing.persistence import Tracking
+from eventsourcing.system import ProcessEvent
+
+from messageboard.domain import FIRST_MESSAGE_ID, MessageBoard
+from messageboard.projections.posts_repo import PostRepository
+
+THREADS = 1_000
+REPLIES_PER_THREAD = 20
+READS = 100_000
+WRITE_EVERY = (None, 1_000, 100)
+CACHE_MAXSIZE = "100"
+
+
+def board_events() -> Tuple[UUID, List[AggregateEvent]]:
+    """
+    Events for a board of threads, where every reply awaits moderation
+    """
+    board_id = uuid4()
+    author_id = uuid4()
+    timestamp = datetime.now(tz=timezone.utc)
+    events: List[AggregateEvent] = []
+    message_id = FIRST_MESSAGE_ID
+    for _ in range(THREADS):
+        root_id = message_id
+        for i in range(REPLIES_PER_THREAD + 1):
+            events.append(
+                MessageBoard.MessagePostedEvent(  # type: ignore
+                    originator_id=board_id,
+                    originator_version=message_id + 3,
+                    timestamp=timestamp,
+                    message_id=message_id,
+                    text="message text",
+                    reply_to=root_id if i else None,
+                    author_id=author_id,
+                    requires_moderation=bool(i),
+                )
+            )
+            message_id += 1
+    return board_id, events
+
+
+def run(cache_maxsize: Optional[str], write_every: Optional[int]) -> float:
+    """
+    Returns the reads per second of rendered threads
+    """
+    board_id, events = board_events()
+    env = {}
+    if cache_maxsize is not None:
+        env[PostRepository.QUERY_CACHE_MAXSIZE] = cache_maxsize
+    posts_repo = PostRepository(env=env)
+    process_event = ProcessEvent(Tracking("MessageBoards", 0))
+    posts_repo.process_batch(events, process_event)
+    rng = random.Random(0)
+    thread_size = REPLIES_PER_THREAD + 1
+    threads = [min(int(rng.paretovariate(1.2)) - 1, THREADS - 1) for _ in range(READS)]
+    approvals = iter(rng.sample(range(THREADS * thread_size), THREADS * thread_size))
+    version = len(events) + 3
+    start = time.perf_counter()
+    for i, thread in enumerate(threads):
+        if write_every and i % write_every == 0:
+            message_id = next(approvals)
+            version += 1
+            posts_repo.policy(
+                MessageBoard.MessageApprovedEvent(  # type: ignore
+                    originator_id=board_id,
+                    originator_version=version,
+                    timestamp=datetime.now(tz=timezone.utc),
+                    message_id=message_id,
+                ),
+                process_event,
+            )
+        posts_repo.get_rendered_post(board_id, FIRST_MESSAGE_ID + thread * thread_size)
+    return READS / (time.perf_counter() - start)
+
+
+def main() -> None:
+    print(f"{READS:,} reads of threads of {REPLIES_PER_THREAD} replies")
+    print(f"{'approve every':>13} {'uncached/s':>11} {'cached/s':>10} {'speedup':>8}")
+    for write_every in WRITE_EVERY:
+        uncached = run(None, write_every)
+        cached = run(CACHE_MAXSIZE, write_every)
+        print(
+            f"{write_every or 'never':>13} {uncached:>11,.0f} {cached:>10,.0f} "
+            f"{cached / uncached:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compares the latency of posting a message through the message board system
+run by the library's single threaded runner, where each command waits for
+the projections to process it, and by the threaded runner, where it doesn't.
+Boards are cached, so commands cost about as much as processing them.
+
+Run with ``python -m benchmarks.runner_latency``
+"""
+
+import os
+import time
+from typing import Callable, List
+from uuid import uuid4
+
+from eventsourcing.system import Runner, SingleThreadedRunner
+
+from messageboard.application import MessageBoards
+from messageboard.projections.posts_by_user_index import PostsByUserIndex
+from messageboard.projections.posts_repo import PostRepository
+from messageboard.system import MESSAGE_BOARDS_SYSTEM, ThreadedRunner
+
+POSTS = 5_000
+BOARDS = 50
+RUNNERS: List[Callable[[], Runner]] = [
+    lambda: SingleThreadedRunner(MESSAGE_BOARDS_SYSTEM),
+    lambda: ThreadedRunner(MESSAGE_BOARDS_SYSTEM),
+]
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    return sorted(latencies)[int(len(latencies) * fraction)]
+
+
+def main() -> None:
+    os.environ["AGGREGATE_CACHE_MAXSIZE"] = str(BOARDS)
+    print(
+        f"{'runner':<22} {'p50 (us)':>10} {'p99 (us)':>10} "
+        f"{'posts/s':>10} {'caught up (s)':>14}"
+    )
+    for construct_runner in RUNNERS:
+        runner = construct_runner()
+        runner.start()
+        app = runner.get(MessageBoards)
+        admin_id = uuid4()
+        board_ids = [
+            app.create_message_board(f"Board {i}", admin_id) for i in range(BOARDS)
+        ]
+        latencies = []
+        start = time.perf_counter()
+        for i in range(POSTS):
+            command_start = time.perf_counter()
+            app.post_message(board_ids[i % BOARDS], "hello", None, admin_id)
+            latencies.append(time.perf_counter() - command_start)
+        posted = time.perf_counter()
+        if isinstance(runner, ThreadedRunner):
+            runner.wait_for(PostRepository)
+            runner.wait_for(PostsByUserIndex)
+        caught_up = time.perf_counter()
+        runner.stop()
+        print(
+            f"{runner.__class__.__name__:<22} "
+            f"{percentile(latencies, 0.5) * 1e6:>10.0f} "
+            f"{percentile(latencies, 0.99) * 1e6:>10.0f} "
+            f"{POSTS / (posted - start):>10,.0f} {caught_up - posted:>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
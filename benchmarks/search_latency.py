@@ -0,0 +1,133 @@
+"""
+Measures the latency of ranked queries on the search index, for words of
+different frequencies, for a two word query, and for a query filtered to
+one board. The words of the posts are drawn from a Zipf distribution over
+the vocabulary, so the commonest word is in most posts. The time to build
+the index, and to restore it from a checkpoint, is also reported.
+
+Run with ``python -m benchmarks.search_latency``
+"""
+
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+from itertools import accumulate
+from typing import Callable, Dict, List, Tuple
+from uuid import UUID, uuid4
+
+from eventsourcing.domain import AggregateEvent
+from eventsourcing.persistence import Tracking
+from eventsourcing.system import ProcessEvent
+
+from messageboard.domain import FIRST_MESSAGE_ID, MessageBoard
+from messageboard.projections.search_index import SearchIndex
+
+POST_COUNTS = (1_000_000, 3_000_000)
+BOARD_COUNT = 100
+VOCABULARY_SIZE = 50_000
+# The number of words in a post is drawn uniformly from this range
+WORDS_PER_POST = (4, 30)
+CHUNK_SIZE = 10_000
+REPEATS = 20
+
+# Queries by name, given as the frequency ranks of their words
+QUERIES: Dict[str, Tuple[int, ...]] = {
+    "rare word": (20_000,),
+    "medium word": (500,),
+    "common word": (10,),
+    "commonest word": (0,),
+    "two words": (10, 500),
+}
+
+
+def word(rank: int) -> str:
+    return f"w{rank}"
+
+
+def build(post_count: int) -> Tuple[SearchIndex, List[UUID], float]:
+    rng = random.Random(post_count)
+    words = [word(rank) for rank in range(VOCABULARY_SIZE)]
+    cum_weights = list(accumulate(1 / (rank + 1) for rank in range(VOCABULARY_SIZE)))
+    board_ids = [uuid4() for _ in range(BOARD_COUNT)]
+    next_message_ids = dict.fromkeys(board_ids, FIRST_MESSAGE_ID)
+    author_id = uuid4()
+    timestamp = datetime.now(tz=timezone.utc)
+    process_event = ProcessEvent(Tracking("MessageBoards", 0))
+    index = SearchIndex()
+    elapsed = 0.0
+    for chunk_start in range(0, post_count, CHUNK_SIZE):
+        events: List[AggregateEvent] = []
+        for _ in range(min(CHUNK_SIZE, post_count - chunk_start)):
+            board_id = rng.choice(board_ids)
+            message_id = next_message_ids[board_id]
+            next_message_ids[board_id] += 1
+            text = " ".join(
+                rng.choices(
+                    words,
+                    cum_weights=cum_weights,
+                    k=rng.randint(*WORDS_PER_POST),
+                )
+            )
+            events.append(
+                MessageBoard.MessagePostedEvent(  # type: ignore
+                    originator_id=board_id,
+                    originator_version=message_id + 2,
+                    timestamp=timestamp,
+                    message_id=message_id,
+                    text=text,
+                    reply_to=None,
+                    author_id=author_id,
+                    requires_moderation=False,
+                )
+            )
+        start = time.perf_counter()
+        index.process_batch(events, process_event)
+        elapsed += time.perf_counter() - start
+    return index, board_ids, elapsed
+
+
+def latencies(function: Callable[[], object]) -> Tuple[float, float]:
+    """
+    Returns the median and worst time of a function, in milliseconds
+    """
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), max(times)
+
+
+def main() -> None:
+    for post_count in POST_COUNTS:
+        index, board_ids, build_time = build(post_count)
+        start = time.perf_counter()
+        data = index.mapper.transcoder.encode(index.get_state())
+        save_time = time.perf_counter() - start
+        start = time.perf_counter()
+        SearchIndex().set_state(index.mapper.transcoder.decode(data))
+        restore_time = time.perf_counter() - start
+        print(
+            f"{post_count:,} posts: build {build_time:.1f}s, "
+            f"checkpoint {len(data) / 2 ** 20:.0f} MiB "
+            f"saved in {save_time:.1f}s and restored in {restore_time:.1f}s"
+        )
+        print(
+            f"{'query':>16} {'matches':>9} {'all boards p50/max (ms)':>24} "
+            f"{'one board p50/max (ms)':>23}"
+        )
+        for name, ranks in QUERIES.items():
+            query = " ".join(word(rank) for rank in ranks)
+            matches = sum(len(index._terms[word(rank)]) for rank in ranks)
+            all_p50, all_max = latencies(lambda: index.search(query))
+            one_p50, one_max = latencies(lambda: index.search(query, board_ids[0]))
+            print(
+                f"{name:>16} {matches:>9} {all_p50:>13.2f} / {all_max:>8.2f} "
+                f"{one_p50:>12.2f} / {one_max:>8.2f}"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Measures how long it takes to load a message board as its history grows,
+with and without snapshotting.
+
+Run with ``python -m benchmarks.snapshot_load``
+"""
+
+import time
+from typing import Optional
+from uuid import UUID, uuid4
+
+from messageboard.application import MessageBoards
+from messageboard.domain import MessageBoard
+
+HISTORY_LENGTHS = (1_000, 10_000, 100_000)
+SNAPSHOTTING_INTERVAL = 100
+LOADS = 20
+TAIL_LENGTH = SNAPSHOTTING_INTERVAL // 2
+SAVE_BATCH_SIZE = 1_000
+
+
+def build_board(app: MessageBoards, history_length: int) -> UUID:
+    """
+    Build a board with the given number of posted messages, saving in batches
+    rather than one command at a time so the setup stays fast
+    """
+    author_id = uuid4()
+    board = MessageBoard.create("Benchmark board", author_id)
+    app.save(board)
+    for i in range(history_length):
+        board.post_message("message text", None, author_id)
+        if i % SAVE_BATCH_SIZE == SAVE_BATCH_SIZE - 1:
+            app.save(board)
+    app.save(board)
+    return board.id
+
+
+def time_load(app: MessageBoards, board_id: UUID) -> float:
+    start = time.perf_counter()
+    for _ in range(LOADS):
+        app.repository.get(board_id)
+    return (time.perf_counter() - start) / LOADS
+
+
+def main() -> None:
+    print(f"{'events':>10} {'interval':>10} {'load (ms)':>12}")
+    for history_length in HISTORY_LENGTHS:
+        interval: Optional[int]
+        for interval in (None, SNAPSHOTTING_INTERVAL):
+            app = MessageBoards(snapshotting_interval=interval)
+            board_id = build_board(app, history_length)
+            # Leave a tail of events after the latest snapshot, as there
+            # would be between snapshots in steady state
+            board = app.repository.get(board_id)
+            for _ in range(TAIL_LENGTH):
+                board.post_message("message text", None, uuid4())
+            app.save(board)
+            load_time = time_load(app, board_id)
+            print(f"{history_length:>10} {str(interval):>10} {load_time * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Runs a synthetic workload (see :mod:`benchmarks.workload`) and reports:
+
+- the p50 and p99 latency of each kind of command
+- the events per second processed by each projection catching up with the
+  notification log the workload recorded
+- the time to load a board against the length of its history
+- the peak memory allocated by running the commands and each projection
+
+The applications are set up by the environment, as usual, so the same suite
+measures any persistence mode or cache settings. Boards are snapshotted
+every ``SNAPSHOTTING_INTERVAL`` events, 100 unless it is set, as otherwise
+commands against hot boards replay their whole history. With ``--json`` the results
+are also written to a file, and with ``--baseline`` they are compared with
+the results of an earlier run.
+
+Run with ``python -m benchmarks.suite [--scale 0.1] [--json results.json]``
+"""
+
+import argparse
+import json
+import os
+import resource
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Tuple
+from uuid import uuid4
+
+from benchmarks.workload import Command, Workload, WorkloadRunner, generate
+from messageboard.application import MessageBoards
+from messageboard.projections.rebuild import PROJECTIONS
+
+HISTORY_LENGTHS = (100, 1_000, 10_000)
+LOAD_REPEATS = 5
+POSTS_PER_BATCH = 100
+DEFAULT_SETTINGS = {MessageBoards.SNAPSHOTTING_INTERVAL: "100"}
+# Settings recorded with the results, so runs can be told apart
+SETTINGS = (
+    "PERSISTENCE_MODE",
+    "INFRASTRUCTURE_FACTORY",
+    MessageBoards.SNAPSHOTTING_INTERVAL,
+    MessageBoards.AGGREGATE_CACHE_MAXSIZE,
+    MessageBoards.COMPACT_EVENTS,
+    "SQLITE_SYNCHRONOUS",
+    "PROCESSING_BATCH_SIZE",
+)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run_commands(commands: List[Command], workload: Workload) -> Dict[str, Any]:
+    app = MessageBoards()
+    runner = WorkloadRunner(app, workload)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    start = time.perf_counter()
+    for command in commands:
+        command_start = time.perf_counter()
+        runner.run(command)
+        latencies[command.kind].append(time.perf_counter() - command_start)
+    elapsed = time.perf_counter() - start
+    latencies["all"] = [t for times in latencies.values() for t in times]
+    results: Dict[str, Any] = {
+        kind: {
+            "count": len(times),
+            "p50_us": percentile(times, 0.5) * 1e6,
+            "p99_us": percentile(times, 0.99) * 1e6,
+        }
+        for kind, times in latencies.items()
+    }
+    results["all"]["events_per_sec"] = app.recorder.max_notification_id() / elapsed
+    return {"app": app, "commands": results}
+
+
+def catch_up(app: MessageBoards) -> Iterator[Tuple[str, float]]:
+    """
+    Catches up a new instance of each projection with the application's
+    notification log, and yields the number of events it processed per second
+    """
+    notifications = app.recorder.max_notification_id()
+    for name, projection_cls in PROJECTIONS.items():
+        projection = projection_cls()
+        projection.follow(MessageBoards.__name__, app.log, catch_up=False)
+        start = time.perf_counter()
+        projection.pull_and_process(MessageBoards.__name__)
+        yield name, notifications / (time.perf_counter() - start)
+
+
+def measure_load_times() -> Dict[str, float]:
+    """
+    Returns the best time in milliseconds to load a board with each length
+    of history
+    """
+    app = MessageBoards()
+    author_id = uuid4()
+    results = {}
+    for length in HISTORY_LENGTHS:
+        board_id = app.create_message_board("Board", author_id)
+        for _ in range(length // POSTS_PER_BATCH):
+            app.post_messages(
+                board_id, [("message text", None, author_id)] * POSTS_PER_BATCH
+            )
+        times = []
+        for _ in range(LOAD_REPEATS):
+            start = time.perf_counter()
+            app.repository.get(board_id)
+            times.append(time.perf_counter() - start)
+        results[str(length)] = min(times) * 1e3
+    return results
+
+
+def measure_peak_memory(
+    commands: List[Command], workload: Workload
+) -> Dict[str, float]:
+    """
+    Runs the workload again with memory allocations traced, which is too
+    slow to do while it is timed, and returns the peak memory in megabytes
+    allocated by running the commands and by catching up each projection
+    """
+    results = {}
+    tracemalloc.start()
+    try:
+        app = run_commands(commands, workload)["app"]
+        results["commands"] = tracemalloc.get_traced_memory()[1] / 2**20
+        for name, projection_cls in PROJECTIONS.items():
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            projection = projection_cls()
+            projection.follow(MessageBoards.__name__, app.log, catch_up=False)
+            projection.pull_and_process(MessageBoards.__name__)
+            results[name] = (tracemalloc.get_traced_memory()[1] - current) / 2**20
+            del projection
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def print_comparison(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    current = flatten(results)
+    previous = flatten(baseline)
+    print()
+    print(f"{'metric':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for key, value in current.items():
+        if key.startswith(("workload.", "settings.")) or key not in previous:
+            continue
+        change = (value / previous[key] - 1) * 100 if previous[key] else 0.0
+        print(f"{key:<40} {previous[key]:>12.1f} {value:>12.1f} {change:>+7.1f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--json", help="File to write the results to")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare")
+    args = parser.parse_args()
+    for key, value in DEFAULT_SETTINGS.items():
+        os.environ.setdefault(key, value)
+
+    workload = Workload().scaled(args.scale)
+    commands = list(generate(workload))
+    measured = run_commands(commands, workload)
+    results: Dict[str, Any] = {
+        "workload": workload._asdict(),
+        "settings": {key: os.environ[key] for key in SETTINGS if key in os.environ},
+        "commands": measured["commands"],
+        "projections_events_per_sec": dict(catch_up(measured["app"])),
+        "load_ms": measure_load_times(),
+    }
+    del measured
+    results["peak_memory_mb"] = measure_peak_memory(commands, workload)
+    # Kilobytes on Linux
+    results["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+    print(f"{'command':<12} {'count':>8} {'p50 (us)':>10} {'p99 (us)':>10}")
+    for kind, stats in results["commands"].items():
+        print(
+            f"{kind:<12} {stats['count']:>8} {stats['p50_us']:>10.0f} "
+            f"{stats['p99_us']:>10.0f}"
+        )
+    print(f"events/s recorded: {results['commands']['all']['events_per_sec']:,.0f}")
+    print()
+    print(f"{'projection':<20} {'events/s':>12} {'peak (MB)':>10}")
+    for name, rate in results["projections_events_per_sec"].items():
+        print(f"{name:<20} {rate:>12,.0f} {results['peak_memory_mb'][name]:>10.1f}")
+    print()
+    print(f"{'history':>8} {'load (ms)':>10}")
+    for length, load_time in results["load_ms"].items():
+        print(f"{length:>8} {load_time:>10.2f}")
+    print()
+    print(
+        f"peak memory running commands: {results['peak_memory_mb']['commands']:.1f} MB"
+    )
+    print(f"max RSS: {results['max_rss_mb']:.0f} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
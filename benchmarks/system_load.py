@@ -0,0 +1,101 @@
+"""
+Compares the throughput of the whole System, with MessageBoards followed by
+PostRepository and PostsByUserIndex, between persistence modes. Posts are
+written in batches and every batch is processed by the projections before
+the next one is written, as the single threaded runner does.
+
+Run with ``python -m benchmarks.system_load``
+"""
+
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from eventsourcing.system import SingleThreadedRunner, System
+
+from messageboard.application import MessageBoards
+from messageboard.projections.posts_by_user_index import PostsByUserIndex
+from messageboard.projections.posts_repo import PostRepository
+
+BOARDS = 10
+BATCHES_PER_BOARD = 50
+POSTS_PER_BATCH = 10
+MODES: Dict[str, Dict[str, str]] = {
+    "memory": {"PERSISTENCE_MODE": "memory"},
+    "sqlite": {"PERSISTENCE_MODE": "sqlite"},
+    "sqlite normal": {"PERSISTENCE_MODE": "sqlite", "SQLITE_SYNCHRONOUS": "normal"},
+    "sqlite normal s100": {
+        "PERSISTENCE_MODE": "sqlite",
+        "SQLITE_SYNCHRONOUS": "normal",
+        "NOTIFICATION_SECTION_SIZE": "100",
+    },
+}
+
+
+def run() -> float:
+    """
+    Returns the number of posts per second written and processed
+    """
+    system = System(
+        pipes=[[MessageBoards, PostRepository], [MessageBoards, PostsByUserIndex]]
+    )
+    runner = SingleThreadedRunner(system)
+    runner.start()
+    try:
+        app = runner.get(MessageBoards)
+        rng = random.Random(0)
+        admin_id = uuid4()
+        author_ids = [uuid4() for _ in range(100)]
+        board_ids = [
+            app.create_message_board(f"Board {i}", admin_id) for i in range(BOARDS)
+        ]
+        start = time.perf_counter()
+        for _ in range(BATCHES_PER_BOARD):
+            for board_id in board_ids:
+                app.post_messages(
+                    board_id,
+                    [
+                        ("hello " * rng.randint(1, 20), None, rng.choice(author_ids))
+                        for _ in range(POSTS_PER_BATCH)
+                    ],
+                )
+        elapsed = time.perf_counter() - start
+        users = runner.get(PostsByUserIndex)
+        assert (
+            sum(
+                len(users.get_posts_for_user(author_id).posts)
+                for author_id in author_ids
+            )
+            == BOARDS * BATCHES_PER_BOARD * POSTS_PER_BATCH
+        )
+    finally:
+        runner.stop()
+    return BOARDS * BATCHES_PER_BOARD * POSTS_PER_BATCH / elapsed
+
+
+def main() -> None:
+    print(f"{'mode':<20} {'posts/s':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for i, (name, env) in enumerate(MODES.items()):
+            # The runner constructs the applications, so they are set up
+            # by the environment
+            env = dict(env, SQLITE_DBNAME=os.path.join(directory, f"{i}.db"))
+            previous: List[Tuple[str, Optional[str]]] = [
+                (key, os.environ.get(key)) for key in env
+            ]
+            os.environ.update(env)
+            try:
+                print(f"{name:<20} {run():>10,.0f}")
+            finally:
+                for key, value in previous:
+                    if value is None:
+                        del os.environ[key]
+                    else:
+                        os.environ[key] = value
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Measures the time to render one page of a large thread from the thread
+index, against walking the thread's replies in PostRepository and slicing
+the page out of the walk. The index is measured for the first and the last
+page of the thread, and the time to build the index is also reported.
+
+Run with ``python -m benchmarks.thread_pages``
+"""
+
+import random
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+from uuid import uuid4
+
+from eventsourcing.domain import AggregateEvent
+from eventsourcing.persistence import Tracking
+from eventsourcing.system import ProcessEvent
+
+from messageboard.domain import FIRST_MESSAGE_ID, MessageBoard
+from messageboard.projections.posts_repo import Post, PostRepository
+from messageboard.projections.thread_index import ThreadIndex
+
+THREAD_SIZES = (1_000, 10_000, 100_000)
+PAGE_SIZE = 50
+REPEATS = 20
+
+
+def thread_events(size: int) -> List[AggregateEvent]:
+    """
+    Events for a thread where every post replies to a random earlier post
+    """
+    rng = random.Random(size)
+    board_id = uuid4()
+    author_id = uuid4()
+    timestamp = datetime.now(tz=timezone.utc)
+    events: List[AggregateEvent] = []
+    for i in range(size):
+        reply_to: Optional[int] = None
+        if i:
+            reply_to = FIRST_MESSAGE_ID + rng.randrange(i)
+        events.append(
+            MessageBoard.MessagePostedEvent(  # type: ignore
+                originator_id=board_id,
+                originator_version=i + 3,
+                timestamp=timestamp,
+                message_id=FIRST_MESSAGE_ID + i,
+                text="message text",
+                reply_to=reply_to,
+                author_id=author_id,
+                requires_moderation=False,
+            )
+        )
+    return events
+
+
+def walk(root: Post) -> List[int]:
+    """
+    Walks the thread in pre-order with an explicit stack, since deep threads
+    exceed the recursion limit
+    """
+    posts = []
+    stack = [root]
+    while stack:
+        post = stack.pop()
+        posts.append(post.message_id)
+        stack.extend(reversed(post.replies))
+    return posts
+
+
+def timed(function: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        function()
+    return (time.perf_counter() - start) / REPEATS
+
+
+def main() -> None:
+    print(
+        f"{'posts':>8} {'index first (ms)':>17} {'index last (ms)':>16} "
+        f"{'walk (ms)':>10} {'index build (s)':>16}"
+    )
+    for size in THREAD_SIZES:
+        events = thread_events(size)
+        board_id = events[0].originator_id
+        process_event = ProcessEvent(Tracking("MessageBoards", 0))
+        thread_index = ThreadIndex()
+        start = time.perf_counter()
+        thread_index.process_batch(events, process_event)
+        build = time.perf_counter() - start
+        posts_repo = PostRepository()
+        posts_repo.process_batch(events, process_event)
+        root = posts_repo.get_post(board_id, FIRST_MESSAGE_ID)
+        assert root is not None
+
+        def walk_page() -> List[int]:
+            return walk(root)[-PAGE_SIZE:]  # type: ignore
+
+        first = timed(
+            lambda: thread_index.get_thread(board_id, FIRST_MESSAGE_ID, limit=PAGE_SIZE)
+        )
+        last = timed(
+            lambda: thread_index.get_thread(
+                board_id, FIRST_MESSAGE_ID, size - PAGE_SIZE, PAGE_SIZE
+            )
+        )
+        walked = timed(walk_page)
+        print(
+            f"{size:>8} {first * 1000:>17.3f} {last * 1000:>16.3f} "
+            f"{walked * 1000:>10.1f} {build:>16.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Generates synthetic message board workloads: many boards, with a share of
+the posts going to a few hot boards, replies that form chains, and
+moderated users whose posts are later approved or rejected.
+
+The workload is generated before it is run, so generating it isn't timed.
+Message IDs are predicted from the order of the posts to each board.
+"""
+
+import random
+from typing import Iterator, List, NamedTuple, Optional
+from uuid import UUID, uuid4
+
+from messageboard.application import MessageBoards
+from messageboard.domain import FIRST_MESSAGE_ID
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while message boards fill up "
+    "with replies about event sourcing projections snapshots and caches"
+).split()
+
+
+class Workload(NamedTuple):
+    boards: int = 100
+    posts: int = 20_000
+    users: int = 500
+    # The share of posts that go to the hot boards
+    hot_boards: int = 5
+    hot_share: float = 0.5
+    # Replies mostly continue the latest chain on a board
+    reply_share: float = 0.6
+    chain_share: float = 0.7
+    # Moderated users are moderated on every board
+    moderated_users: int = 25
+    approve_share: float = 0.8
+    seed: int = 0
+
+    def scaled(self, scale: float) -> "Workload":
+        return self._replace(
+            boards=max(1, int(self.boards * scale)),
+            posts=max(1, int(self.posts * scale)),
+            hot_boards=max(1, int(self.hot_boards * scale)),
+        )
+
+
+class Command(NamedTuple):
+    """
+    A command against the board with the given index. ``message_id`` is the
+    message replied to, approved or rejected.
+    """
+
+    kind: str
+    board: int
+    user: int = 0
+    message_id: Optional[int] = None
+    text: str = ""
+
+
+def generate(workload: Workload) -> Iterator[Command]:
+    """
+    Yields the commands of a workload: creating the boards and moderating
+    the moderated users on each, and then the posts, each moderated post
+    followed by its approval or rejection a few commands later
+    """
+    rng = random.Random(workload.seed)
+    for board in range(workload.boards):
+        yield Command("create", board)
+        for user in range(workload.moderated_users):
+            yield Command("moderate", board, user)
+    next_message_ids = [FIRST_MESSAGE_ID] * workload.boards
+    # Replies can only be made to published messages
+    published: List[List[int]] = [[] for _ in range(workload.boards)]
+    chain_ends: List[Optional[int]] = [None] * workload.boards
+    awaiting_moderation: List[Command] = []
+    for _ in range(workload.posts):
+        if rng.random() < workload.hot_share:
+            board = rng.randrange(workload.hot_boards)
+        else:
+            board = rng.randrange(workload.boards)
+        message_id = next_message_ids[board]
+        next_message_ids[board] += 1
+        reply_to = None
+        if published[board] and rng.random() < workload.reply_share:
+            chain_end = chain_ends[board]
+            if chain_end is not None and rng.random() < workload.chain_share:
+                reply_to = chain_end
+            else:
+                reply_to = rng.choice(published[board])
+        user = rng.randrange(workload.users)
+        text = " ".join(rng.choices(WORDS, k=rng.randint(3, 40)))
+        yield Command("post", board, user, reply_to, text)
+        if user < workload.moderated_users:
+            kind = "approve" if rng.random() < workload.approve_share else "reject"
+            awaiting_moderation.append(Command(kind, board, 0, message_id))
+        else:
+            published[board].append(message_id)
+            chain_ends[board] = message_id
+        # Moderators catch up with a few posts' delay
+        if len(awaiting_moderation) > 3:
+            command = awaiting_moderation.pop(0)
+            if command.kind == "approve":
+                assert command.message_id is not None
+                published[command.board].append(command.message_id)
+            yield command
+    yield from awaiting_moderation
+
+
+class WorkloadRunner:
+    """
+    Runs the commands of a workload against an application
+    """
+
+    def __init__(self, app: MessageBoards, workload: Workload):
+        self.app = app
+        self.admin_id = uuid4()
+        self.user_ids = [uuid4() for _ in range(workload.users)]
+        self.board_ids: List[UUID] = []
+
+    def run(self, command: Command) -> None:
+        if command.kind == "post":
+            self.app.post_message(
+                self.board_ids[command.board],
+                command.text,
+                command.message_id,
+                self.user_ids[command.user],
+            )
+        elif command.kind == "approve":
+            assert command.message_id is not None
+            self.app.approve_message(
+                self.board_ids[command.board], command.message_id, self.admin_id
+            )
+        elif command.kind == "reject":
+            assert command.message_id is not None
+            self.app.reject_message(
+                self.board_ids[command.board], command.message_id, self.admin_id
+            )
+        elif command.kind == "moderate":
+            self.app.moderate_user(
+                self.board_ids[command.board],
+                self.user_ids[command.user],
+                self.admin_id,
+            )
+        elif command.kind == "create":
+            board_id = self.app.create_message_board(
+                f"Board {command.board}", self.admin_id
+            )
+            self.board_ids.append(board_id)
+        else:
+            raise ValueError(f"Unknown command {command.kind!r}")
@@ -1,42 +1,649 @@
-from typing import Optional
+import random
+import time
+from concurrent.futures import Future
+from itertools import count
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+    cast,
+)
 from uuid import UUID
 
-from eventsourcing.application import Application
+from eventsourcing.application import Application, LocalNotificationLog, Repository
+from eventsourcing.domain import Aggregate, AggregateEvent, Snapshot
+from eventsourcing.persistence import (
+    EventStore,
+    InfrastructureFactory,
+    Mapper,
+    RecordConflictError,
+    Transcoder,
+)
 
-from messageboard.domain import MessageBoard
+from messageboard.codec import CompactMapper
+from messageboard.command_queue import BoardCommandQueue, BoardKey, PendingCommand
+from messageboard.domain import (
+    BoardIsPartitionedError,
+    BoardPartition,
+    MessageBoard,
+    MessageNotFoundError,
+)
+from messageboard.metrics import CountingEventStore, Metrics, construct_metrics
+from messageboard.persistence import construct_factory
+from messageboard.repository import AggregateCache, CachingRepository
+from messageboard.transcodings import IntRangeSetAsList, SetAsList
+
+T = TypeVar("T")
+
+COMMAND_PHASE_SECONDS = "messageboard_command_phase_seconds"
+
+
+class PartitionGroup:
+    """
+    Partitions of a board that are loaded together, so that a command can
+    change several of them and they are saved together
+    """
+
+    def __init__(self, partitions: List[BoardPartition]):
+        self.partitions = partitions
+
+    @property
+    def pending_events(self) -> List[AggregateEvent]:
+        return [
+            event for partition in self.partitions for event in partition.pending_events
+        ]
 
 
 class MessageBoards(Application):
-    def create_message_board(self, name: str, created_by: UUID) -> UUID:
-        board = MessageBoard.create(name, created_by)
-        self.save(board)
+    """
+    Application service for message boards.
+
+    When a snapshotting interval is configured (either with the
+    constructor argument or the ``SNAPSHOTTING_INTERVAL`` environment
+    variable) a snapshot of each board is taken every time its
+    version passes a multiple of the interval, so loading a board only
+    replays the events recorded after its latest snapshot.
+
+    When an aggregate cache size is configured (either with the constructor
+    argument or the ``AGGREGATE_CACHE_MAXSIZE`` environment variable) the
+    most recently used boards are kept in memory, and loading a cached board
+    only fetches the events recorded after its cached version. Boards that
+    fail to save are evicted from the cache.
+
+    Commands that fail to save because another writer changed the board
+    first are retried against the reloaded board, up to ``max_retries``
+    times (the ``COMMAND_MAX_RETRIES`` environment variable). When command
+    combining is enabled (the ``COMBINE_COMMANDS`` environment variable),
+    commands submitted concurrently for the same board are queued and run
+    together with a single load and save.
+
+    Events are stored in a compact binary format (see
+    :class:`~messageboard.codec.CompactMapper`) unless the ``COMPACT_EVENTS``
+    environment variable is false, and events stored as JSON can always be
+    read. When ``COMPRESS_MESSAGE_TEXT`` is true, long message texts are
+    compressed with zlib.
+
+    Settings can also be given to the constructor as a mapping, which is
+    read before the environment. The store is picked by the
+    ``PERSISTENCE_MODE`` setting, and SQLite connections are pooled and set
+    up by the settings described in
+    :class:`~messageboard.persistence.SQLiteFactory`. Followers read the
+    notification log in sections of up to ``NOTIFICATION_SECTION_SIZE``
+    notifications.
+
+    When a metrics sink is given (either with the constructor argument or
+    the ``METRICS`` environment variable) each command records the time
+    spent loading the board, deciding and saving, and the number of events
+    replayed to load the board.
+
+    A board created with more than one partition has its posts spread over
+    its partitions in turn, from a random partition, so posts to the board
+    can be saved concurrently. Each partition gives out the message IDs of
+    its own range (see :class:`~messageboard.domain.BoardPartition`).
+    Approvals and rejections go to the partition of the message. The admins
+    and moderated users stay on the board, which is loaded before a
+    partition to check them, so a user flagged for moderation while a post
+    is being made may have that post published.
+    """
+
+    SNAPSHOTTING_INTERVAL = "SNAPSHOTTING_INTERVAL"
+    AGGREGATE_CACHE_MAXSIZE = "AGGREGATE_CACHE_MAXSIZE"
+    COMMAND_MAX_RETRIES = "COMMAND_MAX_RETRIES"
+    COMBINE_COMMANDS = "COMBINE_COMMANDS"
+    COMPACT_EVENTS = "COMPACT_EVENTS"
+    COMPRESS_MESSAGE_TEXT = "COMPRESS_MESSAGE_TEXT"
+    NOTIFICATION_SECTION_SIZE = "NOTIFICATION_SECTION_SIZE"
+    DEFAULT_MAX_RETRIES = 3
+    DEFAULT_NOTIFICATION_SECTION_SIZE = 10
+
+    def __init__(
+        self,
+        snapshotting_interval: Optional[int] = None,
+        aggregate_cache_maxsize: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        combine_commands: Optional[bool] = None,
+        env: Optional[Mapping[str, str]] = None,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.env = env
+        self._metrics = metrics
+        self._snapshotting_interval = snapshotting_interval
+        self._aggregate_cache_maxsize = aggregate_cache_maxsize
+        self.aggregate_cache: Optional[AggregateCache[MessageBoard]] = None
+        super().__init__()
+        if max_retries is None:
+            max_retries = int(
+                self.factory.getenv(self.COMMAND_MAX_RETRIES)
+                or self.DEFAULT_MAX_RETRIES
+            )
+        self.max_retries = max_retries
+        if combine_commands is None:
+            combine_commands = self._getenv_bool(self.COMBINE_COMMANDS, "no")
+        self.command_queue: Optional[BoardCommandQueue] = None
+        if combine_commands:
+            self.command_queue = BoardCommandQueue(self._execute_commands)
+        # The number of partitions of the partitioned boards seen so far,
+        # which never changes once a board is created
+        self._partitions: Dict[UUID, int] = {}
+        # The turns of the partitions of each partitioned board, which start
+        # at a random partition so processes don't all post to the same one
+        self._partition_turns: Dict[UUID, Iterator[int]] = {}
+
+    @property
+    def snapshotting_interval(self) -> Optional[int]:
+        if self._snapshotting_interval is None:
+            value = self.factory.getenv(self.SNAPSHOTTING_INTERVAL)
+            if value:
+                self._snapshotting_interval = int(value)
+        return self._snapshotting_interval
+
+    @property
+    def metrics(self) -> Metrics:
+        if self._metrics is None:
+            self._metrics = construct_metrics(self.factory)
+        return self._metrics
+
+    @property
+    def aggregate_cache_maxsize(self) -> Optional[int]:
+        if self._aggregate_cache_maxsize is None:
+            value = self.factory.getenv(self.AGGREGATE_CACHE_MAXSIZE)
+            if value:
+                self._aggregate_cache_maxsize = int(value)
+        return self._aggregate_cache_maxsize
+
+    def construct_factory(self) -> InfrastructureFactory:
+        return construct_factory(self.__class__.__name__, self.env)
+
+    def construct_mapper(self, application_name: str = "") -> Mapper:
+        mapper = super().construct_mapper(application_name)
+        return CompactMapper(
+            mapper.transcoder,
+            compressor=mapper.compressor,
+            cipher=mapper.cipher,
+            encode_binary=self._getenv_bool(self.COMPACT_EVENTS, "yes"),
+            compress_text=self._getenv_bool(self.COMPRESS_MESSAGE_TEXT, "no"),
+        )
+
+    def _getenv_bool(self, key: str, default: str) -> bool:
+        return (self.factory.getenv(key, default) or "").lower() in (
+            "y",
+            "yes",
+            "t",
+            "true",
+            "on",
+            "1",
+        )
+
+    def construct_notification_log(self) -> LocalNotificationLog:
+        section_size = int(
+            self.factory.getenv(self.NOTIFICATION_SECTION_SIZE)
+            or self.DEFAULT_NOTIFICATION_SECTION_SIZE
+        )
+        return LocalNotificationLog(self.recorder, section_size=section_size)
+
+    def construct_event_store(self) -> EventStore[AggregateEvent]:
+        if not self.metrics.enabled:
+            return super().construct_event_store()
+        return CountingEventStore(mapper=self.mapper, recorder=self.recorder)
+
+    def construct_snapshot_store(self) -> Optional[EventStore[Snapshot]]:
+        if self.snapshotting_interval is None:
+            return super().construct_snapshot_store()
+        recorder = self.factory.aggregate_recorder(purpose="snapshots")
+        return self.factory.event_store(mapper=self.mapper, recorder=recorder)
+
+    def construct_repository(self) -> Repository[MessageBoard]:
+        if self.aggregate_cache_maxsize is None:
+            return super().construct_repository()
+        self.aggregate_cache = AggregateCache(self.aggregate_cache_maxsize)
+        return CachingRepository(
+            event_store=self.events,
+            cache=self.aggregate_cache,
+            snapshot_store=self.snapshots,
+        )
+
+    def register_transcodings(self, transcoder: Transcoder) -> None:
+        super().register_transcodings(transcoder)
+        transcoder.register(SetAsList())
+        transcoder.register(IntRangeSetAsList())
+
+    def save(self, *aggregates: Aggregate) -> None:
+        previous_versions = [
+            aggregate.version - len(aggregate.pending_events)
+            for aggregate in aggregates
+        ]
+        try:
+            super().save(*aggregates)
+        except Exception:
+            if self.aggregate_cache is not None:
+                for aggregate in aggregates:
+                    self.aggregate_cache.evict(aggregate.id)
+            raise
+        if self.aggregate_cache is not None:
+            for aggregate in aggregates:
+                self.aggregate_cache.put(aggregate)
+        if self.snapshotting_interval:
+            for aggregate, previous_version in zip(aggregates, previous_versions):
+                if (
+                    aggregate.version // self.snapshotting_interval
+                    > previous_version // self.snapshotting_interval
+                ):
+                    self._put_snapshot(aggregate)
+
+    def _put_snapshot(self, aggregate: Aggregate) -> None:
+        """
+        Snapshot an aggregate that has just been saved, without reloading it
+        """
+        assert self.snapshots is not None
+        self.snapshots.put([Snapshot.take(aggregate)])
+
+    def create_message_board(
+        self, name: str, created_by: UUID, partitions: int = 1
+    ) -> UUID:
+        """
+        Create a board, and save it together with its partitions if it has
+        more than one
+        """
+        board = MessageBoard.create(name, created_by, partitions)
+        aggregates: List[Aggregate] = [board]
+        if partitions > 1:
+            aggregates += [
+                BoardPartition.create(board.id, index, partitions)
+                for index in range(partitions)
+            ]
+        self.save(*aggregates)
         return board.id
 
     def post_message(
         self, board_id: UUID, text: str, reply_to: Optional[int], author_id: UUID
     ) -> int:
-        board = self.repository.get(board_id)
-        message_id = board.post_message(text, reply_to, author_id)
-        self.save(board)
-        return message_id
+        return self._execute_on_board(
+            board_id,
+            lambda board: board.post_message(text, reply_to, author_id),
+            lambda partitions: self._post_to_partition(
+                board_id, partitions, [(text, reply_to, author_id)]
+            )[0],
+        )
+
+    def post_messages(
+        self,
+        board_id: UUID,
+        messages: Iterable[Tuple[str, Optional[int], UUID]],
+    ) -> List[int]:
+        """
+        Post several messages to a board and save them together
+
+        Messages can reply to messages earlier in the same batch. If any message
+        is invalid then none of the messages are posted. The messages posted to
+        a partitioned board all go to one partition, and get consecutive IDs.
+
+        :param board_id: The board ID
+        :param messages: (text, reply_to, author_id) tuples
+        :return: The message IDs, in the order the messages were given
+        """
+        messages = list(messages)
+        return self._execute_on_board(
+            board_id,
+            lambda board: [
+                board.post_message(text, reply_to, author_id)
+                for text, reply_to, author_id in messages
+            ],
+            lambda partitions: self._post_to_partition(board_id, partitions, messages),
+        )
 
     def moderate_user(
         self, board_id: UUID, user_id: UUID, acting_user_id: UUID
     ) -> None:
-        board = self.repository.get(board_id)
-        board.moderate_user(user_id, acting_user_id)
-        self.save(board)
+        self._execute(
+            board_id, lambda board: board.moderate_user(user_id, acting_user_id)
+        )
 
     def approve_message(
         self, board_id: UUID, message_id: int, approver_id: UUID
     ) -> None:
-        board = self.repository.get(board_id)
-        board.approve_message(message_id, approver_id)
-        self.save(board)
+        self._execute_on_board(
+            board_id,
+            lambda board: board.approve_message(message_id, approver_id),
+            lambda partitions: self._moderate_partitions(
+                board_id,
+                partitions,
+                [message_id],
+                lambda partition, board, message_id: partition.approve_message(
+                    board, message_id, approver_id
+                ),
+            ),
+        )
+
+    def approve_messages(
+        self, board_id: UUID, message_ids: Iterable[int], approver_id: UUID
+    ) -> None:
+        """
+        Approve several messages and save the approvals together. If any
+        message can't be approved then none of them are.
+        """
+        message_ids = list(message_ids)
+
+        def approve(board: MessageBoard) -> None:
+            for message_id in message_ids:
+                board.approve_message(message_id, approver_id)
+
+        self._execute_on_board(
+            board_id,
+            approve,
+            lambda partitions: self._moderate_partitions(
+                board_id,
+                partitions,
+                message_ids,
+                lambda partition, board, message_id: partition.approve_message(
+                    board, message_id, approver_id
+                ),
+            ),
+        )
 
     def reject_message(
         self, board_id: UUID, message_id: int, rejecter_id: UUID
     ) -> None:
+        self._execute_on_board(
+            board_id,
+            lambda board: board.reject_message(message_id, rejecter_id),
+            lambda partitions: self._moderate_partitions(
+                board_id,
+                partitions,
+                [message_id],
+                lambda partition, board, message_id: partition.reject_message(
+                    board, message_id, rejecter_id
+                ),
+            ),
+        )
+
+    def reject_messages(
+        self, board_id: UUID, message_ids: Iterable[int], rejecter_id: UUID
+    ) -> None:
+        """
+        Reject several messages and save the rejections together. If any
+        message can't be rejected then none of them are.
+        """
+        message_ids = list(message_ids)
+
+        def reject(board: MessageBoard) -> None:
+            for message_id in message_ids:
+                board.reject_message(message_id, rejecter_id)
+
+        self._execute_on_board(
+            board_id,
+            reject,
+            lambda partitions: self._moderate_partitions(
+                board_id,
+                partitions,
+                message_ids,
+                lambda partition, board, message_id: partition.reject_message(
+                    board, message_id, rejecter_id
+                ),
+            ),
+        )
+
+    def _execute_on_board(
+        self,
+        board_id: UUID,
+        command: Callable[[MessageBoard], T],
+        partitioned_command: Callable[[int], T],
+    ) -> T:
+        """
+        Run a command against a board, or if the board is partitioned, call
+        ``partitioned_command`` with its number of partitions instead
+        """
+        partitions = self._partitions.get(board_id)
+        if partitions is None:
+            try:
+                return self._execute(board_id, command)
+            except BoardIsPartitionedError as e:
+                partitions = self._partitions[board_id] = e.partitions
+        return partitioned_command(partitions)
+
+    def _get_partition(self, board_id: UUID, index: int) -> BoardPartition:
+        partition_id = BoardPartition.partition_id(board_id, index)
+        return cast(BoardPartition, self.repository.get(partition_id))
+
+    def _post_to_partition(
+        self,
+        board_id: UUID,
+        partitions: int,
+        messages: List[Tuple[str, Optional[int], UUID]],
+    ) -> List[int]:
+        """
+        Post messages to the next partition of a partitioned board in turn.
+        Messages can only be replied to once they are published, and are
+        never unpublished, so the partitions of the messages replied to can
+        be loaded before the partition posted to. The messages all go to one
+        partition, so they are saved together and get consecutive IDs.
+        """
         board = self.repository.get(board_id)
-        board.reject_message(message_id, rejecter_id)
-        self.save(board)
+        turns = self._partition_turns.get(board_id)
+        if turns is None:
+            turns = self._partition_turns.setdefault(
+                board_id, count(random.randrange(partitions))
+            )
+        index = next(turns) % partitions
+        reply_partitions: Dict[int, BoardPartition] = {}
+        for _, reply_to, _ in messages:
+            if reply_to is None:
+                continue
+            reply_index = BoardPartition.partition_index(reply_to, partitions)
+            if not 0 <= reply_index < partitions:
+                raise MessageNotFoundError(f"No published message with ID {reply_to}")
+            if reply_index != index and reply_index not in reply_partitions:
+                reply_partitions[reply_index] = self._get_partition(
+                    board_id, reply_index
+                )
+
+        def post(partition: BoardPartition) -> List[int]:
+            return [
+                partition.post_message(
+                    board,
+                    text,
+                    reply_to,
+                    author_id,
+                    (
+                        None
+                        if reply_to is None
+                        else reply_partitions.get(
+                            BoardPartition.partition_index(reply_to, partitions)
+                        )
+                    ),
+                )
+                for text, reply_to, author_id in messages
+            ]
+
+        return self._execute(
+            BoardPartition.partition_id(board_id, index),
+            cast(Callable[[MessageBoard], List[int]], post),
+        )
+
+    def _moderate_partitions(
+        self,
+        board_id: UUID,
+        partitions: int,
+        message_ids: List[int],
+        moderate: Callable[[BoardPartition, MessageBoard, int], None],
+    ) -> None:
+        """
+        Approve or reject messages in the partitions of a partitioned board.
+        Messages in more than one partition are moderated in all of their
+        partitions, which are saved together.
+        """
+        board = self.repository.get(board_id)
+        by_partition: Dict[int, List[int]] = {}
+        for message_id in message_ids:
+            index = BoardPartition.partition_index(message_id, partitions)
+            if not 0 <= index < partitions:
+                raise MessageNotFoundError(
+                    f"Message {message_id} is not awaiting moderation"
+                )
+            by_partition.setdefault(index, []).append(message_id)
+
+        def run(partition: BoardPartition) -> None:
+            for message_id in by_partition[partition.index]:
+                moderate(partition, board, message_id)
+
+        if len(by_partition) == 1:
+            (index,) = by_partition
+            self._execute(
+                BoardPartition.partition_id(board_id, index),
+                cast(Callable[[MessageBoard], None], run),
+            )
+            return
+
+        def run_all(group: PartitionGroup) -> None:
+            for partition in group.partitions:
+                run(partition)
+
+        self._execute(
+            tuple(
+                BoardPartition.partition_id(board_id, index) for index in by_partition
+            ),
+            cast(Callable[[MessageBoard], None], run_all),
+        )
+
+    def _execute(self, board_id: BoardKey, command: Callable[[MessageBoard], T]) -> T:
+        """
+        Run a command against a board and save the board. Given the IDs of
+        several partitions, the command is run against a
+        :class:`PartitionGroup` of them, and they are saved together.
+        """
+        if self.command_queue is not None:
+            return self.command_queue.submit(board_id, command)
+        future: "Future[T]" = Future()
+        self._execute_commands(board_id, [(command, future)])
+        return future.result()
+
+    def _execute_commands(
+        self, board_id: BoardKey, commands: List[PendingCommand]
+    ) -> None:
+        """
+        Run commands against one loaded board, save the board once, and
+        complete each command's future with its result or exception.
+
+        A command that fails without changing the board fails alone. A
+        command that fails after changing the board, such as a batch that is
+        invalid part way through, is dropped and the other commands are run
+        again against a freshly loaded board. If saving fails with a version
+        conflict, the commands are run again against the reloaded board up
+        to ``max_retries`` times.
+        """
+        conflicts = 0
+        metrics = self.metrics
+        timed = metrics.enabled
+        while commands:
+            if timed:
+                board = self._load_timed(board_id)
+                decide_start = time.perf_counter()
+            else:
+                board = self._load(board_id)
+            succeeded: List[Tuple["Future[Any]", Any]] = []
+            for command, future in commands:
+                pending_events = len(board.pending_events)
+                try:
+                    result = command(board)
+                except Exception as e:
+                    future.set_exception(e)
+                    if len(board.pending_events) > pending_events:
+                        break
+                else:
+                    succeeded.append((future, result))
+            else:
+                if timed:
+                    metrics.observe(
+                        COMMAND_PHASE_SECONDS,
+                        time.perf_counter() - decide_start,
+                        phase="decide",
+                    )
+                try:
+                    if board.pending_events:
+                        if timed:
+                            self._save_timed(board)
+                        else:
+                            self._save_loaded(board)
+                except RecordConflictError:
+                    if conflicts < self.max_retries:
+                        conflicts += 1
+                        metrics.increment("messageboard_command_conflicts_total")
+                        commands = [c for c in commands if not c[1].done()]
+                        continue
+                    raise
+                for future, result in succeeded:
+                    future.set_result(result)
+                if timed:
+                    metrics.increment("messageboard_commands_total", len(succeeded))
+                return
+            commands = [c for c in commands if not c[1].done()]
+
+    def _load(self, board_id: BoardKey) -> Any:
+        """
+        Load a board, or a group of partitions of a board
+        """
+        if isinstance(board_id, tuple):
+            return PartitionGroup(
+                [
+                    cast(BoardPartition, self.repository.get(partition_id))
+                    for partition_id in board_id
+                ]
+            )
+        return self.repository.get(board_id)
+
+    def _save_loaded(self, board: Any) -> None:
+        if isinstance(board, PartitionGroup):
+            self.save(*board.partitions)
+        else:
+            self.save(board)
+
+    def _load_timed(self, board_id: BoardKey) -> Any:
+        """
+        Load a board, recording the time taken and the events replayed
+        """
+        assert isinstance(self.events, CountingEventStore)
+        replayed = self.events.count()
+        start = time.perf_counter()
+        board = self._load(board_id)
+        self.metrics.observe(
+            COMMAND_PHASE_SECONDS, time.perf_counter() - start, phase="load"
+        )
+        self.metrics.increment(
+            "messageboard_events_replayed_total", self.events.count() - replayed
+        )
+        return board
+
+    def _save_timed(self, board: Any) -> None:
+        start = time.perf_counter()
+        try:
+            self._save_loaded(board)
+        finally:
+            self.metrics.observe(
+                COMMAND_PHASE_SECONDS, time.perf_counter() - start, phase="save"
+            )
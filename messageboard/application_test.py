@@ -0,0 +1,488 @@
+from concurrent.futures import Future
+from dataclasses import replace
+from threading import Thread
+from typing import Any, List, Optional
+from uuid import UUID, uuid4
+
+import pytest
+from eventsourcing.application import Repository
+from eventsourcing.domain import Snapshot
+from eventsourcing.persistence import RecordConflictError
+
+from messageboard.application import COMMAND_PHASE_SECONDS, MessageBoards
+from messageboard.domain import (
+    MESSAGE_ID_LIMIT,
+    BoardIsPartitionedError,
+    BoardPartition,
+    MessageBoard,
+    MessageNotFoundError,
+    MissingFieldValueError,
+    PermissionDeniedError,
+)
+from messageboard.intset import IntRangeSet
+from messageboard.metrics import InMemoryMetrics
+from messageboard.test_util import assert_contains_event
+
+ADMIN_ID = uuid4()
+USER_ID = uuid4()
+
+
+def test_snapshots_are_not_taken_by_default() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.post_message(board_id, "message text", None, USER_ID)
+    assert app.snapshots is None
+
+
+def test_snapshot_is_taken_every_interval() -> None:
+    app = MessageBoards(snapshotting_interval=5)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    for _ in range(9):
+        app.post_message(board_id, "message text", None, USER_ID)
+
+    assert [s.originator_version for s in app.snapshots.get(board_id)] == [5, 10]
+
+
+def test_board_is_restored_from_snapshot_and_later_events() -> None:
+    app = MessageBoards(snapshotting_interval=4)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.moderate_user(board_id, USER_ID, ADMIN_ID)
+    rejected_id = app.post_message(board_id, "message text", None, USER_ID)
+    app.reject_message(board_id, rejected_id, ADMIN_ID)
+    pending_id = app.post_message(board_id, "message text", None, USER_ID)
+
+    board = app.repository.get(board_id)
+    assert board.version == 6
+    assert board.admin_user_ids == {ADMIN_ID}
+    assert board.moderated_users == {USER_ID}
+    assert board.messages_awaiting_moderation == {pending_id}
+    assert board.rejected_messages == {rejected_id}
+    assert board.next_message_id == 2
+
+
+def test_snapshot_can_be_taken_on_demand() -> None:
+    app = MessageBoards(snapshotting_interval=100)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.post_message(board_id, "message text", None, USER_ID)
+    app.take_snapshot(board_id)
+
+    assert [s.originator_version for s in app.snapshots.get(board_id)] == [3]
+    assert app.repository.get(board_id).next_message_id == 1
+
+
+def test_snapshotting_interval_is_read_from_environment(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("MESSAGEBOARDS_SNAPSHOTTING_INTERVAL", "2")
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+
+    assert [s.originator_version for s in app.snapshots.get(board_id)] == [2]
+
+
+def test_boards_are_not_cached_by_default() -> None:
+    app = MessageBoards()
+    assert app.aggregate_cache is None
+
+
+def record_event_store_reads(
+    app: MessageBoards, monkeypatch: pytest.MonkeyPatch
+) -> List[Optional[int]]:
+    """
+    Record the version after which each read from the event store starts
+    """
+    get = app.events.get
+    reads: List[Optional[int]] = []
+
+    def recording_get(originator_id: UUID, gt: Optional[int] = None, **kwargs: Any):  # type: ignore
+        reads.append(gt)
+        return get(originator_id, gt=gt, **kwargs)
+
+    monkeypatch.setattr(app.events, "get", recording_get)
+    return reads
+
+
+def test_saved_boards_are_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    app = MessageBoards(aggregate_cache_maxsize=10)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.post_message(board_id, "message text", None, USER_ID)
+    reads = record_event_store_reads(app, monkeypatch)
+
+    assert app.repository.get(board_id).next_message_id == 1
+    assert reads == [3]
+
+
+def test_cached_board_is_brought_up_to_date(monkeypatch: pytest.MonkeyPatch) -> None:
+    app = MessageBoards(aggregate_cache_maxsize=10)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+
+    other_writer = Repository(app.events)
+    board = other_writer.get(board_id)
+    board.post_message("message text", None, USER_ID)
+    app.events.put(board.collect_events())
+    reads = record_event_store_reads(app, monkeypatch)
+
+    assert app.repository.get(board_id).next_message_id == 1
+    assert app.repository.get(board_id).next_message_id == 1
+    assert reads == [2, 3]
+
+
+def test_changes_to_a_loaded_board_do_not_affect_the_cache() -> None:
+    app = MessageBoards(aggregate_cache_maxsize=10)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.moderate_user(board_id, USER_ID, ADMIN_ID)
+
+    board = app.repository.get(board_id)
+    board.post_message("message text", None, USER_ID)
+
+    cached_board = app.repository.get(board_id)
+    assert cached_board is not board
+    assert cached_board.next_message_id == 0
+    assert cached_board.messages_awaiting_moderation == set()
+
+
+def test_board_is_evicted_from_cache_on_version_conflict() -> None:
+    app = MessageBoards(aggregate_cache_maxsize=10)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    stale_board = app.repository.get(board_id)
+
+    other_writer = Repository(app.events)
+    board = other_writer.get(board_id)
+    board.post_message("message text", None, USER_ID)
+    app.events.put(board.collect_events())
+
+    stale_board.post_message("message text", None, USER_ID)
+    with pytest.raises(RecordConflictError):
+        app.save(stale_board)
+    assert app.aggregate_cache is not None
+    assert board_id not in app.aggregate_cache
+    assert app.post_message(board_id, "message text", None, USER_ID) == 1
+
+
+def test_least_recently_used_board_is_evicted() -> None:
+    app = MessageBoards(aggregate_cache_maxsize=2)
+    first_board_id = app.create_message_board("First board", ADMIN_ID)
+    second_board_id = app.create_message_board("Second board", ADMIN_ID)
+    app.repository.get(first_board_id)
+    third_board_id = app.create_message_board("Third board", ADMIN_ID)
+
+    assert app.aggregate_cache is not None
+    assert first_board_id in app.aggregate_cache
+    assert second_board_id not in app.aggregate_cache
+    assert third_board_id in app.aggregate_cache
+
+
+def test_post_messages_returns_message_ids_in_order() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.post_message(board_id, "message text", None, USER_ID)
+
+    message_ids = app.post_messages(
+        board_id,
+        [("first", None, USER_ID), ("second", None, USER_ID)],
+    )
+
+    assert message_ids == [1, 2]
+    assert app.repository.get(board_id).next_message_id == 3
+
+
+def test_post_messages_saves_all_messages_at_once() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    inserted_batches = []
+    insert_events = app.recorder.insert_events
+
+    def record_batch(stored_events, **kwargs):  # type: ignore
+        inserted_batches.append(len(stored_events))
+        insert_events(stored_events, **kwargs)
+
+    app.recorder.insert_events = record_batch  # type: ignore
+    app.post_messages(board_id, [("message text", None, USER_ID)] * 5)
+
+    assert inserted_batches == [5]
+
+
+def test_post_messages_can_reply_to_earlier_messages_in_batch() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+
+    app.post_messages(board_id, [("original", None, USER_ID), ("reply", 0, USER_ID)])
+
+    assert_contains_event(
+        app.repository,
+        board_id,
+        MessageBoard.MessagePostedEvent,
+        lambda e: e.message_id == 1 and e.reply_to == 0,
+    )
+
+
+def test_post_messages_posts_nothing_when_a_message_is_invalid() -> None:
+    app = MessageBoards(aggregate_cache_maxsize=10)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+
+    with pytest.raises(MissingFieldValueError):
+        app.post_messages(
+            board_id, [("message text", None, USER_ID), ("", None, USER_ID)]
+        )
+
+    assert app.repository.get(board_id).next_message_id == 0
+    assert app.post_message(board_id, "message text", None, USER_ID) == 0
+
+
+def test_approve_messages() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.moderate_user(board_id, USER_ID, ADMIN_ID)
+    message_ids = app.post_messages(board_id, [("message text", None, USER_ID)] * 3)
+
+    app.approve_messages(board_id, message_ids[:2], ADMIN_ID)
+
+    assert app.repository.get(board_id).messages_awaiting_moderation == {2}
+
+
+def test_reject_messages() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.moderate_user(board_id, USER_ID, ADMIN_ID)
+    message_ids = app.post_messages(board_id, [("message text", None, USER_ID)] * 3)
+
+    app.reject_messages(board_id, message_ids[1:], ADMIN_ID)
+
+    board = app.repository.get(board_id)
+    assert board.messages_awaiting_moderation == {0}
+    assert board.rejected_messages == {1, 2}
+
+
+def test_reject_messages_rejects_nothing_when_a_message_is_not_pending() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.moderate_user(board_id, USER_ID, ADMIN_ID)
+    message_id = app.post_message(board_id, "message text", None, USER_ID)
+
+    with pytest.raises(MessageNotFoundError):
+        app.reject_messages(board_id, [message_id, message_id], ADMIN_ID)
+
+    assert app.repository.get(board_id).rejected_messages == set()
+
+
+def test_snapshots_of_moderation_state_as_sets_are_upcast() -> None:
+    app = MessageBoards(snapshotting_interval=100)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.moderate_user(board_id, USER_ID, ADMIN_ID)
+    app.post_messages(board_id, [("message text", None, USER_ID)] * 2)
+    app.reject_message(board_id, 0, ADMIN_ID)
+
+    snapshot = Snapshot.take(app.repository.get(board_id))
+    state = dict(snapshot.state)
+    del state["class_version"]
+    state["messages_awaiting_moderation"] = {1}
+    state["rejected_messages"] = {0}
+    app.snapshots.put([replace(snapshot, state=state)])
+
+    board = app.repository.get(board_id)
+    assert isinstance(board.messages_awaiting_moderation, IntRangeSet)
+    assert board.messages_awaiting_moderation == {1}
+    assert isinstance(board.rejected_messages, IntRangeSet)
+    assert board.rejected_messages == {0}
+
+
+def write_concurrently_on_first_load(
+    app: MessageBoards, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Make another writer post a message just after the app first loads a board
+    """
+    get = app.repository.get
+    loads: List[UUID] = []
+
+    def get_then_write(board_id: UUID, version: Optional[int] = None) -> MessageBoard:
+        board = get(board_id, version)
+        if not loads:
+            loads.append(board_id)
+            other_board = Repository(app.events).get(board_id)
+            other_board.post_message("concurrent message", None, USER_ID)
+            app.events.put(other_board.collect_events())
+        return board
+
+    monkeypatch.setattr(app.repository, "get", get_then_write)
+
+
+def test_command_is_retried_after_version_conflict(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    write_concurrently_on_first_load(app, monkeypatch)
+
+    assert app.post_message(board_id, "message text", None, USER_ID) == 1
+
+
+def test_version_conflict_is_raised_when_retries_are_exhausted(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    app = MessageBoards(max_retries=0)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    write_concurrently_on_first_load(app, monkeypatch)
+
+    with pytest.raises(RecordConflictError):
+        app.post_message(board_id, "message text", None, USER_ID)
+
+
+def test_failed_batch_does_not_affect_commands_run_with_it() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    futures: List["Future[Any]"] = [Future() for _ in range(3)]
+
+    def invalid_batch(board: MessageBoard) -> None:
+        board.post_message("message text", None, USER_ID)
+        board.post_message("", None, USER_ID)
+
+    app._execute_commands(
+        board_id,
+        [
+            (lambda board: board.post_message("first", None, USER_ID), futures[0]),
+            (invalid_batch, futures[1]),
+            (lambda board: board.post_message("second", None, USER_ID), futures[2]),
+        ],
+    )
+
+    assert futures[0].result() == 0
+    assert isinstance(futures[1].exception(), MissingFieldValueError)
+    assert futures[2].result() == 1
+    assert app.repository.get(board_id).next_message_id == 2
+
+
+def test_concurrent_commands_are_combined_without_losing_any() -> None:
+    app = MessageBoards(combine_commands=True, max_retries=0)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    message_ids: List[int] = []
+
+    def post_messages() -> None:
+        for _ in range(25):
+            message_ids.append(
+                app.post_message(board_id, "message text", None, USER_ID)
+            )
+
+    threads = [Thread(target=post_messages) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(message_ids) == list(range(200))
+
+
+def partition_of(message_id: int, partitions: int) -> int:
+    return BoardPartition.partition_index(message_id, partitions)
+
+
+def test_posts_to_a_partitioned_board_are_spread_over_its_partitions() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID, partitions=3)
+    other_board_id = app.create_message_board("Other board", ADMIN_ID, partitions=3)
+
+    message_ids = []
+    for _ in range(6):
+        message_ids.append(app.post_message(board_id, "message text", None, USER_ID))
+        app.post_message(other_board_id, "message text", None, USER_ID)
+
+    # Each board has its own turn, so posts to other boards don't skip
+    # partitions
+    first = partition_of(message_ids[0], 3)
+    assert [partition_of(m, 3) for m in message_ids] == [
+        (first + i) % 3 for i in range(6)
+    ]
+    for index in range(3):
+        partition_id = BoardPartition.partition_id(board_id, index)
+        partition = app.repository.get(partition_id)
+        assert isinstance(partition, BoardPartition)
+        first_id = BoardPartition.first_message_id(index, 3)
+        assert partition.next_message_id == first_id + 2
+        assert sorted(m for m in message_ids if partition_of(m, 3) == index) == [
+            first_id,
+            first_id + 1,
+        ]
+    with pytest.raises(BoardIsPartitionedError):
+        app.repository.get(board_id).post_message("message text", None, USER_ID)
+
+
+def test_a_batch_posted_to_a_partitioned_board_has_consecutive_ids() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID, partitions=8)
+
+    message_ids = app.post_messages(board_id, [("message text", None, USER_ID)] * 1000)
+
+    assert message_ids == list(range(message_ids[0], message_ids[0] + 1000))
+
+
+def test_partitioned_board_keeps_moderation_state_for_all_partitions() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID, partitions=2)
+    app.moderate_user(board_id, USER_ID, ADMIN_ID)
+    message_ids = [
+        app.post_message(board_id, "message text", None, USER_ID) for _ in range(4)
+    ]
+
+    with pytest.raises(PermissionDeniedError):
+        app.approve_message(board_id, message_ids[0], USER_ID)
+    app.approve_messages(board_id, message_ids[:3], ADMIN_ID)
+    app.reject_message(board_id, message_ids[3], ADMIN_ID)
+
+    partitions = [
+        app.repository.get(BoardPartition.partition_id(board_id, index))
+        for index in range(2)
+    ]
+    assert [p.messages_awaiting_moderation for p in partitions] == [set(), set()]
+    rejected_index = partition_of(message_ids[3], 2)
+    assert partitions[rejected_index].rejected_messages == {message_ids[3]}
+    assert partitions[1 - rejected_index].rejected_messages == set()
+    with pytest.raises(MessageNotFoundError):
+        app.approve_messages(board_id, [message_ids[0], message_ids[3]], ADMIN_ID)
+
+
+def test_replies_on_a_partitioned_board_are_checked_across_partitions() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID, partitions=2)
+    other_user_id = uuid4()
+    app.moderate_user(board_id, other_user_id, ADMIN_ID)
+    original_id = app.post_message(board_id, "original", None, USER_ID)
+    pending_id = app.post_message(board_id, "pending", None, other_user_id)
+
+    # Each post goes to the other partition from the message it replies to
+    with pytest.raises(MessageNotFoundError):
+        app.post_message(board_id, "reply", pending_id, USER_ID)
+    reply_id = app.post_message(board_id, "reply", original_id, USER_ID)
+    assert partition_of(reply_id, 2) != partition_of(original_id, 2)
+    for missing_id in (original_id + 1, -1, MESSAGE_ID_LIMIT):
+        with pytest.raises(MessageNotFoundError):
+            app.post_message(board_id, "reply", missing_id, USER_ID)
+    with pytest.raises(MessageNotFoundError):
+        app.approve_message(board_id, MESSAGE_ID_LIMIT, ADMIN_ID)
+
+
+def test_moderating_several_partitions_is_run_like_other_commands() -> None:
+    metrics = InMemoryMetrics()
+    app = MessageBoards(aggregate_cache_maxsize=10, metrics=metrics)
+    assert app.aggregate_cache is not None
+    board_id = app.create_message_board("Test board", ADMIN_ID, partitions=2)
+    app.moderate_user(board_id, USER_ID, ADMIN_ID)
+    message_ids = [
+        app.post_message(board_id, "message text", None, USER_ID) for _ in range(4)
+    ]
+    partition_ids = [BoardPartition.partition_id(board_id, i) for i in range(2)]
+    loads = metrics.summary(COMMAND_PHASE_SECONDS, phase="load").count
+
+    app.approve_messages(board_id, message_ids[:2], ADMIN_ID)
+
+    assert metrics.summary(COMMAND_PHASE_SECONDS, phase="load").count == loads + 1
+    assert all(partition_id in app.aggregate_cache for partition_id in partition_ids)
+
+    def fail(*args: Any, **kwargs: Any) -> None:
+        raise OSError("Disk full")
+
+    app.recorder.insert_events = fail  # type: ignore
+    with pytest.raises(OSError):
+        app.reject_messages(board_id, message_ids[2:], ADMIN_ID)
+    assert not any(
+        partition_id in app.aggregate_cache for partition_id in partition_ids
+    )
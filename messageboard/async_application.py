@@ -0,0 +1,207 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from types import TracebackType
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+from uuid import UUID
+
+from messageboard.application import MessageBoards
+from messageboard.projections.posts_by_user_index import PostsByUserIndex, PostsPage
+from messageboard.projections.posts_repo import PostRepository
+
+
+class _BoardLock:
+    """
+    Lock that keeps the commands for one board in submission order, and
+    counts the commands using it so it can be discarded when idle
+    """
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class AsyncMessageBoards:
+    """
+    Asyncio facade for the :class:`MessageBoards` commands and the projection
+    queries.
+
+    Commands and queries run on a bounded thread pool so that event store
+    I/O doesn't block the event loop. Commands for the same board run one at
+    a time, in the order they were submitted, while commands for different
+    boards run concurrently.
+    """
+
+    DEFAULT_MAX_WORKERS = 8
+
+    def __init__(
+        self,
+        message_boards: MessageBoards,
+        post_repository: Optional[PostRepository] = None,
+        posts_by_user_index: Optional[PostsByUserIndex] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        self.message_boards = message_boards
+        self.post_repository = post_repository
+        self.posts_by_user_index = posts_by_user_index
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="message-boards"
+        )
+        self._board_locks: Dict[UUID, _BoardLock] = {}
+
+    async def __aenter__(self) -> "AsyncMessageBoards":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        # Waiting for the queued commands would block the event loop
+        await asyncio.to_thread(self.close)
+
+    def close(self) -> None:
+        """
+        Wait for running commands and queries to finish, and stop the threads
+        """
+        self._executor.shutdown(wait=True)
+
+    async def create_message_board(
+        self, name: str, created_by: UUID, partitions: int = 1
+    ) -> UUID:
+        return await self._run(
+            self.message_boards.create_message_board, name, created_by, partitions
+        )
+
+    async def post_message(
+        self, board_id: UUID, text: str, reply_to: Optional[int], author_id: UUID
+    ) -> int:
+        return await self._run_for_board(
+            board_id,
+            self.message_boards.post_message,
+            board_id,
+            text,
+            reply_to,
+            author_id,
+        )
+
+    async def post_messages(
+        self,
+        board_id: UUID,
+        messages: Iterable[Tuple[str, Optional[int], UUID]],
+    ) -> List[int]:
+        return await self._run_for_board(
+            board_id, self.message_boards.post_messages, board_id, list(messages)
+        )
+
+    async def moderate_user(
+        self, board_id: UUID, user_id: UUID, acting_user_id: UUID
+    ) -> None:
+        await self._run_for_board(
+            board_id,
+            self.message_boards.moderate_user,
+            board_id,
+            user_id,
+            acting_user_id,
+        )
+
+    async def approve_message(
+        self, board_id: UUID, message_id: int, approver_id: UUID
+    ) -> None:
+        await self._run_for_board(
+            board_id,
+            self.message_boards.approve_message,
+            board_id,
+            message_id,
+            approver_id,
+        )
+
+    async def approve_messages(
+        self, board_id: UUID, message_ids: Iterable[int], approver_id: UUID
+    ) -> None:
+        await self._run_for_board(
+            board_id,
+            self.message_boards.approve_messages,
+            board_id,
+            list(message_ids),
+            approver_id,
+        )
+
+    async def reject_message(
+        self, board_id: UUID, message_id: int, rejecter_id: UUID
+    ) -> None:
+        await self._run_for_board(
+            board_id,
+            self.message_boards.reject_message,
+            board_id,
+            message_id,
+            rejecter_id,
+        )
+
+    async def reject_messages(
+        self, board_id: UUID, message_ids: Iterable[int], rejecter_id: UUID
+    ) -> None:
+        await self._run_for_board(
+            board_id,
+            self.message_boards.reject_messages,
+            board_id,
+            list(message_ids),
+            rejecter_id,
+        )
+
+    async def get_post(self, board_id: UUID, post_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Returns a post and its replies rendered as plain values (see
+        :func:`PostRepository.get_rendered_post`), rather than a view that
+        changes as the projection processes events
+        """
+        if self.post_repository is None:
+            raise AssertionError("No post repository was given")
+        return await self._run(
+            self.post_repository.get_rendered_post, board_id, post_id
+        )
+
+    async def get_posts_for_user(
+        self,
+        user_id: UUID,
+        after: Optional[int] = None,
+        limit: Optional[int] = None,
+        newest_first: bool = False,
+    ) -> PostsPage:
+        if self.posts_by_user_index is None:
+            raise AssertionError("No posts by user index was given")
+        return await self._run(
+            self.posts_by_user_index.get_posts_for_user,
+            user_id,
+            after,
+            limit,
+            newest_first,
+        )
+
+    async def _run(self, function: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(function, *args))
+
+    async def _run_for_board(
+        self, board_id: UUID, function: Callable[..., Any], *args: Any
+    ) -> Any:
+        board_lock = self._board_locks.get(board_id)
+        if board_lock is None:
+            board_lock = self._board_locks[board_id] = _BoardLock()
+        board_lock.users += 1
+        try:
+            async with board_lock.lock:
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(self._executor, partial(function, *args))
+                try:
+                    return await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    # The command can't be stopped once it is running, so
+                    # keep the board locked until it has finished
+                    await asyncio.wait({future})
+                    raise
+        finally:
+            board_lock.users -= 1
+            if board_lock.users == 0:
+                del self._board_locks[board_id]
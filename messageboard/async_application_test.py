@@ -0,0 +1,132 @@
+import asyncio
+import time
+from typing import List
+from uuid import uuid4
+
+import pytest
+from eventsourcing.system import SingleThreadedRunner, System
+
+from messageboard.application import MessageBoards
+from messageboard.async_application import AsyncMessageBoards
+from messageboard.domain import MissingFieldValueError
+from messageboard.projections.posts_by_user_index import PostsByUserIndex
+from messageboard.projections.posts_repo import PostRepository
+
+ADMIN_ID = uuid4()
+USER_ID = uuid4()
+
+
+def test_commands_and_queries() -> None:
+    system = System(
+        pipes=[[MessageBoards, PostRepository], [MessageBoards, PostsByUserIndex]]
+    )
+    runner = SingleThreadedRunner(system)
+    runner.start()
+
+    async def run() -> None:
+        async with AsyncMessageBoards(
+            runner.get(MessageBoards),
+            runner.get(PostRepository),
+            runner.get(PostsByUserIndex),
+            max_workers=1,
+        ) as app:
+            board_id = await app.create_message_board("Test board", ADMIN_ID)
+            await app.moderate_user(board_id, USER_ID, ADMIN_ID)
+            message_id = await app.post_message(board_id, "text", None, USER_ID)
+            await app.approve_message(board_id, message_id, ADMIN_ID)
+
+            post = await app.get_post(board_id, message_id)
+            assert post is not None and post["published"]
+            page = await app.get_posts_for_user(USER_ID, limit=10)
+            assert page.posts == ((board_id, message_id),)
+
+    asyncio.run(run())
+
+
+def test_command_exceptions_are_raised() -> None:
+    async def run() -> None:
+        async with AsyncMessageBoards(MessageBoards()) as app:
+            board_id = await app.create_message_board("Test board", ADMIN_ID)
+            with pytest.raises(MissingFieldValueError):
+                await app.post_message(board_id, "", None, USER_ID)
+
+    asyncio.run(run())
+
+
+def test_partitioned_boards_can_be_created() -> None:
+    message_boards = MessageBoards()
+
+    async def run() -> None:
+        async with AsyncMessageBoards(message_boards) as app:
+            board_id = await app.create_message_board(
+                "Test board", ADMIN_ID, partitions=2
+            )
+            await app.post_message(board_id, "text", None, USER_ID)
+            board = message_boards.repository.get(board_id)
+            assert board.partitions == 2
+
+    asyncio.run(run())
+
+
+def test_commands_for_a_board_run_in_submission_order() -> None:
+    message_boards = MessageBoards()
+    board_id = message_boards.create_message_board("Test board", ADMIN_ID)
+    post_message = message_boards.post_message
+    texts: List[str] = []
+
+    def slow_post_message(*args):  # type: ignore
+        texts.append(args[1])
+        time.sleep(0.001 * (5 - int(args[1])))
+        return post_message(*args)
+
+    message_boards.post_message = slow_post_message  # type: ignore
+
+    async def run() -> List[int]:
+        async with AsyncMessageBoards(message_boards, max_workers=5) as app:
+            return await asyncio.gather(
+                *(app.post_message(board_id, str(i), None, USER_ID) for i in range(5))
+            )
+
+    assert asyncio.run(run()) == [0, 1, 2, 3, 4]
+    assert texts == ["0", "1", "2", "3", "4"]
+
+
+def test_queries_require_projections() -> None:
+    async def run() -> None:
+        async with AsyncMessageBoards(MessageBoards()) as app:
+            with pytest.raises(AssertionError):
+                await app.get_post(uuid4(), 0)
+
+    asyncio.run(run())
+
+
+def test_closing_does_not_block_the_event_loop() -> None:
+    message_boards = MessageBoards()
+    board_id = message_boards.create_message_board("Test board", ADMIN_ID)
+    post_message = message_boards.post_message
+
+    def slow_post_message(*args):  # type: ignore
+        time.sleep(0.05)
+        return post_message(*args)
+
+    message_boards.post_message = slow_post_message  # type: ignore
+
+    async def run() -> int:
+        ticks = 0
+
+        async def tick() -> None:
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        ticker = asyncio.create_task(tick())
+        async with AsyncMessageBoards(message_boards, max_workers=1) as app:
+            post = asyncio.ensure_future(app.post_message(board_id, "x", None, USER_ID))
+            await asyncio.sleep(0)
+            ticks = 0
+        ticker.cancel()
+        await post
+        return ticks
+
+    assert asyncio.run(run()) > 5
@@ -0,0 +1,335 @@
+import struct
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+from uuid import UUID
+
+from eventsourcing.domain import DomainEvent
+from eventsourcing.persistence import (
+    Cipher,
+    Compressor,
+    Mapper,
+    StoredEvent,
+    Transcoder,
+)
+from eventsourcing.utils import get_topic, resolve_topic
+
+from messageboard.domain import BoardPartition, MessageBoard
+
+# JSON encoded state always starts with "{", so states encoded by a codec
+# start with a byte that JSON never does
+BINARY_MARKER = 0
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+TIMESTAMP = struct.Struct("<q")
+# Shorter texts rarely get smaller when compressed
+MIN_COMPRESSED_TEXT_SIZE = 128
+
+Reader = Callable[[bytes, int], Tuple[Any, int]]
+Writer = Callable[[bytearray, Any, bool], None]
+
+
+class UnencodableValue(Exception):
+    """
+    Raised when a value doesn't fit the codec's field type, so the event
+    is encoded as JSON instead
+    """
+
+
+def write_varint(buffer: bytearray, value: int) -> None:
+    if value < 0:
+        raise UnencodableValue(value)
+    while value > 0x7F:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    value = data[offset]
+    offset += 1
+    if value < 0x80:
+        return value, offset
+    value &= 0x7F
+    shift = 7
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def write_uuid(buffer: bytearray, value: Any, compress: bool) -> None:
+    if type(value) is not UUID:
+        raise UnencodableValue(value)
+    buffer += value.bytes
+
+
+def read_uuid(data: bytes, offset: int) -> Tuple[UUID, int]:
+    return UUID(bytes=data[offset : offset + 16]), offset + 16
+
+
+def write_uint(buffer: bytearray, value: Any, compress: bool) -> None:
+    if type(value) is not int:
+        raise UnencodableValue(value)
+    write_varint(buffer, value)
+
+
+def write_optional_uint(buffer: bytearray, value: Any, compress: bool) -> None:
+    if value is None:
+        buffer.append(0)
+    elif type(value) is not int:
+        raise UnencodableValue(value)
+    else:
+        write_varint(buffer, value + 1)
+
+
+def read_optional_uint(data: bytes, offset: int) -> Tuple[Optional[int], int]:
+    value, offset = read_varint(data, offset)
+    return (value - 1 if value else None), offset
+
+
+def write_bool(buffer: bytearray, value: Any, compress: bool) -> None:
+    if type(value) is not bool:
+        raise UnencodableValue(value)
+    buffer.append(value)
+
+
+def read_bool(data: bytes, offset: int) -> Tuple[bool, int]:
+    return data[offset] == 1, offset + 1
+
+
+def write_str(buffer: bytearray, value: Any, compress: bool) -> None:
+    """
+    Writes the UTF-8 length and a flag for whether it is compressed as a
+    varint, followed by the UTF-8 encoded string, compressed with zlib if
+    ``compress`` is true and that makes it smaller
+    """
+    if type(value) is not str:
+        raise UnencodableValue(value)
+    data = value.encode("utf-8")
+    compressed = False
+    if compress and len(data) >= MIN_COMPRESSED_TEXT_SIZE:
+        compressed_data = zlib.compress(data)
+        if len(compressed_data) < len(data):
+            data = compressed_data
+            compressed = True
+    write_varint(buffer, len(data) << 1 | compressed)
+    buffer += data
+
+
+def read_str(data: bytes, offset: int) -> Tuple[str, int]:
+    header, offset = read_varint(data, offset)
+    end = offset + (header >> 1)
+    value = data[offset:end]
+    if header & 1:
+        value = zlib.decompress(value)
+    return value.decode("utf-8"), end
+
+
+def write_timestamp(buffer: bytearray, value: Any, compress: bool) -> None:
+    """
+    Writes a UTC timestamp as a signed 8 byte count of microseconds since
+    the epoch, which is as short as a varint for current times and faster
+    to read
+    """
+    if type(value) is not datetime or value.tzinfo is not timezone.utc:
+        raise UnencodableValue(value)
+    buffer += TIMESTAMP.pack((value - EPOCH) // MICROSECOND)
+
+
+def read_timestamp(data: bytes, offset: int) -> Tuple[datetime, int]:
+    return (
+        EPOCH + TIMESTAMP.unpack_from(data, offset)[0] * MICROSECOND,
+        offset + TIMESTAMP.size,
+    )
+
+
+def read_uint(data: bytes, offset: int) -> Tuple[int, int]:
+    return read_varint(data, offset)
+
+
+FIELD_TYPES: Dict[Any, Tuple[Writer, Reader]] = {
+    UUID: (write_uuid, read_uuid),
+    int: (write_uint, read_uint),
+    Optional[int]: (write_optional_uint, read_optional_uint),
+    bool: (write_bool, read_bool),
+    str: (write_str, read_str),
+    datetime: (write_timestamp, read_timestamp),
+}
+
+
+class EventCodec:
+    """
+    Encodes the state of one version of an event class as a fixed sequence
+    of binary fields: UUIDs in 16 bytes, timestamps in 8 bytes, integers as
+    varints, and strings as their UTF-8 encoding prefixed with its length
+    """
+
+    def __init__(self, **fields: Any) -> None:
+        self.names = list(fields)
+        self.writers = [
+            (name, FIELD_TYPES[field_type][0]) for name, field_type in fields.items()
+        ]
+        self.readers = [
+            (name, FIELD_TYPES[field_type][1]) for name, field_type in fields.items()
+        ]
+
+    def encode(
+        self, state: Dict[str, Any], buffer: bytearray, compress_text: bool
+    ) -> bool:
+        """
+        Appends the encoded state to the buffer. Returns False, leaving the
+        buffer in an undefined state, if the state doesn't fit the codec.
+        """
+        if len(state) != len(self.names):
+            return False
+        try:
+            for name, writer in self.writers:
+                writer(buffer, state[name], compress_text)
+        except (KeyError, UnencodableValue):
+            return False
+        return True
+
+    def decode(self, data: bytes, offset: int) -> Dict[str, Any]:
+        state = {}
+        for name, reader in self.readers:
+            state[name], offset = reader(data, offset)
+        return state
+
+
+# Codecs by event class and class version. A codec for an old version of
+# an event class has to stay registered for as long as events of that
+# version are stored.
+EVENT_CODECS: Dict[Tuple[type, int], EventCodec] = {
+    (MessageBoard.MessageBoardCreatedEvent, 1): EventCodec(
+        timestamp=datetime, originator_topic=str, name=str, created_by=UUID
+    ),
+    (MessageBoard.AdministratorAddedEvent, 1): EventCodec(
+        timestamp=datetime, user_id=UUID
+    ),
+    (MessageBoard.MessagePostedEvent, 1): EventCodec(
+        timestamp=datetime,
+        message_id=int,
+        text=str,
+        reply_to=Optional[int],
+        author_id=UUID,
+        requires_moderation=bool,
+    ),
+    (MessageBoard.UserFlaggedForModerationEvent, 1): EventCodec(
+        timestamp=datetime, user_id=UUID
+    ),
+    (MessageBoard.MessageApprovedEvent, 1): EventCodec(
+        timestamp=datetime, message_id=int
+    ),
+    (MessageBoard.MessageRejectedEvent, 1): EventCodec(
+        timestamp=datetime, message_id=int
+    ),
+    (MessageBoard.BoardPartitionedEvent, 1): EventCodec(
+        timestamp=datetime, partitions=int
+    ),
+    (BoardPartition.BoardPartitionCreatedEvent, 1): EventCodec(
+        timestamp=datetime,
+        originator_topic=str,
+        board_id=UUID,
+        index=int,
+        partitions=int,
+    ),
+    (BoardPartition.MessagePostedEvent, 1): EventCodec(
+        timestamp=datetime,
+        message_id=int,
+        text=str,
+        reply_to=Optional[int],
+        author_id=UUID,
+        requires_moderation=bool,
+        board_id=UUID,
+        partitions=int,
+    ),
+    (BoardPartition.MessageApprovedEvent, 1): EventCodec(
+        timestamp=datetime, message_id=int, board_id=UUID, partitions=int
+    ),
+    (BoardPartition.MessageRejectedEvent, 1): EventCodec(
+        timestamp=datetime, message_id=int, board_id=UUID, partitions=int
+    ),
+}
+
+
+class CompactMapper(Mapper[DomainEvent]):
+    """
+    Mapper that encodes the events that have a registered codec in a
+    compact binary format, and other events, or events whose state doesn't
+    fit their codec, with the transcoder.
+
+    A binary state starts with ``BINARY_MARKER`` and the class version of
+    the event as a varint, followed by the fields of the codec. States are
+    decoded by their first byte, so events stored as JSON before the codec
+    was registered can still be read. When ``encode_binary`` is false,
+    events are only ever written with the transcoder.
+    """
+
+    def __init__(
+        self,
+        transcoder: Transcoder,
+        compressor: Optional[Compressor] = None,
+        cipher: Optional[Cipher] = None,
+        encode_binary: bool = True,
+        compress_text: bool = False,
+        codecs: Optional[Dict[Tuple[type, int], EventCodec]] = None,
+    ):
+        super().__init__(transcoder, compressor=compressor, cipher=cipher)
+        self.encode_binary = encode_binary
+        self.compress_text = compress_text
+        self.codecs = EVENT_CODECS if codecs is None else codecs
+        self._topics: Dict[str, type] = {}
+
+    def from_domain_event(self, domain_event: DomainEvent) -> StoredEvent:
+        cls = type(domain_event)
+        class_version = getattr(cls, "class_version", 1)
+        codec = self.codecs.get((cls, class_version))
+        if codec is None or not self.encode_binary:
+            return super().from_domain_event(domain_event)
+        event_state = dict(domain_event.__dict__)
+        originator_id = event_state.pop("originator_id")
+        originator_version = event_state.pop("originator_version")
+        buffer = bytearray([BINARY_MARKER])
+        write_varint(buffer, class_version)
+        if not codec.encode(event_state, buffer, self.compress_text):
+            return super().from_domain_event(domain_event)
+        stored_state = bytes(buffer)
+        if self.compressor:
+            stored_state = self.compressor.compress(stored_state)
+        if self.cipher:
+            stored_state = self.cipher.encrypt(stored_state)
+        return StoredEvent(
+            originator_id=originator_id,
+            originator_version=originator_version,
+            topic=get_topic(cls),
+            state=stored_state,
+        )
+
+    def to_domain_event(self, stored: StoredEvent) -> DomainEvent:
+        stored_state = stored.state
+        if self.cipher:
+            stored_state = self.cipher.decrypt(stored_state)
+        if self.compressor:
+            stored_state = self.compressor.decompress(stored_state)
+        cls = self._topics.get(stored.topic)
+        if cls is None:
+            cls = self._topics[stored.topic] = resolve_topic(stored.topic)
+        if stored_state and stored_state[0] == BINARY_MARKER:
+            from_version, offset = read_varint(stored_state, 1)
+            event_state = self.codecs[(cls, from_version)].decode(stored_state, offset)
+        else:
+            event_state = self.transcoder.decode(stored_state)
+            from_version = event_state.pop("class_version", 1)
+        class_version = getattr(cls, "class_version", 1)
+        while from_version < class_version:
+            getattr(cls, f"upcast_v{from_version}_v{from_version + 1}")(event_state)
+            from_version += 1
+        event_state["originator_id"] = stored.originator_id
+        event_state["originator_version"] = stored.originator_version
+        domain_event = object.__new__(cls)
+        domain_event.__dict__.update(event_state)
+        return domain_event
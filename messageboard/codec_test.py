@@ -0,0 +1,127 @@
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+from uuid import UUID, uuid4
+
+import pytest
+from eventsourcing.domain import DomainEvent
+
+from messageboard.application import MessageBoards
+from messageboard.codec import (
+    BINARY_MARKER,
+    CompactMapper,
+    read_varint,
+    write_varint,
+)
+from messageboard.domain import MessageBoard
+
+ADMIN_ID = uuid4()
+USER_ID = uuid4()
+
+
+def stored_states(app: MessageBoards, board_id: UUID) -> List[bytes]:
+    return [stored.state for stored in app.recorder.select_events(board_id)]
+
+
+def event_states(app: MessageBoards, board_id: UUID) -> List[Dict[str, Any]]:
+    return [event.__dict__ for event in app.events.get(board_id)]
+
+
+def add_board(app: MessageBoards) -> UUID:
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.moderate_user(board_id, USER_ID, ADMIN_ID)
+    first = app.post_message(board_id, "first", None, USER_ID)
+    app.approve_message(board_id, first, ADMIN_ID)
+    second = app.post_message(board_id, "second", first, USER_ID)
+    app.reject_message(board_id, second, ADMIN_ID)
+    return board_id
+
+
+def test_varints() -> None:
+    for value in (0, 1, 127, 128, 300, 2**35, 2**64):
+        buffer = bytearray(b"x")
+        write_varint(buffer, value)
+        assert read_varint(bytes(buffer), 1) == (value, len(buffer))
+
+
+def test_board_events_are_stored_in_binary() -> None:
+    app = MessageBoards()
+    board_id = add_board(app)
+
+    states = stored_states(app, board_id)
+    assert len(states) == 7
+    assert all(state[0] == BINARY_MARKER for state in states)
+    board = app.repository.get(board_id)
+    assert board.rejected_messages == {1}
+    assert board.next_message_id == 2
+
+    json_app = MessageBoards()
+    json_app.mapper.encode_binary = False  # type: ignore
+    json_board_id = add_board(json_app)
+    json_states = stored_states(json_app, json_board_id)
+    for state, json_state in zip(states, json_states):
+        assert len(state) < len(json_state) / 2
+
+
+def test_events_stored_as_json_can_still_be_read(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("COMPACT_EVENTS", "no")
+    app = MessageBoards()
+    board_id = add_board(app)
+    assert all(state.startswith(b"{") for state in stored_states(app, board_id))
+    json_events = event_states(app, board_id)
+
+    app.mapper.encode_binary = True  # type: ignore
+    app.post_message(board_id, "third", None, ADMIN_ID)
+    states = stored_states(app, board_id)
+    assert states[-1][0] == BINARY_MARKER
+    events = event_states(app, board_id)
+    assert events[:-1] == json_events
+    assert events[-1]["text"] == "third"
+    assert app.repository.get(board_id).next_message_id == 3
+
+
+def test_long_message_text_can_be_compressed(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("COMPRESS_MESSAGE_TEXT", "yes")
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    long_text = "all work and no play " * 100
+    app.post_message(board_id, long_text, None, USER_ID)
+    app.post_message(board_id, "short", None, USER_ID)
+
+    states = stored_states(app, board_id)
+    assert len(states[2]) < len(long_text) / 10
+    assert b"short" in states[3]
+    assert [event.__dict__.get("text") for event in app.events.get(board_id)] == [
+        None,
+        None,
+        long_text,
+        "short",
+    ]
+
+
+def test_events_that_do_not_fit_their_codec_are_stored_as_json() -> None:
+    app = MessageBoards()
+    mapper = app.mapper
+    assert isinstance(mapper, CompactMapper)
+    event = MessageBoard.MessagePostedEvent(  # type: ignore
+        originator_id=uuid4(),
+        originator_version=3,
+        timestamp=datetime.now(tz=timezone(timedelta(hours=1))),
+        message_id=0,
+        text="text",
+        reply_to=None,
+        author_id=USER_ID,
+        requires_moderation=False,
+    )
+    utc_event = replace(event, timestamp=event.timestamp.astimezone(timezone.utc))
+
+    stored = mapper.from_domain_event(event)
+    assert stored.state.startswith(b"{")
+    assert mapper.to_domain_event(stored).__dict__ == event.__dict__
+
+    stored = mapper.from_domain_event(utc_event)
+    assert stored.state[0] == BINARY_MARKER
+    decoded: DomainEvent = mapper.to_domain_event(stored)
+    assert decoded.__dict__ == utc_event.__dict__
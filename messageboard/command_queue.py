@@ -0,0 +1,64 @@
+from concurrent.futures import Future
+from threading import Lock
+from typing import Any, Callable, Dict, List, Set, Tuple, TypeVar, Union
+from uuid import UUID
+
+from messageboard.domain import MessageBoard
+
+T = TypeVar("T")
+
+Command = Callable[[MessageBoard], Any]
+PendingCommand = Tuple[Command, "Future[Any]"]
+# The ID of a board or partition, or the IDs of partitions of a board that
+# are loaded and saved together
+BoardKey = Union[UUID, Tuple[UUID, ...]]
+
+
+class BoardCommandQueue:
+    """
+    Combines commands submitted concurrently for the same board, so that
+    they share one load and one save instead of conflicting with each other.
+
+    The first thread to submit a command for an idle board becomes that
+    board's leader. The leader repeatedly takes every command queued for the
+    board and runs them together, until the queue is empty. Other threads
+    queue their commands and wait for the leader to complete them.
+    """
+
+    def __init__(self, execute: Callable[[BoardKey, List[PendingCommand]], None]):
+        """
+        :param execute: Runs a batch of commands against one loaded board and
+            completes their futures
+        """
+        self._execute = execute
+        self._lock = Lock()
+        self._queues: Dict[BoardKey, List[PendingCommand]] = {}
+        self._active_boards: Set[BoardKey] = set()
+
+    def submit(self, board_id: BoardKey, command: Callable[[MessageBoard], T]) -> T:
+        """
+        Run a command against a board and return its result, or raise the
+        exception it raised
+        """
+        future: "Future[T]" = Future()
+        with self._lock:
+            self._queues.setdefault(board_id, []).append((command, future))
+            is_leader = board_id not in self._active_boards
+            self._active_boards.add(board_id)
+        if is_leader:
+            self._drain(board_id)
+        return future.result()
+
+    def _drain(self, board_id: BoardKey) -> None:
+        while True:
+            with self._lock:
+                batch = self._queues.pop(board_id, [])
+                if not batch:
+                    self._active_boards.discard(board_id)
+                    return
+            try:
+                self._execute(board_id, batch)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
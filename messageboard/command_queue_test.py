@@ -0,0 +1,55 @@
+import time
+from threading import Event, Thread
+from typing import List
+from uuid import uuid4
+
+import pytest
+
+from messageboard.command_queue import BoardCommandQueue, PendingCommand
+
+BOARD_ID = uuid4()
+
+
+def test_commands_submitted_while_board_is_busy_are_run_together() -> None:
+    batch_sizes = []
+    first_batch_started = Event()
+    release_first_batch = Event()
+
+    def execute(board_id: object, batch: List[PendingCommand]) -> None:
+        batch_sizes.append(len(batch))
+        if len(batch_sizes) == 1:
+            first_batch_started.set()
+            release_first_batch.wait()
+        for command, future in batch:
+            future.set_result(command(None))  # type: ignore
+
+    queue = BoardCommandQueue(execute)
+    results = []
+
+    def submit(value: int) -> None:
+        results.append(queue.submit(BOARD_ID, lambda board: value))
+
+    threads = [Thread(target=submit, args=(0,))]
+    threads[0].start()
+    first_batch_started.wait()
+    threads += [Thread(target=submit, args=(i,)) for i in (1, 2)]
+    for thread in threads[1:]:
+        thread.start()
+    while len(queue._queues.get(BOARD_ID, [])) < 2:
+        time.sleep(0.001)
+    release_first_batch.set()
+    for thread in threads:
+        thread.join()
+
+    assert batch_sizes == [1, 2]
+    assert sorted(results) == [0, 1, 2]
+
+
+def test_exceptions_are_raised_to_the_submitter() -> None:
+    def execute(board_id: object, batch: List[PendingCommand]) -> None:
+        raise RuntimeError("Store unavailable")
+
+    queue = BoardCommandQueue(execute)
+    with pytest.raises(RuntimeError):
+        queue.submit(BOARD_ID, lambda board: None)
+    assert queue._active_boards == set()
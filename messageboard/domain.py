@@ -1,9 +1,14 @@
-from typing import Optional
-from uuid import UUID, uuid4
+from typing import Any, Dict, Optional
+from uuid import UUID, uuid4, uuid5
 
 from eventsourcing.domain import Aggregate, AggregateCreated, AggregateEvent
 
+from messageboard.intset import IntRangeSet
+
 FIRST_MESSAGE_ID = 0
+# The projections keep message IDs in 32-bit arrays, so the message IDs of
+# a board are below this limit
+MESSAGE_ID_LIMIT = 1 << 31
 
 
 class MessageBoard(Aggregate):
@@ -11,24 +16,57 @@ class MessageBoard(Aggregate):
     Message Board aggregate for event sourced example
     """
 
+    class_version = 3
+
     def __init__(self, name: str, created_by: UUID):
         self.admin_user_ids: set[UUID] = set()
         self.moderated_users: set[UUID] = set()
-        self.messages_awaiting_moderation: set[int] = set()
-        self.rejected_messages: set[int] = set()
+        self.messages_awaiting_moderation = IntRangeSet()
+        self.rejected_messages = IntRangeSet()
         self.next_message_id = FIRST_MESSAGE_ID
+        self.partitions = 1
+
+    @staticmethod
+    def upcast_v1_v2(state: Dict[str, Any]) -> None:
+        """
+        Version 1 snapshots stored the moderation state as plain sets
+        """
+        for attribute in ("messages_awaiting_moderation", "rejected_messages"):
+            state[attribute] = IntRangeSet(state[attribute])
+
+    @staticmethod
+    def upcast_v2_v3(state: Dict[str, Any]) -> None:
+        """
+        Boards were never partitioned before version 3
+        """
+        state["partitions"] = 1
 
     @classmethod
-    def create(cls, name: str, created_by: UUID) -> "MessageBoard":
+    def create(
+        cls,
+        name: str,
+        created_by: UUID,
+        partitions: int = 1,
+        board_id: Optional[UUID] = None,
+    ) -> "MessageBoard":
         """
-        Create a new message board
+        Create a new message board. The posts to a board with more than one
+        partition go to its partitions (see :class:`BoardPartition`), which
+        must be created with it. Boards get a random ID unless one is given.
         """
         if not name:
             raise MissingFieldValueError("Name is required")
+        if partitions < 1:
+            raise ValueError(f"A board needs at least one partition, not {partitions}")
         board = cls._create(
-            cls.MessageBoardCreatedEvent, id=uuid4(), name=name, created_by=created_by
+            cls.MessageBoardCreatedEvent,
+            id=uuid4() if board_id is None else board_id,
+            name=name,
+            created_by=created_by,
         )
         board.trigger_event(cls.AdministratorAddedEvent, user_id=created_by)
+        if partitions > 1:
+            board.trigger_event(cls.BoardPartitionedEvent, partitions=partitions)
         return board
 
     class MessageBoardCreatedEvent(AggregateCreated):
@@ -41,15 +79,26 @@ class MessageBoard(Aggregate):
         def apply(self, aggregate: "MessageBoard") -> None:
             aggregate.admin_user_ids.add(self.user_id)
 
+    class BoardPartitionedEvent(AggregateEvent):
+        partitions: int
+
+        def apply(self, aggregate: "MessageBoard") -> None:
+            aggregate.partitions = self.partitions
+
     def post_message(self, text: str, reply_to: Optional[int], author_id: UUID) -> int:
         """
         Post a new message to the message board
         """
+        self._assert_board_is_not_partitioned()
         if not text:
             raise MissingFieldValueError("Message text must be non-blank")
         if reply_to is not None:
             self._assert_message_is_published(reply_to)
         message_id = self.next_message_id
+        if message_id >= MESSAGE_ID_LIMIT:
+            raise MessageIdsExhaustedError(
+                f"The board has given out all message IDs below {MESSAGE_ID_LIMIT}"
+            )
         self.trigger_event(
             self.MessagePostedEvent,
             message_id=message_id,
@@ -98,6 +147,7 @@ class MessageBoard(Aggregate):
         :param approver_id: The ID of the user approving
         :return:
         """
+        self._assert_board_is_not_partitioned()
         self._assert_user_is_admin(approver_id, "Only admins can moderate messages")
         self._assert_message_is_awaiting_moderation(message_id)
         self.trigger_event(self.MessageApprovedEvent, message_id=message_id)
@@ -115,6 +165,7 @@ class MessageBoard(Aggregate):
         :param message_id: The message ID
         :param rejecter_id: The ID of the user rejecting
         """
+        self._assert_board_is_not_partitioned()
         self._assert_user_is_admin(rejecter_id, "Only admins can moderate messages")
         self._assert_message_is_awaiting_moderation(message_id)
         self.trigger_event(self.MessageRejectedEvent, message_id=message_id)
@@ -153,6 +204,195 @@ class MessageBoard(Aggregate):
                 f"Message {message_id} is not awaiting moderation"
             )
 
+    def _assert_board_is_not_partitioned(self) -> None:
+        if self.partitions > 1:
+            raise BoardIsPartitionedError(self.partitions)
+
+
+class BoardPartition(Aggregate):
+    """
+    One of the partitions of a partitioned message board. The posts on the
+    board are spread over its partitions, so posts to different partitions
+    don't conflict. The message IDs of the board are split into one range
+    for each partition, and each partition gives out the IDs of its range
+    in order, so every message ID belongs to one partition and the posts of
+    a partition have consecutive IDs. The admins and moderated users stay
+    on the board, which is given to the commands that need them.
+    """
+
+    def __init__(self, board_id: UUID, index: int, partitions: int):
+        self.board_id = board_id
+        self.index = index
+        self.partitions = partitions
+        self.messages_awaiting_moderation = IntRangeSet()
+        self.rejected_messages = IntRangeSet()
+        self.next_message_id = self.first_message_id(index, partitions)
+
+    @staticmethod
+    def partition_id(board_id: UUID, index: int) -> UUID:
+        """
+        Returns the ID of a board's partition, which is derived from the
+        board ID so it can be found without looking it up
+        """
+        return uuid5(board_id, str(index))
+
+    @staticmethod
+    def id_range(partitions: int) -> int:
+        """
+        Returns the number of message IDs in the range of each partition
+        """
+        return (MESSAGE_ID_LIMIT - FIRST_MESSAGE_ID) // partitions
+
+    @classmethod
+    def first_message_id(cls, index: int, partitions: int) -> int:
+        return FIRST_MESSAGE_ID + index * cls.id_range(partitions)
+
+    @classmethod
+    def partition_index(cls, message_id: int, partitions: int) -> int:
+        """
+        Returns the index of the partition a message ID belongs to, which
+        is out of range if no partition gives out the ID
+        """
+        return (message_id - FIRST_MESSAGE_ID) // cls.id_range(partitions)
+
+    @classmethod
+    def create(cls, board_id: UUID, index: int, partitions: int) -> "BoardPartition":
+        return cls._create(
+            cls.BoardPartitionCreatedEvent,
+            id=cls.partition_id(board_id, index),
+            board_id=board_id,
+            index=index,
+            partitions=partitions,
+        )
+
+    class BoardPartitionCreatedEvent(AggregateCreated):
+        board_id: UUID
+        index: int
+        partitions: int
+
+    def post_message(
+        self,
+        board: MessageBoard,
+        text: str,
+        reply_to: Optional[int],
+        author_id: UUID,
+        reply_partition: Optional["BoardPartition"] = None,
+    ) -> int:
+        """
+        Post a new message to this partition of a board
+
+        :param board: The partitioned board
+        :param reply_partition: The partition of the message replied to, when
+            it isn't this partition
+        """
+        if not text:
+            raise MissingFieldValueError("Message text must be non-blank")
+        if reply_to is not None:
+            (reply_partition or self)._assert_message_is_published(reply_to)
+        message_id = self.next_message_id
+        if message_id >= self.first_message_id(self.index + 1, self.partitions):
+            raise MessageIdsExhaustedError(
+                f"Partition {self.index} of the board has given out all the "
+                "message IDs of its range"
+            )
+        self.trigger_event(
+            self.MessagePostedEvent,
+            message_id=message_id,
+            text=text,
+            reply_to=reply_to,
+            author_id=author_id,
+            requires_moderation=board._user_is_moderated(author_id),
+            board_id=self.board_id,
+            partitions=self.partitions,
+        )
+        return message_id
+
+    class MessagePostedEvent(MessageBoard.MessagePostedEvent):
+        board_id: UUID
+        partitions: int
+
+        def apply(self, aggregate: "BoardPartition") -> None:
+            aggregate.next_message_id = self.message_id + 1
+            if self.requires_moderation:
+                aggregate.messages_awaiting_moderation.add(self.message_id)
+
+    def approve_message(
+        self, board: MessageBoard, message_id: int, approver_id: UUID
+    ) -> None:
+        """
+        Approve a message awaiting moderation in this partition of a board
+        """
+        board._assert_user_is_admin(approver_id, "Only admins can moderate messages")
+        self._assert_message_is_awaiting_moderation(message_id)
+        self.trigger_event(
+            self.MessageApprovedEvent,
+            message_id=message_id,
+            board_id=self.board_id,
+            partitions=self.partitions,
+        )
+
+    class MessageApprovedEvent(MessageBoard.MessageApprovedEvent):
+        board_id: UUID
+        partitions: int
+
+    def reject_message(
+        self, board: MessageBoard, message_id: int, rejecter_id: UUID
+    ) -> None:
+        """
+        Reject a message awaiting moderation in this partition of a board
+        """
+        board._assert_user_is_admin(rejecter_id, "Only admins can moderate messages")
+        self._assert_message_is_awaiting_moderation(message_id)
+        self.trigger_event(
+            self.MessageRejectedEvent,
+            message_id=message_id,
+            board_id=self.board_id,
+            partitions=self.partitions,
+        )
+
+    class MessageRejectedEvent(MessageBoard.MessageRejectedEvent):
+        board_id: UUID
+        partitions: int
+
+    def _assert_message_is_published(self, message_id: int) -> None:
+        if not (
+            self.first_message_id(self.index, self.partitions)
+            <= message_id
+            < self.next_message_id
+            and message_id not in self.messages_awaiting_moderation
+            and message_id not in self.rejected_messages
+        ):
+            raise MessageNotFoundError(f"No published message with ID {message_id} ")
+
+    def _assert_message_is_awaiting_moderation(self, message_id: int) -> None:
+        if message_id not in self.messages_awaiting_moderation:
+            raise MessageNotFoundError(
+                f"Message {message_id} is not awaiting moderation"
+            )
+
+
+# The types of the events of boards and of their partitions, for checking
+# the exact type of an event
+MESSAGE_POSTED_EVENTS = (
+    MessageBoard.MessagePostedEvent,
+    BoardPartition.MessagePostedEvent,
+)
+MESSAGE_APPROVED_EVENTS = (
+    MessageBoard.MessageApprovedEvent,
+    BoardPartition.MessageApprovedEvent,
+)
+MESSAGE_REJECTED_EVENTS = (
+    MessageBoard.MessageRejectedEvent,
+    BoardPartition.MessageRejectedEvent,
+)
+
+
+def board_id_of(domain_event: AggregateEvent) -> UUID:
+    """
+    Returns the ID of the board of an event of a board or of a partition
+    """
+    return getattr(domain_event, "board_id", domain_event.originator_id)
+
 
 class MissingFieldValueError(Exception):
     pass
@@ -164,3 +404,21 @@ class MessageNotFoundError(Exception):
 
 class PermissionDeniedError(Exception):
     pass
+
+
+class MessageIdsExhaustedError(Exception):
+    """
+    Raised when posting to a board, or a partition of a board, that has
+    given out every message ID it can
+    """
+
+
+class BoardIsPartitionedError(Exception):
+    """
+    Raised by commands that must go to the partitions of a partitioned
+    board rather than the board itself
+    """
+
+    def __init__(self, partitions: int):
+        super().__init__(f"The board has {partitions} partitions")
+        self.partitions = partitions
@@ -6,7 +6,10 @@ import pytest
 
 from messageboard.application import MessageBoards
 from messageboard.domain import (
+    MESSAGE_ID_LIMIT,
+    BoardPartition,
     MessageBoard,
+    MessageIdsExhaustedError,
     MessageNotFoundError,
     MissingFieldValueError,
     PermissionDeniedError,
@@ -83,6 +86,29 @@ def test_messages_return_incrementing_ids() -> None:
     assert app.post_message(board_id, "message text", None, USER_ID) == 2
 
 
+def test_post_message_fails_when_the_board_has_used_all_message_ids() -> None:
+    board = MessageBoard.create("Test board", ADMIN_ID)
+    board.next_message_id = MESSAGE_ID_LIMIT - 1
+    assert board.post_message("message text", None, USER_ID) == MESSAGE_ID_LIMIT - 1
+    with pytest.raises(MessageIdsExhaustedError):
+        board.post_message("message text", None, USER_ID)
+
+
+def test_post_message_fails_when_a_partition_has_used_its_message_ids() -> None:
+    board = MessageBoard.create("Test board", ADMIN_ID, partitions=2)
+    first, second = (BoardPartition.create(board.id, i, 2) for i in range(2))
+    last_id = BoardPartition.first_message_id(1, 2) - 1
+    first.next_message_id = last_id
+    assert first.post_message(board, "message text", None, USER_ID) == last_id
+    with pytest.raises(MessageIdsExhaustedError):
+        first.post_message(board, "message text", None, USER_ID)
+    # The IDs of the next partition are left to it
+    assert second.post_message(board, "message text", None, USER_ID) == last_id + 1
+    second.next_message_id = MESSAGE_ID_LIMIT
+    with pytest.raises(MessageIdsExhaustedError):
+        second.post_message(board, "message text", None, USER_ID)
+
+
 def test_moderate_user_as_admin() -> None:
     app = MessageBoards()
     board_id = app.create_message_board("Test board", ADMIN_ID)
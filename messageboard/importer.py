@@ -0,0 +1,316 @@
+"""
+Imports the boards and posts of another forum from a JSONL or CSV export,
+and then catches up the projections with everything imported.
+
+Each record of the export is a post, with the fields ``board`` (the key of
+the board in the export), ``board_name``, ``admin`` (the user who created
+the board), ``post`` (the key of the post), ``author``, ``reply_to`` (the
+key of the post replied to, if any) and ``text``. The records of a board
+must be together, and a post can only reply to an earlier post on its
+board. Board IDs are derived from the board keys, and user IDs from the
+user keys unless they are UUIDs already, so an export can be imported
+again, or alongside boards created here.
+
+Records are read one at a time, and the posts to a board are saved in
+batches of ``--batch-size`` events without loading the board, so memory
+is bounded by the keys of the posts on the largest board. Records that
+can't be imported, such as posts without text or replies to unknown
+posts, are skipped and counted.
+
+Every second, the number of the record after the last board imported is
+written to the ``--progress`` file, so an interrupted import starts again
+from around the board it was importing. The posts of boards that were
+saved before the import stopped are posted again in memory, which gives
+them the same message IDs, and only the posts after them are saved. The
+projections aren't run while importing, and catch up with all of the
+imported events at the end.
+
+Usage: python -m messageboard.importer export.jsonl [--progress import.json]
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from itertools import chain, groupby, islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+)
+from uuid import NAMESPACE_URL, UUID, uuid5
+
+from messageboard.application import MessageBoards
+from messageboard.domain import (
+    MessageBoard,
+    MessageNotFoundError,
+    MissingFieldValueError,
+)
+from messageboard.projections.projection import Projection
+from messageboard.projections.rebuild import PROJECTIONS
+
+IMPORT_NAMESPACE = uuid5(NAMESPACE_URL, "messageboard:import")
+DEFAULT_BATCH_SIZE = 1000
+REPORT_INTERVAL = 5.0
+PROGRESS_INTERVAL = 1.0
+FIELDS = ("board", "board_name", "admin", "post", "author", "reply_to", "text")
+
+
+class ImportRecord(NamedTuple):
+    """
+    A post from an export, and its position in the export
+    """
+
+    number: int
+    board: str
+    board_name: str
+    admin: str
+    post: str
+    author: str
+    reply_to: str
+    text: str
+
+
+class ImportProgress:
+    """
+    The number of records read, boards and posts imported, and records
+    skipped so far
+    """
+
+    __slots__ = ("records", "boards", "posts", "skipped", "started")
+
+    def __init__(self) -> None:
+        self.records = 0
+        self.boards = 0
+        self.posts = 0
+        self.skipped = 0
+        self.started = time.perf_counter()
+
+    @property
+    def records_per_second(self) -> float:
+        return self.records / max(time.perf_counter() - self.started, 1e-9)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.records:,} records, {self.boards:,} boards, "
+            f"{self.posts:,} posts, {self.skipped:,} skipped "
+            f"({self.records_per_second:,.0f} records/s)"
+        )
+
+
+def read_records(path: str, start: int = 0) -> Iterator[ImportRecord]:
+    """
+    Yields the records of a JSONL or CSV export, picked by the file's
+    extension, from record number ``start``
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        rows: Iterator[Dict[str, Any]]
+        if path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for number, row in enumerate(islice(rows, start, None), start):
+            yield ImportRecord(number, *(str(row.get(field) or "") for field in FIELDS))
+
+
+def board_id_for(key: str) -> UUID:
+    return uuid5(IMPORT_NAMESPACE, f"board:{key}")
+
+
+def user_id_for(key: str) -> UUID:
+    try:
+        return UUID(key)
+    except ValueError:
+        return uuid5(IMPORT_NAMESPACE, f"user:{key}")
+
+
+class BoardImporter:
+    """
+    Imports the records of an export into an application's store, and
+    reports its progress every ``REPORT_INTERVAL`` seconds
+    """
+
+    def __init__(
+        self,
+        app: MessageBoards,
+        progress_path: Optional[str] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        report: Optional[Callable[[ImportProgress], None]] = None,
+    ) -> None:
+        self.app = app
+        self.progress_path = progress_path
+        self.batch_size = batch_size
+        self.report = report
+        self.progress = ImportProgress()
+        # Boards imported before are found before new boards, so once a new
+        # board has been imported, a board found in the store was imported
+        # earlier in this run
+        self._imported_new_board = False
+
+    def start(self) -> int:
+        """
+        Returns the number of the record to start importing from
+        """
+        if self.progress_path is None or not os.path.exists(self.progress_path):
+            return 0
+        with open(self.progress_path) as f:
+            return int(json.load(f)["board_start"])
+
+    def run(self, records: Iterable[ImportRecord]) -> ImportProgress:
+        last_report = last_save = time.perf_counter()
+        board_start = None
+        for key, board_records in groupby(records, key=lambda record: record.board):
+            board_start = self._import_board(key, board_records)
+            now = time.perf_counter()
+            # Progress is only saved now and then, as starting again from an
+            # earlier board only costs posting its messages in memory again
+            if now - last_save >= PROGRESS_INTERVAL:
+                self._save_progress(board_start)
+                last_save = now
+            if self.report is not None and now - last_report >= REPORT_INTERVAL:
+                self.report(self.progress)
+                last_report = now
+        if board_start is not None:
+            self._save_progress(board_start)
+        return self.progress
+
+    def _import_board(self, key: str, records: Iterator[ImportRecord]) -> int:
+        """
+        Imports the records of one board. Returns the number of the record
+        after them.
+        """
+        progress = self.progress
+        first = next(records)
+        board_id = board_id_for(key)
+        try:
+            board = MessageBoard.create(
+                first.board_name, user_id_for(first.admin), board_id=board_id
+            )
+        except MissingFieldValueError:
+            skipped = 1 + sum(1 for _ in records)
+            progress.records += skipped
+            progress.skipped += skipped
+            return first.number + skipped
+        progress.boards += 1
+        # The events saved by an earlier import of the board are made again
+        # in memory and dropped, rather than saved again
+        saved_version = self._saved_version(board_id)
+        if not saved_version:
+            self._imported_new_board = True
+        elif self._imported_new_board:
+            raise ValueError(f"The records of board {key!r} are not together")
+        message_ids: Dict[str, int] = {}
+        number = first.number
+        for record in chain([first], records):
+            number = record.number
+            progress.records += 1
+            self._import_post(board, record, message_ids)
+            if board.version <= saved_version:
+                board.collect_events()
+            elif len(board.pending_events) >= self.batch_size:
+                self.app.save(board)
+        if board.version < saved_version:
+            raise ValueError(f"Board {key!r} has fewer posts than when imported before")
+        if board.pending_events:
+            self.app.save(board)
+        return number + 1
+
+    def _import_post(
+        self, board: MessageBoard, record: ImportRecord, message_ids: Dict[str, int]
+    ) -> None:
+        reply_to: Optional[int] = None
+        if record.reply_to:
+            reply_to = message_ids.get(record.reply_to)
+            if reply_to is None:
+                self.progress.skipped += 1
+                return
+        try:
+            message_id = board.post_message(
+                record.text, reply_to, user_id_for(record.author)
+            )
+        except (MissingFieldValueError, MessageNotFoundError):
+            self.progress.skipped += 1
+            return
+        self.progress.posts += 1
+        if record.post:
+            message_ids[record.post] = message_id
+
+    def _saved_version(self, board_id: UUID) -> int:
+        events = self.app.recorder.select_events(board_id, desc=True, limit=1)
+        return events[0].originator_version if events else 0
+
+    def _save_progress(self, board_start: int) -> None:
+        if self.progress_path is None:
+            return
+        # The file is replaced, so it is never left half written
+        temporary_path = self.progress_path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({"board_start": board_start}, f)
+        os.replace(temporary_path, self.progress_path)
+
+
+def catch_up(
+    message_boards: MessageBoards,
+    projection_classes: Iterable[Type[Projection]],
+) -> Iterator[Tuple[str, int, float]]:
+    """
+    Catches up each projection with the notification log of the given
+    application, and saves a checkpoint. Yields the name of each projection,
+    the number of notifications it processed and the time it took.
+    """
+    name = MessageBoards.__name__
+    for projection_cls in projection_classes:
+        projection = projection_cls()
+        projection.follow(name, message_boards.log, catch_up=False)
+        position = projection.positions.get(name, 0)
+        start = time.perf_counter()
+        projection.pull_and_process(name)
+        projection.save_checkpoint()
+        yield (
+            projection_cls.__name__,
+            projection.positions.get(name, 0) - position,
+            time.perf_counter() - start,
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("export", help="JSONL file, or CSV file ending in .csv")
+    parser.add_argument("--progress", help="file to resume the import from")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        "--no-catch-up",
+        action="store_true",
+        help="leave the projections to catch up when they are next run",
+    )
+    args = parser.parse_args(argv)
+
+    importer = BoardImporter(
+        MessageBoards(),
+        progress_path=args.progress,
+        batch_size=args.batch_size,
+        report=lambda progress: print(progress, file=sys.stderr),
+    )
+    start = importer.start()
+    if start:
+        print(f"Resuming from record {start:,}", file=sys.stderr)
+    progress = importer.run(read_records(args.export, start))
+    print(f"Imported {progress}")
+    if args.no_catch_up:
+        return
+    for name, notifications, seconds in catch_up(importer.app, PROJECTIONS.values()):
+        rate = notifications / max(seconds, 1e-9)
+        print(f"Caught up {name} with {notifications:,} events ({rate:,.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
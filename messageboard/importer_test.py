@@ -0,0 +1,168 @@
+import csv
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import pytest
+
+from messageboard.application import MessageBoards
+from messageboard.importer import (
+    FIELDS,
+    BoardImporter,
+    board_id_for,
+    catch_up,
+    main,
+    read_records,
+    user_id_for,
+)
+from messageboard.projections.posts_by_user_index import PostsByUserIndex
+from messageboard.projections.posts_repo import PostRepository
+from messageboard.projections.rebuild import PROJECTIONS
+
+ADMIN_KEY = "admin"
+USER_KEY = "alice"
+
+
+@pytest.fixture(autouse=True)
+def sqlite_stores(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    monkeypatch.setenv("INFRASTRUCTURE_FACTORY", "eventsourcing.sqlite:Factory")
+    for name in [MessageBoards.__name__, *PROJECTIONS]:
+        name = name.upper()
+        monkeypatch.setenv(f"{name}_SQLITE_DBNAME", str(tmp_path / f"{name}.db"))
+    yield
+
+
+def export(boards: int = 2, posts: int = 5) -> List[Dict[str, Any]]:
+    rows = []
+    for board in range(boards):
+        for post in range(posts):
+            rows.append(
+                {
+                    "board": f"b{board}",
+                    "board_name": f"Board {board}",
+                    "admin": ADMIN_KEY,
+                    "post": f"p{board}-{post}",
+                    "author": USER_KEY,
+                    "reply_to": f"p{board}-{post - 1}" if post else None,
+                    "text": f"Post {post}",
+                }
+            )
+    return rows
+
+
+def write_jsonl(path: Path, rows: List[Dict[str, Any]]) -> str:
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+    return str(path)
+
+
+def test_export_is_imported_and_projections_catch_up(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    rows = export()
+    rows.insert(3, dict(rows[3], post="empty", text=""))
+    rows.insert(4, dict(rows[4], post="orphan", reply_to="missing"))
+    path = write_jsonl(tmp_path / "export.jsonl", rows)
+
+    main([path])
+
+    out = capsys.readouterr().out
+    assert "Imported 12 records, 2 boards, 10 posts, 2 skipped" in out
+    assert "Caught up PostRepository with 14 events" in out
+    app = MessageBoards()
+    board = app.repository.get(board_id_for("b1"))
+    assert board.next_message_id == 5
+    assert board.admin_user_ids == {user_id_for(ADMIN_KEY)}
+    # The projections restore the checkpoints saved by the catch-up
+    repo = PostRepository()
+    repo.follow(MessageBoards.__name__, app.log)
+    index = PostsByUserIndex()
+    index.follow(MessageBoards.__name__, app.log)
+    post = repo.get_post(board_id_for("b0"), 3)
+    assert post is not None
+    assert post.test == "Post 3"
+    assert [reply.test for reply in post.replies] == ["Post 4"]
+    assert index.count_posts_for_user(user_id_for(USER_KEY)) == 10
+
+
+def test_csv_export_is_read_like_jsonl(tmp_path: Path) -> None:
+    rows = export()
+    with open(tmp_path / "export.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    jsonl_path = write_jsonl(tmp_path / "export.jsonl", rows)
+
+    csv_records = list(read_records(str(tmp_path / "export.csv"), start=3))
+    assert csv_records == list(read_records(jsonl_path, start=3))
+    assert csv_records[0].number == 3
+    assert csv_records[0].reply_to == "p0-2"
+
+
+def test_posts_are_saved_in_batches(tmp_path: Path) -> None:
+    app = MessageBoards()
+    inserted_batches = []
+    insert_events = app.recorder.insert_events
+
+    def record_batch(stored_events, **kwargs):  # type: ignore
+        inserted_batches.append(len(stored_events))
+        insert_events(stored_events, **kwargs)
+
+    app.recorder.insert_events = record_batch  # type: ignore
+    path = write_jsonl(tmp_path / "export.jsonl", export(boards=1, posts=10))
+
+    BoardImporter(app, batch_size=4).run(read_records(path))
+
+    # Creating the board adds 2 events
+    assert inserted_batches == [4, 4, 4]
+
+
+def test_interrupted_import_is_resumed(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = write_jsonl(tmp_path / "export.jsonl", export(boards=3, posts=10))
+    progress_path = str(tmp_path / "progress.json")
+    app = MessageBoards()
+    save = app.save
+    saves: List[int] = []
+
+    def save_then_crash(*aggregates: Any) -> None:
+        save(*aggregates)
+        saves.append(1)
+        if len(saves) == 5:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(app, "save", save_then_crash)
+    monkeypatch.setattr("messageboard.importer.PROGRESS_INTERVAL", 0)
+    importer = BoardImporter(app, progress_path, batch_size=4)
+    with pytest.raises(KeyboardInterrupt):
+        importer.run(read_records(path, importer.start()))
+
+    importer = BoardImporter(MessageBoards(), progress_path, batch_size=3)
+    assert importer.start() == 10
+    progress = importer.run(read_records(path, importer.start()))
+
+    assert (progress.boards, progress.posts) == (2, 20)
+    app = MessageBoards()
+    for key in ("b0", "b1", "b2"):
+        board = app.repository.get(board_id_for(key))
+        assert board.next_message_id == 10
+        assert board.version == 12
+    assert importer.start() == 30
+
+
+def test_records_of_a_board_must_be_together(tmp_path: Path) -> None:
+    rows = export(boards=2, posts=2)
+    path = write_jsonl(tmp_path / "export.jsonl", rows + rows[:1])
+
+    with pytest.raises(ValueError, match="'b0' are not together"):
+        BoardImporter(MessageBoards()).run(read_records(path))
+
+
+def test_projections_catch_up_with_the_imported_store(tmp_path: Path) -> None:
+    app = MessageBoards(env={"PERSISTENCE_MODE": "memory"})
+    path = write_jsonl(tmp_path / "export.jsonl", export(boards=1, posts=3))
+    BoardImporter(app).run(read_records(path))
+
+    ((name, notifications, _),) = catch_up(app, [PostRepository])
+
+    assert (name, notifications) == (PostRepository.__name__, 5)
@@ -0,0 +1,99 @@
+from array import array
+from bisect import bisect_right
+from typing import Any, Iterable, Iterator, List, MutableSet, Optional
+
+
+class IntRangeSet(MutableSet[int]):
+    """
+    Set of integers stored as sorted, disjoint, half-open ranges.
+
+    The ranges are kept as a flat array of boundaries ``[start0, end0, start1,
+    end1, ...]``, so a run of consecutive integers costs 16 bytes however
+    long it is, and an integer is a member when an odd number of boundaries
+    are less than or equal to it. Membership is O(log n) in the number of
+    ranges. Adding the next integer after the highest member is O(1).
+    """
+
+    def __init__(self, values: Optional[Iterable[int]] = None):
+        self._bounds = array("q")
+        self._len = 0
+        if values is not None:
+            for value in sorted(values):
+                self.add(value)
+
+    @classmethod
+    def from_bounds(cls, bounds: Iterable[int]) -> "IntRangeSet":
+        """
+        Reconstruct a set from the boundaries returned by :func:`bounds`
+        """
+        int_set = cls()
+        int_set._bounds = array("q", bounds)
+        int_set._len = sum(
+            int_set._bounds[i + 1] - int_set._bounds[i]
+            for i in range(0, len(int_set._bounds), 2)
+        )
+        return int_set
+
+    def __copy__(self) -> "IntRangeSet":
+        int_set = self.__class__()
+        int_set._bounds = array("q", self._bounds)
+        int_set._len = self._len
+        return int_set
+
+    def bounds(self) -> List[int]:
+        """
+        The ``[start, end)`` boundaries of the ranges, in ascending order
+        """
+        return self._bounds.tolist()
+
+    def __contains__(self, value: Any) -> bool:
+        return bisect_right(self._bounds, value) % 2 == 1
+
+    def __iter__(self) -> Iterator[int]:
+        bounds = self._bounds
+        for i in range(0, len(bounds), 2):
+            yield from range(bounds[i], bounds[i + 1])
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, value: int) -> None:
+        bounds = self._bounds
+        i = bisect_right(bounds, value)
+        if i % 2 == 1:
+            return
+        extends_previous = i > 0 and bounds[i - 1] == value
+        extends_next = i < len(bounds) and bounds[i] == value + 1
+        if extends_previous and extends_next:
+            del bounds[i - 1 : i + 1]
+        elif extends_previous:
+            bounds[i - 1] = value + 1
+        elif extends_next:
+            bounds[i] = value
+        else:
+            bounds[i:i] = array("q", (value, value + 1))
+        self._len += 1
+
+    def discard(self, value: int) -> None:
+        bounds = self._bounds
+        i = bisect_right(bounds, value)
+        if i % 2 == 0:
+            return
+        starts_range = bounds[i - 1] == value
+        ends_range = bounds[i] == value + 1
+        if starts_range and ends_range:
+            del bounds[i - 1 : i + 1]
+        elif starts_range:
+            bounds[i - 1] = value + 1
+        elif ends_range:
+            bounds[i] = value
+        else:
+            bounds[i:i] = array("q", (value, value + 1))
+        self._len -= 1
+
+    def __repr__(self) -> str:
+        ranges = ", ".join(
+            f"{self._bounds[i]}..{self._bounds[i + 1] - 1}"
+            for i in range(0, len(self._bounds), 2)
+        )
+        return f"{self.__class__.__name__}({ranges})"
@@ -0,0 +1,78 @@
+import pytest
+
+from messageboard.intset import IntRangeSet
+
+
+def test_consecutive_values_are_stored_as_one_range() -> None:
+    int_set = IntRangeSet()
+    for value in range(5):
+        int_set.add(value)
+
+    assert int_set.bounds() == [0, 5]
+    assert len(int_set) == 5
+    assert list(int_set) == [0, 1, 2, 3, 4]
+
+
+def test_adding_a_value_between_ranges_merges_them() -> None:
+    int_set = IntRangeSet([1, 2, 4, 5])
+    assert int_set.bounds() == [1, 3, 4, 6]
+
+    int_set.add(3)
+
+    assert int_set.bounds() == [1, 6]
+    assert len(int_set) == 5
+
+
+def test_adding_an_existing_value_does_nothing() -> None:
+    int_set = IntRangeSet([1, 2, 3])
+    int_set.add(2)
+
+    assert int_set.bounds() == [1, 4]
+    assert len(int_set) == 3
+
+
+def test_removing_a_value_from_the_middle_of_a_range_splits_it() -> None:
+    int_set = IntRangeSet(range(10))
+    int_set.remove(4)
+
+    assert int_set.bounds() == [0, 4, 5, 10]
+    assert 4 not in int_set
+    assert len(int_set) == 9
+
+
+def test_removing_the_ends_of_a_range_shrinks_it() -> None:
+    int_set = IntRangeSet([3, 4, 5, 8])
+    int_set.remove(3)
+    int_set.remove(5)
+    int_set.remove(8)
+
+    assert int_set.bounds() == [4, 5]
+
+
+def test_removing_a_missing_value_raises_key_error() -> None:
+    int_set = IntRangeSet([1, 3])
+    with pytest.raises(KeyError):
+        int_set.remove(2)
+    int_set.discard(2)
+
+    assert int_set.bounds() == [1, 2, 3, 4]
+
+
+def test_membership() -> None:
+    int_set = IntRangeSet([0, 1, 2, 7, 9])
+
+    assert [value for value in range(-1, 11) if value in int_set] == [0, 1, 2, 7, 9]
+
+
+def test_equals_builtin_set_with_same_members() -> None:
+    assert IntRangeSet([5, 1, 2]) == {1, 2, 5}
+    assert {1, 2, 5} == IntRangeSet([5, 1, 2])
+    assert IntRangeSet([1, 2]) != {1, 2, 5}
+
+
+def test_can_be_rebuilt_from_bounds() -> None:
+    int_set = IntRangeSet([0, 1, 2, 7, 9, 10])
+    copy = IntRangeSet.from_bounds(int_set.bounds())
+
+    assert copy == int_set
+    assert len(copy) == 6
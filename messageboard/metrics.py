@@ -0,0 +1,200 @@
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from eventsourcing.persistence import EventStore, InfrastructureFactory
+
+# Picks the metrics sink: "none" (the default) or "memory"
+METRICS = "METRICS"
+
+Labels = Tuple[Tuple[str, str], ...]
+Key = Tuple[str, Labels]
+
+
+class Metrics:
+    """
+    Sink for counters, gauges and timings, which discards them. Callers
+    check ``enabled`` before taking any measurements, so instrumented code
+    costs next to nothing when metrics are disabled.
+    """
+
+    enabled = False
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        Adds to a counter
+        """
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        """
+        Records a duration
+        """
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        """
+        Sets a gauge to its current value
+        """
+
+
+NULL_METRICS = Metrics()
+
+
+class Summary:
+    """
+    The number, total and maximum of the durations recorded for a timing
+    """
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+class InMemoryMetrics(Metrics):
+    """
+    Keeps metrics in memory, to be read by tests and benchmarks or exported
+    in the Prometheus text format with :func:`render_prometheus`
+    """
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[Key, float] = {}
+        self._gauges: Dict[Key, float] = {}
+        self._summaries: Dict[Key, Summary] = {}
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = Summary()
+            summary.add(seconds)
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def counter(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def gauge(self, name: str, **labels: str) -> Optional[float]:
+        with self._lock:
+            return self._gauges.get((name, tuple(sorted(labels.items()))))
+
+    def summary(self, name: str, **labels: str) -> Summary:
+        with self._lock:
+            summary = self._summaries.get((name, tuple(sorted(labels.items()))))
+            return Summary() if summary is None else summary
+
+    def render_prometheus(self) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format. Timings
+        are exported as summaries in seconds, without quantiles.
+        """
+        lines: List[str] = []
+        with self._lock:
+            for metric_type, metrics in (
+                ("counter", self._counters),
+                ("gauge", self._gauges),
+            ):
+                for name, samples in _by_name(metrics).items():
+                    lines.append(f"# TYPE {name} {metric_type}")
+                    for labels, value in samples:
+                        lines.append(f"{name}{_format_labels(labels)} {value!r}")
+            for name, summaries in _by_name(self._summaries).items():
+                lines.append(f"# TYPE {name} summary")
+                for labels, summary in summaries:
+                    formatted = _format_labels(labels)
+                    lines.append(f"{name}_count{formatted} {summary.count}")
+                    lines.append(f"{name}_sum{formatted} {summary.total!r}")
+        return "\n".join(lines) + "\n"
+
+
+def _by_name(metrics: Dict[Key, Any]) -> Dict[str, List[Tuple[Labels, Any]]]:
+    by_name: Dict[str, List[Tuple[Labels, Any]]] = {}
+    for (name, labels), value in sorted(metrics.items(), key=lambda item: item[0]):
+        by_name.setdefault(name, []).append((labels, value))
+    return by_name
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+_shared_metrics: Optional[InMemoryMetrics] = None
+_shared_metrics_lock = threading.Lock()
+
+
+def shared_metrics() -> InMemoryMetrics:
+    """
+    Returns the in-memory sink shared by the applications in this process
+    that are configured with ``METRICS=memory``, so the applications that a
+    runner constructs report to one place
+    """
+    global _shared_metrics
+    with _shared_metrics_lock:
+        if _shared_metrics is None:
+            _shared_metrics = InMemoryMetrics()
+        return _shared_metrics
+
+
+def construct_metrics(factory: InfrastructureFactory) -> Metrics:
+    """
+    Returns the metrics sink picked by an application's ``METRICS`` setting
+    """
+    setting = (factory.getenv(METRICS) or "none").lower()
+    if setting == "none":
+        return NULL_METRICS
+    if setting == "memory":
+        return shared_metrics()
+    raise EnvironmentError(
+        f"Invalid value '{setting}' for '{METRICS}', expected 'none' or 'memory'"
+    )
+
+
+class CountingEventStore(EventStore[Any]):
+    """
+    Event store that counts the events each thread gets from it, so the
+    events replayed to load an aggregate can be counted
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._local = threading.local()
+
+    def get(self, *args: Any, **kwargs: Any) -> Iterator[Any]:
+        return self._count(super().get(*args, **kwargs))
+
+    def _count(self, events: Iterator[Any]) -> Iterator[Any]:
+        local = self._local
+        for event in events:
+            local.count = getattr(local, "count", 0) + 1
+            yield event
+
+    def count(self) -> int:
+        """
+        Returns the number of events the current thread has got
+        """
+        return getattr(self._local, "count", 0)
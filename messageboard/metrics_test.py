@@ -0,0 +1,124 @@
+from uuid import uuid4
+
+import pytest
+from eventsourcing.system import System
+
+from messageboard.application import COMMAND_PHASE_SECONDS, MessageBoards
+from messageboard.domain import MissingFieldValueError
+from messageboard.metrics import (
+    NULL_METRICS,
+    CountingEventStore,
+    InMemoryMetrics,
+    shared_metrics,
+)
+from messageboard.projections.posts_by_user_index import PostsByUserIndex
+from messageboard.system import ThreadedRunner
+
+ADMIN_ID = uuid4()
+USER_ID = uuid4()
+
+
+def test_metrics_are_rendered_in_prometheus_text_format() -> None:
+    metrics = InMemoryMetrics()
+    metrics.increment("posts_total", board="a")
+    metrics.increment("posts_total", 2, board="a")
+    metrics.increment("posts_total", board='"b"')
+    metrics.set_gauge("lag", 5)
+    metrics.observe("load_seconds", 0.5, phase="load")
+    metrics.observe("load_seconds", 0.25, phase="load")
+
+    assert metrics.counter("posts_total", board="a") == 3
+    assert metrics.summary("load_seconds", phase="load").max == 0.5
+    assert metrics.render_prometheus() == (
+        "# TYPE posts_total counter\n"
+        'posts_total{board="\\"b\\""} 1\n'
+        'posts_total{board="a"} 3\n'
+        "# TYPE lag gauge\n"
+        "lag 5\n"
+        "# TYPE load_seconds summary\n"
+        'load_seconds_count{phase="load"} 2\n'
+        'load_seconds_sum{phase="load"} 0.75\n'
+    )
+
+
+def test_metrics_are_disabled_by_default() -> None:
+    app = MessageBoards()
+    assert app.metrics is NULL_METRICS
+    assert not isinstance(app.events, CountingEventStore)
+    assert PostsByUserIndex().metrics is NULL_METRICS
+
+
+def test_command_phases_are_timed() -> None:
+    metrics = InMemoryMetrics()
+    app = MessageBoards(metrics=metrics)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.post_message(board_id, "first", None, USER_ID)
+    app.post_message(board_id, "second", None, USER_ID)
+    with pytest.raises(MissingFieldValueError):
+        app.post_message(board_id, "", None, USER_ID)
+
+    for phase in ("load", "decide", "save"):
+        assert metrics.summary(COMMAND_PHASE_SECONDS, phase=phase).count >= 2
+    assert metrics.summary(COMMAND_PHASE_SECONDS, phase="load").count == 3
+    assert metrics.counter("messageboard_commands_total") == 2
+    # The board had 2, 3 and then 4 events when it was loaded
+    assert metrics.counter("messageboard_events_replayed_total") == 9
+
+
+def test_projections_time_events_by_type() -> None:
+    app = MessageBoards()
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.post_messages(board_id, [("first", None, USER_ID), ("second", 0, USER_ID)])
+
+    metrics = InMemoryMetrics()
+    index = PostsByUserIndex(env={"PROCESSING_BATCH_SIZE": "3"}, metrics=metrics)
+    index.follow(MessageBoards.__name__, app.log)
+    index.pull_and_process(MessageBoards.__name__)
+
+    posted = "MessageBoard.MessagePostedEvent"
+    labels = {"projection": "PostsByUserIndex"}
+    assert metrics.summary("messageboard_projection_batch_seconds", **labels).count
+    assert (
+        metrics.summary(
+            "messageboard_projection_event_seconds", event=posted, **labels
+        ).count
+        == 1
+    )
+    assert (
+        metrics.counter("messageboard_projection_events_total", event=posted, **labels)
+        == 2
+    )
+    assert (
+        metrics.gauge(
+            "messageboard_projection_position", leader="MessageBoards", **labels
+        )
+        == 4
+    )
+
+
+def test_metrics_can_be_configured_by_the_environment(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("METRICS", "memory")
+    metrics = shared_metrics()
+    runner = ThreadedRunner(System(pipes=[[MessageBoards, PostsByUserIndex]]))
+    runner.start()
+    try:
+        message_boards = runner.get(MessageBoards)
+        assert message_boards.metrics is metrics
+        assert runner.get(PostsByUserIndex).metrics is metrics
+        board_id = message_boards.create_message_board("Test board", ADMIN_ID)
+        message_boards.post_message(board_id, "hello", None, USER_ID)
+        runner.wait_for(PostsByUserIndex, timeout=5)
+        runner.lags()
+        lag = metrics.gauge(
+            "messageboard_projection_lag",
+            projection="PostsByUserIndex",
+            leader="MessageBoards",
+        )
+        assert lag == 0
+    finally:
+        runner.stop()
+
+    with pytest.raises(EnvironmentError):
+        MessageBoards(env={"METRICS": "statsd"}).metrics
@@ -0,0 +1,369 @@
+import os
+import sqlite3
+import threading
+from sqlite3 import Connection
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Type
+from uuid import UUID
+
+from eventsourcing import popo
+from eventsourcing import sqlite as es_sqlite
+from eventsourcing.persistence import (
+    AggregateRecorder,
+    InfrastructureFactory,
+    RecordConflictError,
+    StoredEvent,
+)
+from eventsourcing.sqlite import SQLiteAggregateRecorder, SQLiteDatastore
+from eventsourcing.utils import resolve_topic
+
+# Picks the store by name, rather than by factory topic
+PERSISTENCE_MODE = "PERSISTENCE_MODE"
+
+JOURNAL_MODES = ("delete", "truncate", "persist", "memory", "wal", "off")
+SYNCHRONOUS_SETTINGS = ("off", "normal", "full", "extra")
+
+
+def getenv(env: Mapping[str, str], application_name: str, key: str) -> Optional[str]:
+    """
+    Returns the value of a setting for an application from a mapping of
+    settings, or else from the environment. The key prefixed with the
+    application name is preferred, as in :func:`InfrastructureFactory.getenv`.
+    """
+    names = (application_name.upper() + "_" + key, key)
+    for name in names:
+        if name in env:
+            return env[name]
+    for name in names:
+        value = os.getenv(name)
+        if value is not None:
+            return value
+    return None
+
+
+class ConfiguredFactory(InfrastructureFactory):
+    """
+    Infrastructure factory that reads its settings from a mapping given to
+    the application's constructor before the environment
+    """
+
+    def __init__(self, application_name: str, env: Optional[Mapping[str, str]] = None):
+        self.env: Mapping[str, str] = env or {}
+        super().__init__(application_name)
+
+    def getenv(
+        self, key: str, default: Optional[str] = None, application_name: str = ""
+    ) -> Optional[str]:
+        value = getenv(self.env, application_name or self.application_name, key)
+        return default if value is None else value
+
+    def checkpoint_recorder(self) -> AggregateRecorder:
+        """
+        Returns the recorder for projection checkpoints. Stores that support
+        it keep only the latest checkpoint of each projection.
+        """
+        return self.aggregate_recorder(purpose="checkpoints")
+
+
+class MemoryCheckpointRecorder(AggregateRecorder):
+    """
+    Keeps the latest checkpoint of each projection in memory. A checkpoint
+    replaces the previous one, and must have a higher version.
+    """
+
+    def __init__(self) -> None:
+        self._latest: Dict[UUID, StoredEvent] = {}
+        self._lock = threading.Lock()
+
+    def insert_events(self, stored_events: List[StoredEvent], **kwargs: Any) -> None:
+        with self._lock:
+            latest = dict(self._latest)
+            for stored_event in stored_events:
+                previous = latest.get(stored_event.originator_id)
+                if (
+                    previous is not None
+                    and previous.originator_version >= stored_event.originator_version
+                ):
+                    raise RecordConflictError(
+                        f"Checkpoint version {stored_event.originator_version} "
+                        f"is not after version {previous.originator_version}"
+                    )
+                latest[stored_event.originator_id] = stored_event
+            self._latest = latest
+
+    def select_events(
+        self,
+        originator_id: UUID,
+        gt: Optional[int] = None,
+        lte: Optional[int] = None,
+        desc: bool = False,
+        limit: Optional[int] = None,
+    ) -> List[StoredEvent]:
+        with self._lock:
+            stored_event = self._latest.get(originator_id)
+        if (
+            stored_event is None
+            or (gt is not None and stored_event.originator_version <= gt)
+            or (lte is not None and stored_event.originator_version > lte)
+            or limit == 0
+        ):
+            return []
+        return [stored_event]
+
+
+class MemoryFactory(ConfiguredFactory, popo.Factory):
+    """
+    Keeps events in memory
+    """
+
+    def checkpoint_recorder(self) -> AggregateRecorder:
+        return MemoryCheckpointRecorder()
+
+
+class ThreadLocalSQLiteDatastore(SQLiteDatastore):
+    """
+    SQLite datastore that gives each thread its own connection, as the
+    library's datastore does, and caches the connections of threads that
+    have ended, so short-lived threads don't each open a connection.
+
+    This is a cache, not a pool: every thread that uses the datastore has a
+    connection open, however many threads there are. A thread gives its
+    connection back when it calls :meth:`release_connection`, or else when
+    it ends. At most ``max_idle`` connections that no thread holds are kept
+    open. Each connection is opened with the given journal mode, synchronous
+    setting and busy timeout in milliseconds.
+    """
+
+    def __init__(
+        self,
+        db_name: str,
+        max_idle: int,
+        journal_mode: str,
+        synchronous: str,
+        busy_timeout: int,
+    ):
+        super().__init__(db_name)
+        self.max_idle = max_idle
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self.opened = 0
+        self._idle: List[Connection] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def get_connection(self) -> Connection:
+        lease: Optional[ConnectionLease] = getattr(self._local, "lease", None)
+        if lease is None:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                connection = self.create_connection()
+            lease = self._local.lease = ConnectionLease(self, connection)
+        return lease.connection
+
+    def create_connection(self) -> Connection:
+        connection = sqlite3.connect(
+            database=self.db_name,
+            uri=True,
+            check_same_thread=False,
+            isolation_level=None,  # Auto-commit mode, as the library's
+            cached_statements=True,
+        )
+        connection.row_factory = sqlite3.Row
+        connection.execute(f"pragma journal_mode={self.journal_mode};")
+        connection.execute(f"pragma synchronous={self.synchronous};")
+        connection.execute(f"pragma busy_timeout={self.busy_timeout};")
+        with self._lock:
+            self.opened += 1
+        return connection
+
+    def release_connection(self) -> None:
+        """
+        Gives back the connection of the current thread, if it has one,
+        for a long-lived thread that has stopped using the datastore
+        """
+        lease: Optional[ConnectionLease] = getattr(self._local, "lease", None)
+        if lease is not None:
+            del self._local.lease
+            lease.release()
+
+    def release(self, connection: Connection) -> None:
+        """
+        Keeps a connection that no thread holds, or closes it if ``max_idle``
+        connections are kept already
+        """
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def idle_connections(self) -> int:
+        with self._lock:
+            return len(self._idle)
+
+
+class ConnectionLease:
+    """
+    Holds a thread's connection in thread-local storage, and gives it back
+    to the datastore when it is released, or when the thread ends and its
+    storage is cleared
+    """
+
+    __slots__ = ("datastore", "connection", "released")
+
+    def __init__(self, datastore: ThreadLocalSQLiteDatastore, connection: Connection):
+        self.datastore = datastore
+        self.connection = connection
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.datastore.release(self.connection)
+
+    def __del__(self) -> None:
+        self.release()
+
+
+class SQLiteCheckpointRecorder(SQLiteAggregateRecorder):
+    """
+    Records projection checkpoints, and deletes the earlier checkpoints of
+    a projection in the transaction that inserts its new one, so each
+    projection only ever has one checkpoint stored
+    """
+
+    def __init__(
+        self, datastore: SQLiteDatastore, events_table_name: str = "stored_checkpoints"
+    ):
+        super().__init__(datastore, events_table_name)
+        self.delete_earlier_events_statement = (
+            f"DELETE FROM {self.events_table_name} "
+            "WHERE originator_id=? AND originator_version<?"
+        )
+
+    def _insert_events(
+        self, c: Connection, stored_events: List[StoredEvent], **kwargs: Any
+    ) -> None:
+        super()._insert_events(c, stored_events, **kwargs)
+        latest: Dict[UUID, int] = {}
+        for stored_event in stored_events:
+            latest[stored_event.originator_id] = max(
+                stored_event.originator_version,
+                latest.get(stored_event.originator_id, 0),
+            )
+        c.executemany(
+            self.delete_earlier_events_statement,
+            [(originator_id.hex, version) for originator_id, version in latest.items()],
+        )
+
+
+class SQLiteFactory(ConfiguredFactory, es_sqlite.Factory):
+    """
+    Keeps events in an SQLite database, named by ``SQLITE_DBNAME``. Pass a
+    URI such as ``file:boards?mode=memory&cache=shared`` for a database in
+    memory that all connections share.
+
+    Each thread has its own connection, and the connections of threads
+    that have ended are reused (see :class:`ThreadLocalSQLiteDatastore`).
+    Connections are set up with these settings:
+
+    - ``SQLITE_MAX_IDLE_CONNECTIONS``, the number of connections that no
+      thread holds to keep open
+    - ``SQLITE_JOURNAL_MODE``, WAL by default so readers don't block writers
+    - ``SQLITE_SYNCHRONOUS``, FULL by default; NORMAL is durable across
+      crashes of the process in WAL mode, but not across power loss
+    - ``SQLITE_BUSY_TIMEOUT``, in milliseconds
+    """
+
+    SQLITE_MAX_IDLE_CONNECTIONS = "SQLITE_MAX_IDLE_CONNECTIONS"
+    DEFAULT_SQLITE_MAX_IDLE_CONNECTIONS = 4
+    SQLITE_JOURNAL_MODE = "SQLITE_JOURNAL_MODE"
+    DEFAULT_SQLITE_JOURNAL_MODE = "wal"
+    SQLITE_SYNCHRONOUS = "SQLITE_SYNCHRONOUS"
+    DEFAULT_SQLITE_SYNCHRONOUS = "full"
+    SQLITE_BUSY_TIMEOUT = "SQLITE_BUSY_TIMEOUT"
+    DEFAULT_SQLITE_BUSY_TIMEOUT = 5000
+
+    def __init__(self, application_name: str, env: Optional[Mapping[str, str]] = None):
+        super().__init__(application_name, env)
+        journal_mode = self._getenv_choice(
+            self.SQLITE_JOURNAL_MODE, self.DEFAULT_SQLITE_JOURNAL_MODE, JOURNAL_MODES
+        )
+        synchronous = self._getenv_choice(
+            self.SQLITE_SYNCHRONOUS,
+            self.DEFAULT_SQLITE_SYNCHRONOUS,
+            SYNCHRONOUS_SETTINGS,
+        )
+        self.datastore = ThreadLocalSQLiteDatastore(
+            # The library's factory has checked the name is set
+            db_name=str(self.getenv(self.SQLITE_DBNAME)),
+            max_idle=int(
+                self.getenv(self.SQLITE_MAX_IDLE_CONNECTIONS)
+                or self.DEFAULT_SQLITE_MAX_IDLE_CONNECTIONS
+            ),
+            journal_mode=journal_mode,
+            synchronous=synchronous,
+            busy_timeout=int(
+                self.getenv(self.SQLITE_BUSY_TIMEOUT)
+                or self.DEFAULT_SQLITE_BUSY_TIMEOUT
+            ),
+        )
+
+    def checkpoint_recorder(self) -> AggregateRecorder:
+        recorder = SQLiteCheckpointRecorder(self.datastore)
+        if self.env_create_table():
+            recorder.create_table()
+        return recorder
+
+    def _getenv_choice(self, key: str, default: str, choices: Tuple[str, ...]) -> str:
+        value = (self.getenv(key) or default).lower()
+        if value not in choices:
+            raise EnvironmentError(
+                f"Invalid value '{value}' for '{key}', expected one of {choices}"
+            )
+        return value
+
+
+PERSISTENCE_MODES: Dict[str, Type[ConfiguredFactory]] = {
+    "memory": MemoryFactory,
+    "sqlite": SQLiteFactory,
+}
+
+# The library's factories are replaced with the configurable ones
+FACTORIES_BY_TOPIC: Dict[str, Type[ConfiguredFactory]] = {
+    "eventsourcing.popo:Factory": MemoryFactory,
+    "eventsourcing.sqlite:Factory": SQLiteFactory,
+}
+
+
+def construct_factory(
+    application_name: str, env: Optional[Mapping[str, str]] = None
+) -> InfrastructureFactory:
+    """
+    Constructs the infrastructure factory for an application, picked by
+    the ``PERSISTENCE_MODE`` setting ("memory" or "sqlite"), or else by
+    the library's ``INFRASTRUCTURE_FACTORY`` topic, from the given settings
+    or the environment. Either can be prefixed with the application name.
+    """
+    env = env or {}
+    mode = getenv(env, application_name, PERSISTENCE_MODE)
+    if mode:
+        factory_cls: Optional[Type[InfrastructureFactory]] = PERSISTENCE_MODES.get(
+            mode.lower()
+        )
+        if factory_cls is None:
+            raise EnvironmentError(
+                f"Invalid value '{mode}' for '{PERSISTENCE_MODE}', "
+                f"expected one of {tuple(PERSISTENCE_MODES)}"
+            )
+    else:
+        topic = (
+            getenv(env, application_name, InfrastructureFactory.TOPIC)
+            or "eventsourcing.popo:Factory"
+        )
+        factory_cls = FACTORIES_BY_TOPIC.get(topic) or resolve_topic(topic)
+    assert factory_cls is not None
+    if issubclass(factory_cls, ConfiguredFactory):
+        return factory_cls(application_name, env)
+    return factory_cls(application_name)
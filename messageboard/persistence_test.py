@@ -0,0 +1,186 @@
+import threading
+from pathlib import Path
+from typing import Dict
+from uuid import uuid4
+
+import pytest
+from eventsourcing.persistence import RecordConflictError, StoredEvent
+from eventsourcing.popo import POPOApplicationRecorder
+from eventsourcing.sqlite import SQLiteApplicationRecorder
+from eventsourcing.system import SingleThreadedRunner, System
+
+from messageboard.application import MessageBoards
+from messageboard.persistence import (
+    MemoryFactory,
+    SQLiteFactory,
+    ThreadLocalSQLiteDatastore,
+)
+from messageboard.projections.posts_by_user_index import PostsByUserIndex
+from messageboard.projections.posts_repo import PostRepository
+
+ADMIN_ID = uuid4()
+USER_ID = uuid4()
+
+
+def sqlite_env(tmp_path: Path, **settings: str) -> Dict[str, str]:
+    return {
+        "PERSISTENCE_MODE": "sqlite",
+        "SQLITE_DBNAME": str(tmp_path / "boards.db"),
+        **settings,
+    }
+
+
+def test_store_is_picked_by_persistence_mode(tmp_path: Path) -> None:
+    assert isinstance(MessageBoards().recorder, POPOApplicationRecorder)
+
+    app = MessageBoards(env=sqlite_env(tmp_path))
+    assert isinstance(app.recorder, SQLiteApplicationRecorder)
+    board_id = app.create_message_board("Test board", ADMIN_ID)
+    app.post_message(board_id, "hello", None, USER_ID)
+
+    reopened = MessageBoards(env=sqlite_env(tmp_path))
+    assert reopened.repository.get(board_id).next_message_id == 1
+
+
+def test_settings_can_be_given_for_one_application(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("MESSAGEBOARDS_PERSISTENCE_MODE", "sqlite")
+    monkeypatch.setenv("SQLITE_DBNAME", str(tmp_path / "boards.db"))
+    assert isinstance(MessageBoards().recorder, SQLiteApplicationRecorder)
+    assert isinstance(PostsByUserIndex().recorder, POPOApplicationRecorder)
+
+    app = MessageBoards(env={"PERSISTENCE_MODE": "memory"})
+    assert isinstance(app.recorder, POPOApplicationRecorder)
+
+
+def test_invalid_settings_are_rejected(tmp_path: Path) -> None:
+    with pytest.raises(EnvironmentError):
+        MessageBoards(env={"PERSISTENCE_MODE": "postgres"})
+    with pytest.raises(EnvironmentError):
+        MessageBoards(env=sqlite_env(tmp_path, SQLITE_JOURNAL_MODE="wall"))
+    with pytest.raises(EnvironmentError):
+        MessageBoards(env={"PERSISTENCE_MODE": "sqlite"})
+
+
+@pytest.mark.parametrize("store", ["memory", "sqlite"])
+def test_only_the_latest_checkpoint_is_stored(tmp_path: Path, store: str) -> None:
+    if store == "memory":
+        recorder = MemoryFactory("Projection", {}).checkpoint_recorder()
+    else:
+        recorder = SQLiteFactory(
+            "Projection", sqlite_env(tmp_path)
+        ).checkpoint_recorder()
+    checkpoint_id = uuid4()
+
+    def checkpoint(version: int) -> StoredEvent:
+        return StoredEvent(checkpoint_id, version, "checkpoint", b"state")
+
+    recorder.insert_events([checkpoint(1)])
+    recorder.insert_events([checkpoint(2)])
+    with pytest.raises(RecordConflictError):
+        recorder.insert_events([checkpoint(2)])
+
+    assert recorder.select_events(checkpoint_id) == [checkpoint(2)]
+    assert recorder.select_events(checkpoint_id, desc=True, limit=1) == [checkpoint(2)]
+
+
+def test_connections_are_set_up_by_the_settings(tmp_path: Path) -> None:
+    app = MessageBoards(
+        env=sqlite_env(
+            tmp_path,
+            SQLITE_SYNCHRONOUS="normal",
+            SQLITE_BUSY_TIMEOUT="1234",
+        )
+    )
+    assert isinstance(app.factory, SQLiteFactory)
+    connection = app.factory.datastore.get_connection()
+    assert connection.execute("pragma journal_mode").fetchone()[0] == "wal"
+    # NORMAL is 1
+    assert connection.execute("pragma synchronous").fetchone()[0] == 1
+    assert connection.execute("pragma busy_timeout").fetchone()[0] == 1234
+
+
+def test_connections_of_ended_threads_are_reused(tmp_path: Path) -> None:
+    datastore = ThreadLocalSQLiteDatastore(
+        db_name=str(tmp_path / "pool.db"),
+        max_idle=2,
+        journal_mode="wal",
+        synchronous="full",
+        busy_timeout=5000,
+    )
+
+    def query() -> None:
+        datastore.get_connection().execute("select 1")
+
+    for _ in range(5):
+        thread = threading.Thread(target=query)
+        thread.start()
+        thread.join()
+    assert datastore.opened == 1
+    assert datastore.idle_connections() == 1
+
+    barrier = threading.Barrier(4)
+
+    def query_together() -> None:
+        query()
+        barrier.wait()
+
+    threads = [threading.Thread(target=query_together) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert datastore.opened == 4
+    assert datastore.idle_connections() == 2
+
+
+def test_connections_can_be_released_before_the_thread_ends(tmp_path: Path) -> None:
+    datastore = ThreadLocalSQLiteDatastore(
+        db_name=str(tmp_path / "pool.db"),
+        max_idle=2,
+        journal_mode="wal",
+        synchronous="full",
+        busy_timeout=5000,
+    )
+    connection = datastore.get_connection()
+    datastore.release_connection()
+    assert datastore.idle_connections() == 1
+
+    def query() -> None:
+        assert datastore.get_connection() is connection
+        datastore.release_connection()
+        datastore.release_connection()
+
+    thread = threading.Thread(target=query)
+    thread.start()
+    thread.join()
+    assert datastore.opened == 1
+    assert datastore.idle_connections() == 1
+
+
+def test_system_can_run_on_sqlite(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # Runners construct the applications, so they are set up by the environment
+    for key, value in sqlite_env(tmp_path, NOTIFICATION_SECTION_SIZE="3").items():
+        monkeypatch.setenv(key, value)
+    system = System(
+        pipes=[[MessageBoards, PostRepository], [MessageBoards, PostsByUserIndex]]
+    )
+    runner = SingleThreadedRunner(system)
+    runner.start()
+    try:
+        message_boards = runner.get(MessageBoards)
+        board_id = message_boards.create_message_board("Test board", ADMIN_ID)
+        message_ids = message_boards.post_messages(
+            board_id, [(f"post {i}", None, USER_ID) for i in range(10)]
+        )
+        posts_by_user = runner.get(PostsByUserIndex).get_posts_for_user(USER_ID)
+        assert posts_by_user.posts == tuple(
+            (board_id, message_id) for message_id in message_ids
+        )
+        post = runner.get(PostRepository).get_post(board_id, message_ids[-1])
+        assert post is not None and post.test == "post 9"
+    finally:
+        runner.stop()
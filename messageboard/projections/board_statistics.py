@@ -0,0 +1,323 @@
+from functools import singledispatchmethod
+from itertools import chain
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    Hashable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+from uuid import UUID
+
+from eventsourcing.domain import AggregateEvent
+from eventsourcing.system import ProcessEvent
+
+from messageboard.domain import MessageBoard, board_id_of
+from messageboard.metrics import Metrics
+from messageboard.projections.projection import Projection
+
+K = TypeVar("K", bound=Hashable)
+
+
+class _Bucket(Generic[K]):
+    """
+    The keys with the same count, in the order they reached it, linked to
+    the buckets with the next lower and higher counts
+    """
+
+    __slots__ = ("count", "keys", "lower", "higher")
+
+    def __init__(self, count: int) -> None:
+        self.count = count
+        self.keys: Dict[K, None] = {}
+        self.lower: _Bucket[K] = self
+        self.higher: _Bucket[K] = self
+
+
+class RankedCounts(Generic[K]):
+    """
+    Counts of keys, kept in buckets of keys with the same count, in a ring
+    ordered by count. Counts go up in small steps, so incrementing a count
+    moves its key to the next bucket or one close to it, and the highest
+    counts are read from the top of the ring without sorting.
+    """
+
+    __slots__ = ("_buckets", "_ring")
+
+    def __init__(self) -> None:
+        self._buckets: Dict[K, _Bucket[K]] = {}
+        # The ring starts and ends with an empty bucket for the count 0
+        self._ring: _Bucket[K] = _Bucket(0)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def __getitem__(self, key: K) -> int:
+        bucket = self._buckets.get(key)
+        return bucket.count if bucket is not None else 0
+
+    def items(self) -> Iterator[Tuple[K, int]]:
+        """
+        Yields the keys and their counts, lowest first
+        """
+        bucket = self._ring.higher
+        while bucket is not self._ring:
+            for key in bucket.keys:
+                yield key, bucket.count
+            bucket = bucket.higher
+
+    def increment(self, key: K, amount: int = 1) -> None:
+        if amount < 1:
+            raise ValueError(f"Counts can only go up, not by {amount}")
+        bucket = self._buckets.get(key, self._ring)
+        count = bucket.count + amount
+        position = bucket
+        if self._ring.lower.count <= count:
+            # Skips to the top, such as when counts are restored in order
+            position = self._ring.lower
+        while position.higher is not self._ring and position.higher.count <= count:
+            position = position.higher
+        if position.count != count:
+            new_bucket: _Bucket[K] = _Bucket(count)
+            new_bucket.lower = position
+            new_bucket.higher = position.higher
+            position.higher.lower = new_bucket
+            position.higher = new_bucket
+            position = new_bucket
+        position.keys[key] = None
+        self._buckets[key] = position
+        if bucket is not self._ring:
+            del bucket.keys[key]
+            if not bucket.keys:
+                bucket.lower.higher = bucket.higher
+                bucket.higher.lower = bucket.lower
+
+    def top(self, k: int) -> List[Tuple[K, int]]:
+        """
+        Returns the ``k`` keys with the highest counts, highest first. Keys
+        with the same count are in the order they reached it.
+        """
+        top: List[Tuple[K, int]] = []
+        bucket = self._ring.lower
+        while bucket is not self._ring and len(top) < k:
+            for key in bucket.keys:
+                top.append((key, bucket.count))
+                if len(top) == k:
+                    break
+            bucket = bucket.lower
+        return top
+
+    def clear(self) -> None:
+        self._buckets = {}
+        self._ring = _Bucket(0)
+
+
+class BoardStats(NamedTuple):
+    """
+    The numbers of posts on a board, by moderation status, and the number
+    of users flagged for moderation
+    """
+
+    posts: int
+    published: int
+    pending: int
+    rejected: int
+    moderated_users: int
+
+
+class BoardCounts:
+    """
+    The counters of one board
+    """
+
+    __slots__ = ("pending", "rejected", "moderated_users", "thread_of", "replies")
+
+    def __init__(self) -> None:
+        self.pending = 0
+        self.rejected = 0
+        self.moderated_users: Set[UUID] = set()
+        # Maps the message ID of a reply to the message ID of the first post
+        # of its thread. Posts that aren't replies start their own thread.
+        self.thread_of: Dict[int, int] = {}
+        # Maps the first post of a thread to the number of replies in it
+        self.replies: Dict[int, int] = {}
+
+    def get_state(self) -> List[Any]:
+        return [
+            self.pending,
+            self.rejected,
+            list(self.moderated_users),
+            [[reply, thread] for reply, thread in self.thread_of.items()],
+        ]
+
+    def add_reply(self, message_id: int, reply_to: int) -> None:
+        thread = self.thread_of.get(reply_to, reply_to)
+        self.thread_of[message_id] = thread
+        self.replies[thread] = self.replies.get(thread, 0) + 1
+
+
+class BoardStatistics(Projection):
+    """
+    Keeps counters of the posts on each board by moderation status, of the
+    replies in each thread, and of the posts of each user, and ranks the
+    boards and users by their number of posts. Every post counts, whether
+    or not it has been moderated.
+    """
+
+    def __init__(
+        self,
+        env: Optional[Mapping[str, str]] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        super().__init__(env, metrics)
+        self._boards: Dict[UUID, BoardCounts] = {}
+        self._board_posts: RankedCounts[UUID] = RankedCounts()
+        self._user_posts: RankedCounts[UUID] = RankedCounts()
+
+    def get_state(self) -> Dict[str, Any]:
+        # Boards and users are in ranked order, so ties stay in the same
+        # order when the state is restored
+        board_ids = chain(
+            (board_id for board_id in self._boards if not self._board_posts[board_id]),
+            (board_id for board_id, _ in self._board_posts.items()),
+        )
+        return {
+            "boards": [
+                [
+                    board_id,
+                    self._board_posts[board_id],
+                    *self._boards[board_id].get_state(),
+                ]
+                for board_id in board_ids
+            ],
+            "users": [[user_id, posts] for user_id, posts in self._user_posts.items()],
+        }
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self.reset()
+        boards = sorted(state["boards"], key=lambda board: board[1])
+        for board_id, posts, pending, rejected, moderated, threads in boards:
+            counts = self._get_board(board_id)
+            counts.pending = pending
+            counts.rejected = rejected
+            counts.moderated_users = set(moderated)
+            for reply, thread in threads:
+                counts.thread_of[reply] = thread
+                counts.replies[thread] = counts.replies.get(thread, 0) + 1
+            if posts:
+                self._board_posts.increment(board_id, posts)
+        for user_id, posts in sorted(state["users"], key=lambda user: user[1]):
+            self._user_posts.increment(user_id, posts)
+
+    def merge_states(self, states: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Each board is in one state, but a user can post to boards in
+        # several of them
+        user_posts: Dict[UUID, int] = {}
+        for state in states:
+            for user_id, posts in state["users"]:
+                user_posts[user_id] = user_posts.get(user_id, 0) + posts
+        return {
+            "boards": [board for state in states for board in state["boards"]],
+            "users": [list(user) for user in user_posts.items()],
+        }
+
+    def reset(self) -> None:
+        self._boards = {}
+        self._board_posts.clear()
+        self._user_posts.clear()
+
+    @singledispatchmethod
+    def policy(self, domain_event: AggregateEvent, process_event: ProcessEvent) -> None:
+        pass
+
+    @policy.register(MessageBoard.MessageBoardCreatedEvent)
+    def _handle_board_created(
+        self, domain_event: MessageBoard.MessageBoardCreatedEvent, process_event: Any
+    ) -> None:
+        self._get_board(domain_event.originator_id)
+
+    @policy.register(MessageBoard.MessagePostedEvent)
+    def _handle_post_created(
+        self, domain_event: MessageBoard.MessagePostedEvent, process_event: Any
+    ) -> None:
+        board_id = board_id_of(domain_event)
+        counts = self._get_board(board_id)
+        if domain_event.requires_moderation:
+            counts.pending += 1
+        if domain_event.reply_to is not None:
+            counts.add_reply(domain_event.message_id, domain_event.reply_to)
+        self._board_posts.increment(board_id)
+        self._user_posts.increment(domain_event.author_id)
+
+    @policy.register(MessageBoard.MessageApprovedEvent)
+    def _handle_post_approved(
+        self, domain_event: MessageBoard.MessageApprovedEvent, process_event: Any
+    ) -> None:
+        self._get_board(board_id_of(domain_event)).pending -= 1
+
+    @policy.register(MessageBoard.MessageRejectedEvent)
+    def _handle_post_rejected(
+        self, domain_event: MessageBoard.MessageRejectedEvent, process_event: Any
+    ) -> None:
+        counts = self._get_board(board_id_of(domain_event))
+        counts.pending -= 1
+        counts.rejected += 1
+
+    @policy.register(MessageBoard.UserFlaggedForModerationEvent)
+    def _handle_user_flagged(
+        self,
+        domain_event: MessageBoard.UserFlaggedForModerationEvent,
+        process_event: Any,
+    ) -> None:
+        self._get_board(domain_event.originator_id).moderated_users.add(
+            domain_event.user_id
+        )
+
+    def get_board_stats(self, board_id: UUID) -> Optional[BoardStats]:
+        counts = self._boards.get(board_id)
+        if counts is None:
+            return None
+        posts = self._board_posts[board_id]
+        return BoardStats(
+            posts=posts,
+            published=posts - counts.pending - counts.rejected,
+            pending=counts.pending,
+            rejected=counts.rejected,
+            moderated_users=len(counts.moderated_users),
+        )
+
+    def count_replies_in_thread(self, board_id: UUID, message_id: int) -> int:
+        """
+        Returns the number of replies in the thread started by a post,
+        including replies to replies
+        """
+        counts = self._boards.get(board_id)
+        return counts.replies.get(message_id, 0) if counts is not None else 0
+
+    def count_posts_for_user(self, user_id: UUID) -> int:
+        return self._user_posts[user_id]
+
+    def get_most_active_boards(self, limit: int) -> List[Tuple[UUID, int]]:
+        """
+        Returns (board_id, posts) tuples for the boards with the most posts
+        """
+        return self._board_posts.top(limit)
+
+    def get_most_active_users(self, limit: int) -> List[Tuple[UUID, int]]:
+        """
+        Returns (user_id, posts) tuples for the users with the most posts
+        """
+        return self._user_posts.top(limit)
+
+    def _get_board(self, board_id: UUID) -> BoardCounts:
+        counts = self._boards.get(board_id)
+        if counts is None:
+            counts = self._boards[board_id] = BoardCounts()
+        return counts
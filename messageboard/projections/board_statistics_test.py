@@ -0,0 +1,97 @@
+from typing import Tuple
+from uuid import uuid4
+
+import pytest
+from eventsourcing.system import SingleThreadedRunner, System
+
+from messageboard.application import MessageBoards
+from messageboard.projections.board_statistics import (
+    BoardStatistics,
+    BoardStats,
+    RankedCounts,
+)
+
+ADMIN_ID = uuid4()
+USER_ID = uuid4()
+
+
+def start() -> Tuple[MessageBoards, BoardStatistics]:
+    system = System(pipes=[[MessageBoards, BoardStatistics]])
+    runner = SingleThreadedRunner(system)
+    runner.start()
+    return runner.get(MessageBoards), runner.get(BoardStatistics)
+
+
+def test_ranked_counts_keep_the_highest_counts_on_top() -> None:
+    counts: RankedCounts[str] = RankedCounts()
+    for key in "abcbcc":
+        counts.increment(key)
+    counts.increment("d", 2)
+
+    assert counts.top(10) == [("c", 3), ("b", 2), ("d", 2), ("a", 1)]
+    assert counts.top(2) == [("c", 3), ("b", 2)]
+    counts.increment("a", 5)
+    assert counts.top(2) == [("a", 6), ("c", 3)]
+    assert (counts["b"], counts["e"], len(counts)) == (2, 0, 4)
+    with pytest.raises(ValueError):
+        counts.increment("a", 0)
+
+
+def test_board_counts_follow_moderation() -> None:
+    message_boards, statistics = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    other_user_id = uuid4()
+    message_boards.moderate_user(board_id, other_user_id, ADMIN_ID)
+    message_boards.moderate_user(board_id, other_user_id, ADMIN_ID)
+    original_id = message_boards.post_message(board_id, "Original", None, USER_ID)
+    approved_id = message_boards.post_message(
+        board_id, "Approved", original_id, other_user_id
+    )
+    rejected_id = message_boards.post_message(board_id, "x", None, other_user_id)
+    message_boards.post_message(board_id, "Pending", None, other_user_id)
+    message_boards.approve_message(board_id, approved_id, ADMIN_ID)
+    message_boards.reject_message(board_id, rejected_id, ADMIN_ID)
+    message_boards.post_message(board_id, "Reply to reply", approved_id, USER_ID)
+
+    assert statistics.get_board_stats(board_id) == BoardStats(
+        posts=5, published=3, pending=1, rejected=1, moderated_users=1
+    )
+    assert statistics.count_replies_in_thread(board_id, original_id) == 2
+    assert statistics.count_replies_in_thread(board_id, approved_id) == 0
+    assert statistics.count_posts_for_user(other_user_id) == 3
+    assert statistics.get_board_stats(uuid4()) is None
+    new_board_id = message_boards.create_message_board("New board", ADMIN_ID)
+    assert statistics.get_board_stats(new_board_id) == BoardStats(0, 0, 0, 0, 0)
+
+
+def test_most_active_boards_and_users() -> None:
+    message_boards, statistics = start()
+    board_ids = [
+        message_boards.create_message_board(f"Board {i}", ADMIN_ID) for i in range(3)
+    ]
+    user_ids = [uuid4() for _ in range(3)]
+    for i, board_id in enumerate(board_ids):
+        for user_id in user_ids[: i + 1]:
+            message_boards.post_message(board_id, "x", None, user_id)
+
+    assert statistics.get_most_active_boards(2) == [
+        (board_ids[2], 3),
+        (board_ids[1], 2),
+    ]
+    assert statistics.get_most_active_users(3) == [
+        (user_ids[0], 3),
+        (user_ids[1], 2),
+        (user_ids[2], 1),
+    ]
+
+    restored = BoardStatistics()
+    restored.set_state(statistics.get_state())
+    assert restored.get_state() == statistics.get_state()
+    assert restored.get_most_active_users(1) == [(user_ids[0], 3)]
+    assert restored.count_replies_in_thread(board_ids[0], 0) == 0
+
+    merged = BoardStatistics()
+    merged.set_state(
+        statistics.merge_states([statistics.get_state(), statistics.get_state()])
+    )
+    assert merged.count_posts_for_user(user_ids[0]) == 6
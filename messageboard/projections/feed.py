@@ -0,0 +1,127 @@
+from collections import deque
+from functools import singledispatchmethod
+from itertools import islice
+from operator import itemgetter
+from typing import Any, Deque, Dict, List, Mapping, Optional, Tuple
+from uuid import UUID
+
+from eventsourcing.domain import AggregateEvent
+from eventsourcing.system import ProcessEvent
+
+from messageboard.domain import MessageBoard, board_id_of
+from messageboard.metrics import Metrics
+from messageboard.projections.projection import Projection, event_time
+
+
+class LatestPostsFeed(Projection):
+    """
+    Keeps the newest published posts of each board, and across all boards,
+    in ring buffers of fixed size. Posts enter the feeds when they are
+    published, so moderated posts appear in the order they are approved.
+    Rejected posts are never published, so they never enter the feeds.
+
+    The sizes of the feeds are set with the ``FEED_SIZE`` and
+    ``GLOBAL_FEED_SIZE`` environment variables.
+    """
+
+    FEED_SIZE = "FEED_SIZE"
+    DEFAULT_FEED_SIZE = 100
+    GLOBAL_FEED_SIZE = "GLOBAL_FEED_SIZE"
+    DEFAULT_GLOBAL_FEED_SIZE = 1000
+
+    def __init__(
+        self,
+        env: Optional[Mapping[str, str]] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        super().__init__(env, metrics)
+        self.feed_size = int(
+            self.factory.getenv(self.FEED_SIZE) or self.DEFAULT_FEED_SIZE
+        )
+        self.global_feed_size = int(
+            self.factory.getenv(self.GLOBAL_FEED_SIZE) or self.DEFAULT_GLOBAL_FEED_SIZE
+        )
+        self._feeds: Dict[UUID, Deque[int]] = {}
+        # Entries are (board_id, message_id, publication time in microseconds)
+        self._global_feed: Deque[Tuple[UUID, int, int]] = deque(
+            maxlen=self.global_feed_size
+        )
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            "boards": [
+                [board_id, list(feed)] for board_id, feed in self._feeds.items()
+            ],
+            "global": [list(entry) for entry in self._global_feed],
+        }
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self.reset()
+        for board_id, message_ids in state["boards"]:
+            self._feeds[board_id] = deque(message_ids, maxlen=self.feed_size)
+        self._global_feed.extend(
+            (board_id, message_id, time)
+            for board_id, message_id, time in state["global"]
+        )
+
+    def merge_states(self, states: List[Dict[str, Any]]) -> Dict[str, Any]:
+        global_feed = sorted(
+            (entry for state in states for entry in state["global"]),
+            key=itemgetter(2),
+        )
+        return {
+            "boards": [board for state in states for board in state["boards"]],
+            "global": global_feed[-self.global_feed_size :],
+        }
+
+    def reset(self) -> None:
+        self._feeds = {}
+        self._global_feed = deque(maxlen=self.global_feed_size)
+
+    @singledispatchmethod
+    def policy(self, domain_event: AggregateEvent, process_event: ProcessEvent) -> None:
+        pass
+
+    @policy.register(MessageBoard.MessagePostedEvent)
+    def _handle_post_created(
+        self, domain_event: MessageBoard.MessagePostedEvent, process_event: Any
+    ) -> None:
+        if not domain_event.requires_moderation:
+            self._publish(domain_event)
+
+    @policy.register(MessageBoard.MessageApprovedEvent)
+    def _handle_post_approved(
+        self, domain_event: MessageBoard.MessageApprovedEvent, process_event: Any
+    ) -> None:
+        self._publish(domain_event)
+
+    def get_latest_posts(self, board_id: UUID, limit: int) -> Tuple[int, ...]:
+        """
+        Returns the message IDs of the newest published posts on a board,
+        newest first
+        """
+        feed = self._feeds.get(board_id)
+        if feed is None:
+            return ()
+        return tuple(islice(reversed(feed), limit))
+
+    def get_latest_posts_across_boards(
+        self, limit: int
+    ) -> Tuple[Tuple[UUID, int], ...]:
+        """
+        Returns (board_id, message_id) tuples for the newest published posts
+        on all boards, newest first
+        """
+        return tuple(
+            (board_id, message_id)
+            for board_id, message_id, _ in islice(reversed(self._global_feed), limit)
+        )
+
+    def _publish(self, domain_event: AggregateEvent) -> None:
+        board_id = board_id_of(domain_event)
+        message_id = domain_event.message_id  # type: ignore
+        feed = self._feeds.get(board_id)
+        if feed is None:
+            feed = self._feeds[board_id] = deque(maxlen=self.feed_size)
+        feed.append(message_id)
+        self._global_feed.append((board_id, message_id, event_time(domain_event)))
@@ -0,0 +1,90 @@
+from typing import Tuple
+from uuid import uuid4
+
+import pytest
+from eventsourcing.system import SingleThreadedRunner, System
+
+from messageboard.application import MessageBoards
+from messageboard.projections.feed import LatestPostsFeed
+
+ADMIN_ID = uuid4()
+USER_ID = uuid4()
+
+
+@pytest.fixture(autouse=True)
+def feed_sizes(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("FEED_SIZE", "3")
+    monkeypatch.setenv("GLOBAL_FEED_SIZE", "4")
+
+
+def start() -> Tuple[MessageBoards, LatestPostsFeed]:
+    system = System(pipes=[[MessageBoards, LatestPostsFeed]])
+    runner = SingleThreadedRunner(system)
+    runner.start()
+    return runner.get(MessageBoards), runner.get(LatestPostsFeed)
+
+
+def test_feeds_keep_the_newest_posts() -> None:
+    message_boards, feed = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    other_board_id = message_boards.create_message_board("Other board", ADMIN_ID)
+    post_ids = [
+        message_boards.post_message(board_id, str(i), None, USER_ID) for i in range(5)
+    ]
+    other_post_id = message_boards.post_message(other_board_id, "x", None, USER_ID)
+
+    assert feed.get_latest_posts(board_id, 10) == tuple(reversed(post_ids[2:]))
+    assert feed.get_latest_posts(board_id, 2) == (post_ids[4], post_ids[3])
+    assert feed.get_latest_posts(other_board_id, 10) == (other_post_id,)
+    assert feed.get_latest_posts(uuid4(), 10) == ()
+    assert feed.get_latest_posts_across_boards(10) == (
+        (other_board_id, other_post_id),
+        (board_id, post_ids[4]),
+        (board_id, post_ids[3]),
+        (board_id, post_ids[2]),
+    )
+    assert feed.get_latest_posts_across_boards(1) == ((other_board_id, other_post_id),)
+
+
+def test_moderated_posts_are_added_in_approval_order() -> None:
+    message_boards, feed = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    moderated_user_id = uuid4()
+    message_boards.moderate_user(board_id, moderated_user_id, ADMIN_ID)
+    first, second, third = (
+        message_boards.post_message(board_id, "x", None, moderated_user_id)
+        for _ in range(3)
+    )
+    message_boards.reject_message(board_id, first, ADMIN_ID)
+    assert feed.get_latest_posts(board_id, 10) == ()
+
+    message_boards.approve_message(board_id, third, ADMIN_ID)
+    unmoderated = message_boards.post_message(board_id, "x", None, USER_ID)
+    message_boards.approve_message(board_id, second, ADMIN_ID)
+    assert feed.get_latest_posts(board_id, 10) == (second, unmoderated, third)
+
+
+def test_partial_feeds_are_merged_in_publication_order() -> None:
+    message_boards, feed = start()
+    board_ids = [
+        message_boards.create_message_board(f"Board {i}", ADMIN_ID) for i in range(2)
+    ]
+    for i in range(3):
+        for board_id in board_ids:
+            message_boards.post_message(board_id, str(i), None, USER_ID)
+
+    state = feed.get_state()
+    partial_states = [
+        {
+            "boards": [board for board in state["boards"] if board[0] == board_id],
+            "global": [entry for entry in state["global"] if entry[0] == board_id],
+        }
+        for board_id in board_ids
+    ]
+
+    merged = LatestPostsFeed()
+    merged.set_state(feed.merge_states(partial_states))
+    assert merged.get_latest_posts_across_boards(10) == (
+        feed.get_latest_posts_across_boards(10)
+    )
+    assert merged.get_latest_posts(board_ids[0], 10) == (2, 1, 0)
@@ -0,0 +1,201 @@
+from bisect import bisect_left, bisect_right
+from functools import singledispatchmethod
+from itertools import islice
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+from eventsourcing.domain import AggregateEvent
+from eventsourcing.system import ProcessEvent
+
+from messageboard.domain import MessageBoard, board_id_of
+from messageboard.metrics import Metrics
+from messageboard.projections.projection import Projection, event_time
+
+
+class PendingPage(NamedTuple):
+    """
+    A page of (message_id, author_id) tuples for posts awaiting moderation,
+    and the cursor to pass as ``after`` to get the next page, or None if
+    this is the last page
+    """
+
+    posts: Tuple[Tuple[int, UUID], ...]
+    next_cursor: Optional[Tuple[int, int]]
+
+
+class BoardQueue:
+    """
+    The posts awaiting moderation on one board, as a sorted list of
+    (time posted, message_id) keys, so the queue is oldest first. The
+    partitions of a board give out message IDs from separate ranges, so
+    the IDs only break ties between posts made at the same time.
+    """
+
+    __slots__ = ("keys", "posts")
+
+    def __init__(self) -> None:
+        self.keys: List[Tuple[int, int]] = []
+        # Maps message ID to (author_id, time posted in microseconds)
+        self.posts: Dict[int, Tuple[UUID, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, message_id: int, author_id: UUID, time: int) -> None:
+        key = (time, message_id)
+        if self.keys and key < self.keys[-1]:
+            self.keys.insert(bisect_left(self.keys, key), key)
+        else:
+            self.keys.append(key)
+        self.posts[message_id] = (author_id, time)
+
+    def remove(self, message_id: int) -> UUID:
+        author_id, time = self.posts.pop(message_id)
+        del self.keys[bisect_left(self.keys, (time, message_id))]
+        return author_id
+
+
+class ModerationQueue(Projection):
+    """
+    Keeps the posts awaiting moderation on each board, oldest first, with
+    counts per board and in total, and the pending posts of each author
+    """
+
+    def __init__(
+        self,
+        env: Optional[Mapping[str, str]] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        super().__init__(env, metrics)
+        self._queues: Dict[UUID, BoardQueue] = {}
+        # Maps author to {(board_id, message_id): time posted}, oldest first
+        self._pending_by_author: Dict[UUID, Dict[Tuple[UUID, int], int]] = {}
+        self._pending_count = 0
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            "boards": [
+                [
+                    board_id,
+                    [
+                        [message_id, *queue.posts[message_id]]
+                        for _, message_id in queue.keys
+                    ],
+                ]
+                for board_id, queue in self._queues.items()
+            ]
+        }
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self.reset()
+        posts = [
+            (time, board_id, message_id, author_id)
+            for board_id, board_posts in state["boards"]
+            for message_id, author_id, time in board_posts
+        ]
+        posts.sort(key=lambda post: (post[0], post[2]))
+        for time, board_id, message_id, author_id in posts:
+            self._add(board_id, message_id, author_id, time)
+
+    def merge_states(self, states: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {"boards": [board for state in states for board in state["boards"]]}
+
+    def reset(self) -> None:
+        self._queues = {}
+        self._pending_by_author = {}
+        self._pending_count = 0
+
+    @singledispatchmethod
+    def policy(self, domain_event: AggregateEvent, process_event: ProcessEvent) -> None:
+        pass
+
+    @policy.register(MessageBoard.MessagePostedEvent)
+    def _handle_post_created(
+        self, domain_event: MessageBoard.MessagePostedEvent, process_event: Any
+    ) -> None:
+        if domain_event.requires_moderation:
+            self._add(
+                board_id_of(domain_event),
+                domain_event.message_id,
+                domain_event.author_id,
+                event_time(domain_event),
+            )
+
+    @policy.register(MessageBoard.MessageApprovedEvent)
+    def _handle_post_approved(
+        self, domain_event: MessageBoard.MessageApprovedEvent, process_event: Any
+    ) -> None:
+        self._remove(board_id_of(domain_event), domain_event.message_id)
+
+    @policy.register(MessageBoard.MessageRejectedEvent)
+    def _handle_post_rejected(
+        self, domain_event: MessageBoard.MessageRejectedEvent, process_event: Any
+    ) -> None:
+        self._remove(board_id_of(domain_event), domain_event.message_id)
+
+    def get_pending(
+        self,
+        board_id: UUID,
+        after: Optional[Tuple[int, int]] = None,
+        limit: Optional[int] = None,
+    ) -> PendingPage:
+        """
+        Returns a page of at most ``limit`` posts awaiting moderation on a
+        board, oldest first. ``after`` is the cursor of the previous page,
+        the (time posted, message_id) key of its last post. Cursors stay
+        valid as posts are approved and rejected. Raises ValueError if
+        ``limit`` is less than one.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError(f"Pages hold at least one post, not {limit}")
+        queue = self._queues.get(board_id)
+        if queue is None:
+            return PendingPage((), None)
+        keys = queue.keys
+        start = 0 if after is None else bisect_right(keys, after)
+        stop = len(keys) if limit is None else min(start + limit, len(keys))
+        posts = tuple(
+            (message_id, queue.posts[message_id][0])
+            for _, message_id in keys[start:stop]
+        )
+        if stop == len(keys):
+            return PendingPage(posts, None)
+        return PendingPage(posts, keys[stop - 1] if stop > start else after)
+
+    def count_pending(self, board_id: UUID) -> int:
+        queue = self._queues.get(board_id)
+        return len(queue) if queue is not None else 0
+
+    def count_all_pending(self) -> int:
+        return self._pending_count
+
+    def get_pending_for_author(
+        self, author_id: UUID, limit: Optional[int] = None
+    ) -> Tuple[Tuple[UUID, int], ...]:
+        """
+        Returns (board_id, message_id) tuples for an author's posts awaiting
+        moderation on all boards, oldest first
+        """
+        pending = self._pending_by_author.get(author_id)
+        if pending is None:
+            return ()
+        return tuple(islice(pending, limit))
+
+    def _add(self, board_id: UUID, message_id: int, author_id: UUID, time: int) -> None:
+        queue = self._queues.get(board_id)
+        if queue is None:
+            queue = self._queues[board_id] = BoardQueue()
+        queue.add(message_id, author_id, time)
+        self._pending_by_author.setdefault(author_id, {})[(board_id, message_id)] = time
+        self._pending_count += 1
+
+    def _remove(self, board_id: UUID, message_id: int) -> None:
+        queue = self._queues[board_id]
+        author_id = queue.remove(message_id)
+        if not queue:
+            del self._queues[board_id]
+        pending = self._pending_by_author[author_id]
+        del pending[(board_id, message_id)]
+        if not pending:
+            del self._pending_by_author[author_id]
+        self._pending_count -= 1
@@ -0,0 +1,109 @@
+from typing import Tuple
+from uuid import uuid4
+
+import pytest
+from eventsourcing.system import SingleThreadedRunner, System
+
+from messageboard.application import MessageBoards
+from messageboard.projections.moderation_queue import ModerationQueue
+
+ADMIN_ID = uuid4()
+USER_ID = uuid4()
+
+
+def start() -> Tuple[MessageBoards, ModerationQueue]:
+    system = System(pipes=[[MessageBoards, ModerationQueue]])
+    runner = SingleThreadedRunner(system)
+    runner.start()
+    return runner.get(MessageBoards), runner.get(ModerationQueue)
+
+
+def test_pending_posts_are_paged_oldest_first() -> None:
+    message_boards, moderation_queue = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    message_boards.moderate_user(board_id, USER_ID, ADMIN_ID)
+    message_boards.post_message(board_id, "unmoderated", None, ADMIN_ID)
+    pending_ids = [
+        message_boards.post_message(board_id, str(i), None, USER_ID) for i in range(5)
+    ]
+
+    first_page = moderation_queue.get_pending(board_id, limit=2)
+    assert first_page.posts == tuple((i, USER_ID) for i in pending_ids[:2])
+
+    message_boards.approve_message(board_id, pending_ids[1], ADMIN_ID)
+    message_boards.reject_message(board_id, pending_ids[2], ADMIN_ID)
+    second_page = moderation_queue.get_pending(
+        board_id, after=first_page.next_cursor, limit=2
+    )
+    assert second_page.posts == tuple((i, USER_ID) for i in pending_ids[3:])
+    assert second_page.next_cursor is None
+
+    assert moderation_queue.count_pending(board_id) == 3
+    assert moderation_queue.get_pending(uuid4()) == ((), None)
+    with pytest.raises(ValueError):
+        moderation_queue.get_pending(board_id, after=first_page.next_cursor, limit=0)
+
+
+def test_pending_counts_and_authors() -> None:
+    message_boards, moderation_queue = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    other_board_id = message_boards.create_message_board("Other board", ADMIN_ID)
+    other_user_id = uuid4()
+    for board in (board_id, other_board_id):
+        message_boards.moderate_user(board, USER_ID, ADMIN_ID)
+        message_boards.moderate_user(board, other_user_id, ADMIN_ID)
+    first = message_boards.post_message(other_board_id, "x", None, USER_ID)
+    second = message_boards.post_message(board_id, "x", None, USER_ID)
+    other = message_boards.post_message(board_id, "x", None, other_user_id)
+
+    assert moderation_queue.count_pending(board_id) == 2
+    assert moderation_queue.count_pending(other_board_id) == 1
+    assert moderation_queue.count_all_pending() == 3
+    assert moderation_queue.get_pending_for_author(USER_ID) == (
+        (other_board_id, first),
+        (board_id, second),
+    )
+    assert moderation_queue.get_pending_for_author(USER_ID, limit=1) == (
+        (other_board_id, first),
+    )
+
+    message_boards.approve_message(other_board_id, first, ADMIN_ID)
+    message_boards.reject_message(board_id, other, ADMIN_ID)
+    assert moderation_queue.count_pending(other_board_id) == 0
+    assert moderation_queue.count_all_pending() == 1
+    assert moderation_queue.get_pending_for_author(USER_ID) == ((board_id, second),)
+    assert moderation_queue.get_pending_for_author(other_user_id) == ()
+
+    restored = ModerationQueue()
+    restored.set_state(moderation_queue.get_state())
+    assert restored.get_state() == moderation_queue.get_state()
+    assert restored.count_all_pending() == 1
+    assert restored.get_pending_for_author(USER_ID) == ((board_id, second),)
+
+
+def test_pending_posts_on_a_partitioned_board_are_paged_oldest_first() -> None:
+    message_boards, moderation_queue = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID, 4)
+    message_boards.moderate_user(board_id, USER_ID, ADMIN_ID)
+    pending_ids = [
+        message_boards.post_message(board_id, str(i), None, USER_ID) for i in range(8)
+    ]
+    # Each partition gives out IDs from its own range
+    assert pending_ids != sorted(pending_ids)
+
+    pages = []
+    page = moderation_queue.get_pending(board_id, limit=3)
+    pages.append(page.posts)
+    while page.next_cursor is not None:
+        page = moderation_queue.get_pending(board_id, after=page.next_cursor, limit=3)
+        pages.append(page.posts)
+
+    assert [len(posts) for posts in pages] == [3, 3, 2]
+    assert [message_id for posts in pages for message_id, _ in posts] == pending_ids
+
+    message_boards.approve_message(board_id, pending_ids[0], ADMIN_ID)
+    restored = ModerationQueue()
+    restored.set_state(moderation_queue.get_state())
+    assert restored.get_pending(board_id).posts == tuple(
+        (message_id, USER_ID) for message_id in pending_ids[1:]
+    )
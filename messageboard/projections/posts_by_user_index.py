@@ -1,23 +1,157 @@
+from array import array
 from functools import singledispatchmethod
-from typing import Any, Dict, Set, Tuple
+from operator import itemgetter
+from typing import (
+    Any,
+    Dict,
+    Hashable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    cast,
+)
 from uuid import UUID
 
 from eventsourcing.domain import AggregateEvent
-from eventsourcing.system import ProcessApplication, ProcessEvent
+from eventsourcing.system import ProcessEvent
 
-from messageboard.domain import MessageBoard
+from messageboard.domain import (
+    MESSAGE_APPROVED_EVENTS,
+    MESSAGE_POSTED_EVENTS,
+    MESSAGE_REJECTED_EVENTS,
+    MessageBoard,
+    board_id_of,
+)
+from messageboard.metrics import Metrics
+from messageboard.projections.projection import Projection, event_time
 
 
-class PostsByUserIndex(ProcessApplication):
+class PostsPage(NamedTuple):
     """
-    Keeps an index of (board_id, message_id) tuples for each user_id.
-    Only approved posts are included for moderated users.
+    A page of (board_id, message_id) tuples, and the cursor to pass as
+    ``after`` to get the next page, or None if this is the last page
     """
 
-    def __init__(self):
-        super().__init__()
+    posts: Tuple[Tuple[UUID, int], ...]
+    next_cursor: Optional[int]
+
+
+class UserPosts:
+    """
+    The posts of one user in the order they were published, as columns of
+    board indexes, message IDs and publication times in microseconds
+    """
+
+    __slots__ = ("boards", "message_ids", "times")
+
+    def __init__(self) -> None:
+        self.boards = array("I")
+        self.message_ids = array("q")
+        self.times = array("q")
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+    def append(self, board: int, message_id: int, time: int) -> None:
+        self.boards.append(board)
+        self.message_ids.append(message_id)
+        self.times.append(time)
+
+
+class PostsByUserIndex(Projection):
+    """
+    Keeps an index of (board_id, message_id) tuples for each user_id, in
+    the order the posts were published. Only approved posts are included
+    for moderated users, from the time they are approved.
+    """
+
+    def __init__(
+        self,
+        env: Optional[Mapping[str, str]] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        super().__init__(env, metrics)
         self._posts_awaiting_moderation: Dict[Tuple[UUID, int], UUID] = {}
-        self._posts_by_user: Dict[UUID, Set[Tuple[UUID, int]]] = {}
+        self._posts_by_user: Dict[UUID, UserPosts] = {}
+        self._boards: List[UUID] = []
+        self._board_indexes: Dict[UUID, int] = {}
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            "posts_awaiting_moderation": [
+                [board_id, message_id, author]
+                for (board_id, message_id), author in (
+                    self._posts_awaiting_moderation.items()
+                )
+            ],
+            "boards": list(self._boards),
+            "posts_by_user": [
+                [
+                    user_id,
+                    posts.boards.tolist(),
+                    posts.message_ids.tolist(),
+                    posts.times.tolist(),
+                ]
+                for user_id, posts in self._posts_by_user.items()
+            ],
+        }
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self.reset()
+        self._posts_awaiting_moderation = {
+            (board_id, message_id): author
+            for board_id, message_id, author in state["posts_awaiting_moderation"]
+        }
+        for board_id in state["boards"]:
+            self._get_board_index(board_id)
+        for user_id, boards, message_ids, times in state["posts_by_user"]:
+            posts = self._posts_by_user[user_id] = UserPosts()
+            posts.boards = array("I", boards)
+            posts.message_ids = array("q", message_ids)
+            posts.times = array("q", times)
+
+    def merge_states(self, states: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Each state has its own table of boards, and each user's posts are
+        # merged in order of publication time
+        user_posts: Dict[UUID, List[Tuple[int, UUID, int]]] = {}
+        for state in states:
+            boards = state["boards"]
+            for user_id, board_refs, message_ids, times in state["posts_by_user"]:
+                user_posts.setdefault(user_id, []).extend(
+                    zip(times, (boards[ref] for ref in board_refs), message_ids)
+                )
+        merged_boards: Dict[UUID, int] = {}
+        posts_by_user = []
+        for user_id, posts in user_posts.items():
+            posts.sort(key=itemgetter(0))
+            posts_by_user.append(
+                [
+                    user_id,
+                    [
+                        merged_boards.setdefault(board_id, len(merged_boards))
+                        for _, board_id, _ in posts
+                    ],
+                    [message_id for _, _, message_id in posts],
+                    [time for time, _, _ in posts],
+                ]
+            )
+        return {
+            "posts_awaiting_moderation": [
+                post for state in states for post in state["posts_awaiting_moderation"]
+            ],
+            "boards": list(merged_boards),
+            "posts_by_user": posts_by_user,
+        }
+
+    def reset(self) -> None:
+        self._posts_awaiting_moderation = {}
+        self._posts_by_user = {}
+        self._boards = []
+        self._board_indexes = {}
+        if self.query_cache is not None:
+            self.query_cache.clear()
 
     @singledispatchmethod
     def policy(self, domain_event: AggregateEvent, process_event: ProcessEvent) -> None:
@@ -29,27 +163,147 @@ class PostsByUserIndex(ProcessApplication):
     ) -> None:
         if domain_event.requires_moderation:
             self._posts_awaiting_moderation[
-                (domain_event.originator_id, domain_event.message_id)
+                (board_id_of(domain_event), domain_event.message_id)
             ] = domain_event.author_id
         else:
-            self._posts_by_user.setdefault(domain_event.author_id, set()).add(
-                (domain_event.originator_id, domain_event.message_id)
+            self._add_post(
+                domain_event.author_id,
+                board_id_of(domain_event),
+                domain_event.message_id,
+                event_time(domain_event),
             )
 
     @policy.register(MessageBoard.MessageApprovedEvent)
     def _handle_post_approved(
         self, domain_event: MessageBoard.MessagePostedEvent, process_event: Any
     ) -> None:
-        message_tuple = (domain_event.originator_id, domain_event.message_id)
+        message_tuple = (board_id_of(domain_event), domain_event.message_id)
         author = self._posts_awaiting_moderation.pop(message_tuple)
-        self._posts_by_user.setdefault(author, set()).add(message_tuple)
+        self._add_post(author, *message_tuple, event_time(domain_event))
 
     @policy.register(MessageBoard.MessageRejectedEvent)
     def _handle_post_rejected(
         self, domain_event: MessageBoard.MessagePostedEvent, process_event: Any
     ) -> None:
-        message_tuple = (domain_event.originator_id, domain_event.message_id)
+        message_tuple = (board_id_of(domain_event), domain_event.message_id)
         del self._posts_awaiting_moderation[message_tuple]
 
-    def get_posts_for_user(self, user_id: UUID) -> Set[Tuple[UUID, int]]:
-        return self._posts_by_user.get(user_id, set())
+    def process_batch(
+        self, domain_events: List[AggregateEvent], process_event: ProcessEvent
+    ) -> None:
+        # Posts are published in the recorded order of their posted and
+        # approved events, so the chunk is applied in order
+        awaiting_moderation = self._posts_awaiting_moderation
+        for domain_event in domain_events:
+            event_type = type(domain_event)
+            if event_type in MESSAGE_POSTED_EVENTS:
+                posted_event = cast(MessageBoard.MessagePostedEvent, domain_event)
+                if posted_event.requires_moderation:
+                    awaiting_moderation[
+                        (board_id_of(posted_event), posted_event.message_id)
+                    ] = posted_event.author_id
+                else:
+                    self._add_post(
+                        posted_event.author_id,
+                        board_id_of(posted_event),
+                        posted_event.message_id,
+                        event_time(posted_event),
+                    )
+            elif event_type in MESSAGE_APPROVED_EVENTS:
+                approved_event = cast(MessageBoard.MessageApprovedEvent, domain_event)
+                message_tuple = (
+                    board_id_of(approved_event),
+                    approved_event.message_id,
+                )
+                self._add_post(
+                    awaiting_moderation.pop(message_tuple),
+                    *message_tuple,
+                    event_time(approved_event),
+                )
+            elif event_type in MESSAGE_REJECTED_EVENTS:
+                rejected_event = cast(MessageBoard.MessageRejectedEvent, domain_event)
+                del awaiting_moderation[
+                    (board_id_of(rejected_event), rejected_event.message_id)
+                ]
+
+    def get_posts_for_user(
+        self,
+        user_id: UUID,
+        after: Optional[int] = None,
+        limit: Optional[int] = None,
+        newest_first: bool = False,
+    ) -> PostsPage:
+        """
+        Returns a page of at most ``limit`` of the user's posts, in the order
+        they were published, or newest first. ``after`` is the cursor of the
+        previous page. Cursors stay valid as the user posts more. Pages are
+        cached until the user publishes another post, when the projection
+        has a query cache. Raises ValueError if ``after`` is negative or
+        ``limit`` is less than one.
+        """
+        if after is not None and after < 0:
+            raise ValueError(f"Cursors are never negative, not {after}")
+        if limit is not None and limit < 1:
+            raise ValueError(f"Pages hold at least one post, not {limit}")
+        if self.query_cache is None:
+            return self._get_posts_for_user(user_id, after, limit, newest_first)[0]
+        return self.query_cache.get_or_compute(
+            ("posts_for_user", user_id, after, limit, newest_first),
+            lambda: self._get_posts_for_user(user_id, after, limit, newest_first),
+        )
+
+    def _get_posts_for_user(
+        self,
+        user_id: UUID,
+        after: Optional[int],
+        limit: Optional[int],
+        newest_first: bool,
+    ) -> Tuple[PostsPage, List[Hashable]]:
+        tags: List[Hashable] = [("author", user_id)]
+        posts = self._posts_by_user.get(user_id)
+        if posts is None:
+            return PostsPage((), None), tags
+        count = len(posts)
+        if newest_first:
+            stop = count if after is None else min(after, count)
+            start = 0 if limit is None else max(stop - limit, 0)
+            next_cursor = start if start > 0 else None
+            indexes = range(stop - 1, start - 1, -1)
+        else:
+            start = 0 if after is None else after
+            stop = count if limit is None else min(start + limit, count)
+            next_cursor = stop if stop < count else None
+            indexes = range(start, stop)
+        boards = self._boards
+        page = PostsPage(
+            tuple(
+                (boards[posts.boards[index]], posts.message_ids[index])
+                for index in indexes
+            ),
+            next_cursor,
+        )
+        return page, tags
+
+    def count_posts_for_user(self, user_id: UUID) -> int:
+        posts = self._posts_by_user.get(user_id)
+        return len(posts) if posts is not None else 0
+
+    def _get_board_index(self, board_id: UUID) -> int:
+        index = self._board_indexes.get(board_id)
+        if index is None:
+            index = self._board_indexes[board_id] = len(self._boards)
+            self._boards.append(board_id)
+        return index
+
+    def _add_post(
+        self, author: UUID, board_id: UUID, message_id: int, time: int
+    ) -> None:
+        posts = self._posts_by_user.get(author)
+        if posts is None:
+            posts = self._posts_by_user[author] = UserPosts()
+        posts.append(
+            self._get_board_index(board_id),
+            message_id,
+            time,
+        )
+        self._invalidate_queries(("author", author))
@@ -1,5 +1,7 @@
+from typing import Optional
 from uuid import uuid4
 
+import pytest
 from eventsourcing.system import SingleThreadedRunner, System
 
 from messageboard.application import MessageBoards
@@ -20,7 +22,9 @@ def test_posts_are_indexed() -> None:
     board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
     post_id = message_boards.post_message(board_id, "the message", None, USER_ID)
 
-    assert posts_by_user_index.get_posts_for_user(USER_ID) == {(board_id, post_id)}
+    assert posts_by_user_index.get_posts_for_user(USER_ID).posts == (
+        (board_id, post_id),
+    )
 
 
 def test_moderated_posts_are_not_indexed_until_approved() -> None:
@@ -41,6 +45,122 @@ def test_moderated_posts_are_not_indexed_until_approved() -> None:
         other_board_id, "whooo", None, USER_ID
     )
 
-    assert len(posts_by_user_index.get_posts_for_user(USER_ID)) == 2
+    assert posts_by_user_index.count_posts_for_user(USER_ID) == 2
     message_boards.approve_message(other_board_id, moderated_message, ADMIN_ID)
-    assert len(posts_by_user_index.get_posts_for_user(USER_ID)) == 3
+    assert posts_by_user_index.count_posts_for_user(USER_ID) == 3
+
+
+def test_posts_are_paged_in_publication_order() -> None:
+    system = System(pipes=[[MessageBoards, PostsByUserIndex]])
+    runner = SingleThreadedRunner(system)
+    runner.start()
+
+    message_boards = runner.get(MessageBoards)
+    posts_by_user_index = runner.get(PostsByUserIndex)
+
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    other_board_id = message_boards.create_message_board("Other board", ADMIN_ID)
+    message_boards.moderate_user(other_board_id, USER_ID, ADMIN_ID)
+    moderated_id = message_boards.post_message(other_board_id, "0", None, USER_ID)
+    post_ids = [
+        message_boards.post_message(board_id, str(i), None, USER_ID) for i in range(4)
+    ]
+    message_boards.approve_message(other_board_id, moderated_id, ADMIN_ID)
+    expected = [(board_id, post_id) for post_id in post_ids] + [
+        (other_board_id, moderated_id)
+    ]
+
+    first_page = posts_by_user_index.get_posts_for_user(USER_ID, limit=2)
+    assert first_page.posts == tuple(expected[:2])
+    second_page = posts_by_user_index.get_posts_for_user(
+        USER_ID, after=first_page.next_cursor, limit=2
+    )
+    assert second_page.posts == tuple(expected[2:4])
+    last_page = posts_by_user_index.get_posts_for_user(
+        USER_ID, after=second_page.next_cursor, limit=2
+    )
+    assert last_page.posts == tuple(expected[4:])
+    assert last_page.next_cursor is None
+
+    newest_page = posts_by_user_index.get_posts_for_user(
+        USER_ID, limit=3, newest_first=True
+    )
+    assert newest_page.posts == tuple(reversed(expected[2:]))
+    message_boards.post_message(board_id, "later", None, USER_ID)
+    oldest_page = posts_by_user_index.get_posts_for_user(
+        USER_ID, after=newest_page.next_cursor, newest_first=True
+    )
+    assert oldest_page.posts == tuple(reversed(expected[:2]))
+    assert oldest_page.next_cursor is None
+
+    assert posts_by_user_index.get_posts_for_user(uuid4()) == ((), None)
+
+
+@pytest.mark.parametrize(
+    "after, limit", [(-1, None), (-1, 2), (None, 0), (1, 0), (None, -1)]
+)
+def test_invalid_cursors_and_limits_are_rejected(
+    after: Optional[int], limit: Optional[int]
+) -> None:
+    system = System(pipes=[[MessageBoards, PostsByUserIndex]])
+    runner = SingleThreadedRunner(system)
+    runner.start()
+    message_boards = runner.get(MessageBoards)
+    posts_by_user_index = runner.get(PostsByUserIndex)
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    for i in range(3):
+        message_boards.post_message(board_id, str(i), None, USER_ID)
+
+    for newest_first in (False, True):
+        with pytest.raises(ValueError):
+            posts_by_user_index.get_posts_for_user(
+                USER_ID, after=after, limit=limit, newest_first=newest_first
+            )
+
+
+def test_posts_to_partitioned_board_are_indexed_by_board() -> None:
+    system = System(pipes=[[MessageBoards, PostsByUserIndex]])
+    runner = SingleThreadedRunner(system)
+    runner.start()
+
+    message_boards = runner.get(MessageBoards)
+    posts_by_user_index = runner.get(PostsByUserIndex)
+
+    board_id = message_boards.create_message_board(
+        "Foobar board", ADMIN_ID, partitions=3
+    )
+    message_boards.moderate_user(board_id, USER_ID, ADMIN_ID)
+    post_ids = [
+        message_boards.post_message(board_id, str(i), None, USER_ID) for i in range(3)
+    ]
+    message_boards.approve_messages(board_id, reversed(post_ids), ADMIN_ID)
+
+    assert posts_by_user_index.get_posts_for_user(USER_ID).posts == tuple(
+        (board_id, post_id) for post_id in reversed(post_ids)
+    )
+
+
+def test_cached_pages_change_when_the_user_publishes(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("QUERY_CACHE_MAXSIZE", "100")
+    system = System(pipes=[[MessageBoards, PostsByUserIndex]])
+    runner = SingleThreadedRunner(system)
+    runner.start()
+    message_boards = runner.get(MessageBoards)
+    posts_by_user_index = runner.get(PostsByUserIndex)
+    other_user_id = uuid4()
+
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    message_boards.moderate_user(board_id, USER_ID, ADMIN_ID)
+    message_boards.post_message(board_id, "other", None, other_user_id)
+    message_id = message_boards.post_message(board_id, "pending", None, USER_ID)
+    page = posts_by_user_index.get_posts_for_user(USER_ID)
+    other_page = posts_by_user_index.get_posts_for_user(other_user_id)
+    assert page.posts == ()
+
+    message_boards.approve_message(board_id, message_id, ADMIN_ID)
+    assert posts_by_user_index.get_posts_for_user(USER_ID).posts == (
+        (board_id, message_id),
+    )
+    assert posts_by_user_index.get_posts_for_user(other_user_id) is other_page
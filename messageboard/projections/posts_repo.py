@@ -1,30 +1,378 @@
-from dataclasses import dataclass, field
+from array import array
 from functools import singledispatchmethod
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Hashable, List, Mapping, Optional, Tuple, Union, cast
 from uuid import UUID
 
 from eventsourcing.domain import AggregateEvent
-from eventsourcing.system import ProcessApplication, ProcessEvent
+from eventsourcing.system import ProcessEvent
 
-from messageboard.domain import MessageBoard
+from messageboard.domain import (
+    FIRST_MESSAGE_ID,
+    BoardPartition,
+    MessageBoard,
+    board_id_of,
+)
+from messageboard.metrics import Metrics
+from messageboard.projections.projection import Projection, group_events
+
+NO_POST = -1
+
+
+class BoardPosts:
+    """
+    Column storage for the posts on one board, indexed by message ID.
+
+    Message IDs are dense from FIRST_MESSAGE_ID, so the columns are arrays
+    with one entry per post. Texts are UTF-8 encoded into one bytearray,
+    authors are indexes into the repository's table of authors, and replies
+    are linked through the reply_to, first_reply and next_reply columns.
+    The newest reply to a post comes first in the linked list.
+    """
+
+    __slots__ = (
+        "text",
+        "text_ends",
+        "authors",
+        "published",
+        "reply_to",
+        "first_reply",
+        "next_reply",
+    )
+
+    def __init__(self) -> None:
+        self.text = bytearray()
+        self.text_ends = array("q")
+        self.authors = array("I")
+        self.published = bytearray()
+        self.reply_to = array("i")
+        self.first_reply = array("i")
+        self.next_reply = array("i")
+
+    def __len__(self) -> int:
+        return len(self.text_ends)
+
+    def append(
+        self,
+        text: str,
+        author: int,
+        published: bool,
+        reply_to: Optional[int],
+        link: bool = True,
+    ) -> None:
+        index = len(self.text_ends)
+        self.text += text.encode()
+        self.text_ends.append(len(self.text))
+        self.authors.append(author)
+        self.published.append(published)
+        self.reply_to.append(
+            NO_POST if reply_to is None else reply_to - FIRST_MESSAGE_ID
+        )
+        self.first_reply.append(NO_POST)
+        self.next_reply.append(NO_POST)
+        if link:
+            self._link_reply(index)
+
+    def load(
+        self,
+        text: bytes,
+        text_ends: List[int],
+        authors: List[int],
+        published: List[int],
+        reply_to: List[int],
+        link: bool = True,
+    ) -> None:
+        """
+        Replaces the posts with posts from columns
+        """
+        self.text = bytearray(text)
+        self.text_ends = array("q", text_ends)
+        self.authors = array("I", authors)
+        self.published = bytearray(published)
+        self.reply_to = array("i", reply_to)
+        self.first_reply = array("i", [NO_POST]) * len(reply_to)
+        self.next_reply = array("i", [NO_POST]) * len(reply_to)
+        if link:
+            for index in range(len(reply_to)):
+                self._link_reply(index)
+
+    def _link_reply(self, index: int) -> None:
+        parent = self.reply_to[index]
+        if parent != NO_POST:
+            self.next_reply[index] = self.first_reply[parent]
+            self.first_reply[parent] = index
+
+    def get_text(self, index: int) -> str:
+        start = self.text_ends[index - 1] if index else 0
+        return self.text[start : self.text_ends[index]].decode()
+
+    def get_replies(self, index: int) -> List[int]:
+        replies = []
+        reply = self.first_reply[index]
+        while reply != NO_POST:
+            replies.append(reply)
+            reply = self.next_reply[reply]
+        replies.reverse()
+        return replies
+
+    def add(
+        self,
+        message_id: int,
+        text: str,
+        author: int,
+        published: bool,
+        reply_to: Optional[int],
+    ) -> None:
+        if message_id - FIRST_MESSAGE_ID != len(self):
+            raise AssertionError(
+                f"Expected message {len(self) + FIRST_MESSAGE_ID}, got {message_id}"
+            )
+        self.append(text, author, published, reply_to)
+
+    def publish(self, message_id: int) -> None:
+        self.published[message_id - FIRST_MESSAGE_ID] = True
+
+    def locate(self, message_id: int) -> Optional[Tuple["BoardPosts", int]]:
+        """
+        Returns the columns a post is stored in and its index in them, or
+        None if there is no such post
+        """
+        index = message_id - FIRST_MESSAGE_ID
+        return (self, index) if 0 <= index < len(self) else None
+
+    def get_reply_ids(self, message_id: int) -> List[int]:
+        return [
+            reply + FIRST_MESSAGE_ID
+            for reply in self.get_replies(message_id - FIRST_MESSAGE_ID)
+        ]
+
+
+class PartitionedBoardPosts:
+    """
+    The posts on a partitioned board, in one BoardPosts for each partition
+    of the board. Each partition has its own range of message IDs, and the
+    posts of a partition are stored in the order of their message IDs.
+    Replies are linked across partitions, so the reply columns hold message
+    IDs less FIRST_MESSAGE_ID rather than indexes. Replies are listed in
+    the order of their message IDs.
+    """
+
+    __slots__ = ("partitions", "id_range")
+
+    def __init__(self, partitions: int) -> None:
+        self.partitions = [BoardPosts() for _ in range(partitions)]
+        self.id_range = BoardPartition.id_range(partitions)
+
+    def add(
+        self,
+        message_id: int,
+        text: str,
+        author: int,
+        published: bool,
+        reply_to: Optional[int],
+    ) -> None:
+        partition, index = self._partition_index(message_id)
+        if index != len(partition):
+            expected = message_id - index + len(partition)
+            raise AssertionError(f"Expected message {expected}, got {message_id}")
+        partition.append(text, author, published, reply_to, link=False)
+        self._link_reply(message_id - FIRST_MESSAGE_ID)
+
+    def publish(self, message_id: int) -> None:
+        partition, index = self._partition_index(message_id)
+        partition.published[index] = True
+
+    def locate(self, message_id: int) -> Optional[Tuple[BoardPosts, int]]:
+        number, index = divmod(message_id - FIRST_MESSAGE_ID, self.id_range)
+        if not 0 <= number < len(self.partitions):
+            return None
+        partition = self.partitions[number]
+        return (partition, index) if index < len(partition) else None
+
+    def get_reply_ids(self, message_id: int) -> List[int]:
+        partition, index = self._partition_index(message_id)
+        id_range = self.id_range
+        replies = []
+        reply = partition.first_reply[index]
+        while reply != NO_POST:
+            replies.append(reply + FIRST_MESSAGE_ID)
+            reply = self.partitions[reply // id_range].next_reply[reply % id_range]
+        replies.sort()
+        return replies
+
+    def link_replies(self) -> None:
+        """
+        Links up the replies of loaded partitions
+        """
+        for number, partition in enumerate(self.partitions):
+            first_index = number * self.id_range
+            for index in range(len(partition)):
+                self._link_reply(first_index + index)
+
+    def _link_reply(self, message_index: int) -> None:
+        id_range = self.id_range
+        partition = self.partitions[message_index // id_range]
+        index = message_index % id_range
+        parent = partition.reply_to[index]
+        if parent != NO_POST:
+            parent_partition = self.partitions[parent // id_range]
+            parent_index = parent % id_range
+            partition.next_reply[index] = parent_partition.first_reply[parent_index]
+            parent_partition.first_reply[parent_index] = message_index
+
+    def _partition_index(self, message_id: int) -> Tuple[BoardPosts, int]:
+        number, index = divmod(message_id - FIRST_MESSAGE_ID, self.id_range)
+        return self.partitions[number], index
+
+
+Board = Union[BoardPosts, PartitionedBoardPosts]
 
 
-@dataclass
 class Post:
-    test: str
-    author: UUID
-    published: bool
-    replies: list["Post"] = field(default_factory=list)
+    """
+    A view of a post in a PostRepository. The view reflects later changes
+    to the post, such as the post being approved or replied to.
+    """
+
+    __slots__ = ("_board", "_message_id", "_posts", "_index", "_authors")
+
+    def __init__(self, board: Board, message_id: int, authors: List[UUID]) -> None:
+        location = board.locate(message_id)
+        assert location is not None
+        self._board = board
+        self._message_id = message_id
+        self._posts, self._index = location
+        self._authors = authors
+
+    @property
+    def message_id(self) -> int:
+        return self._message_id
+
+    @property
+    def test(self) -> str:
+        return self._posts.get_text(self._index)
+
+    @property
+    def author(self) -> UUID:
+        return self._authors[self._posts.authors[self._index]]
+
+    @property
+    def published(self) -> bool:
+        return bool(self._posts.published[self._index])
+
+    @property
+    def replies(self) -> List["Post"]:
+        return [
+            Post(self._board, reply, self._authors)
+            for reply in self._board.get_reply_ids(self._message_id)
+        ]
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, Post)
+            and self._board is other._board
+            and self._message_id == other._message_id
+        )
 
+    def __hash__(self) -> int:
+        return hash((id(self._board), self._message_id))
 
-class PostRepository(ProcessApplication):
+    def __repr__(self) -> str:
+        return (
+            f"Post(message_id={self.message_id}, test={self.test!r}, "
+            f"author={self.author!r}, published={self.published})"
+        )
+
+
+class PostRepository(Projection):
     """
-    Keeps a repository of all posts indexed by board, message ID
+    Keeps a repository of all posts indexed by board, message ID. The posts
+    on the partitions of a partitioned board are kept as one board.
     """
 
-    def __init__(self):
-        super().__init__()
-        self._posts_by_board: dict[UUID, dict[int, Post]] = dict()
+    def __init__(
+        self,
+        env: Optional[Mapping[str, str]] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        super().__init__(env, metrics)
+        self._posts_by_board: Dict[UUID, Board] = {}
+        self._authors: List[UUID] = []
+        self._author_indexes: Dict[UUID, int] = {}
+
+    def get_state(self) -> Dict[str, Any]:
+        boards = []
+        for board_id, board in self._posts_by_board.items():
+            if isinstance(board, BoardPosts):
+                boards.append(self._get_columns(board_id, board))
+                continue
+            # Partitions are kept as boards with their partition index and
+            # count appended, so that states are still merged by
+            # concatenation
+            for index, partition in enumerate(board.partitions):
+                boards.append(
+                    self._get_columns(board_id, partition)
+                    + [index, len(board.partitions)]
+                )
+        return {"boards": boards}
+
+    def _get_columns(self, board_id: UUID, board: BoardPosts) -> List[Any]:
+        # Each board gets its own author table, so that states built
+        # from different boards can be merged by concatenation
+        board_authors: Dict[int, int] = {}
+        for author in board.authors:
+            board_authors.setdefault(author, len(board_authors))
+        return [
+            board_id,
+            board.text.decode(),
+            board.text_ends.tolist(),
+            [self._authors[author] for author in board_authors],
+            [board_authors[author] for author in board.authors],
+            list(board.published),
+            board.reply_to.tolist(),
+        ]
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self.reset()
+        partitioned_boards = []
+        for (
+            board_id,
+            text,
+            text_ends,
+            authors,
+            author_refs,
+            published,
+            reply_to,
+            *partitioning,
+        ) in state["boards"]:
+            author_indexes = [self._get_author_index(author) for author in authors]
+            if partitioning:
+                index, partitions = partitioning
+                board = self._get_board(board_id, partitions)
+                assert isinstance(board, PartitionedBoardPosts)
+                partition = board.partitions[index]
+                partitioned_boards.append(board)
+            else:
+                partition = self._posts_by_board[board_id] = BoardPosts()
+            partition.load(
+                text.encode(),
+                text_ends,
+                [author_indexes[author_ref] for author_ref in author_refs],
+                published,
+                reply_to,
+                link=not partitioning,
+            )
+        for board in set(partitioned_boards):
+            board.link_replies()
+
+    def merge_states(self, states: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {"boards": [board for state in states for board in state["boards"]]}
+
+    def reset(self) -> None:
+        self._posts_by_board = {}
+        self._authors = []
+        self._author_indexes = {}
+        if self.query_cache is not None:
+            self.query_cache.clear()
 
     @singledispatchmethod
     def policy(self, domain_event: AggregateEvent, process_event: ProcessEvent) -> None:
@@ -34,31 +382,135 @@ class PostRepository(ProcessApplication):
     def _handle_post_created(
         self, domain_event: MessageBoard.MessagePostedEvent, process_event: Any
     ) -> None:
-        post = Post(
-            domain_event.text,
-            domain_event.author_id,
-            not domain_event.requires_moderation,
-        )
-        self._posts_by_board.setdefault(domain_event.originator_id, {})[
-            domain_event.message_id
-        ] = post
-        if domain_event.reply_to is not None:
-            self._posts_by_board[domain_event.originator_id][
-                domain_event.reply_to
-            ].replies.append(post)
+        self._add_post(self._get_board_of(domain_event), domain_event)
 
     @policy.register(MessageBoard.MessageApprovedEvent)
     def _handle_post_approved(
         self, domain_event: MessageBoard.MessagePostedEvent, process_event: Any
     ) -> None:
-        self._posts_by_board.setdefault(domain_event.originator_id, {})[
-            domain_event.message_id
-        ].published = True
+        self._publish(
+            board_id_of(domain_event),
+            self._get_board_of(domain_event),
+            domain_event.message_id,
+        )
+
+    def process_batch(
+        self, domain_events: List[AggregateEvent], process_event: ProcessEvent
+    ) -> None:
+        # Approvals only refer to messages posted earlier, so applying each
+        # board's posts before its approvals gives the same result
+        groups = group_events(
+            domain_events,
+            MessageBoard.MessagePostedEvent,
+            MessageBoard.MessageApprovedEvent,
+        )
+        for board_id, (posted, approved) in groups.items():
+            board = self._get_board_of((posted or approved)[0])
+            for posted_event in cast(List[MessageBoard.MessagePostedEvent], posted):
+                self._add_post(board, posted_event)
+            for approved_event in approved:
+                self._publish(
+                    board_id,
+                    board,
+                    cast(MessageBoard.MessageApprovedEvent, approved_event).message_id,
+                )
 
     def get_post(self, board_id: UUID, post_id: int) -> Optional[Post]:
-        if (
-            board_id in self._posts_by_board
-            and post_id in self._posts_by_board[board_id]
-        ):
-            return self._posts_by_board[board_id][post_id]
-        return None
+        board = self._posts_by_board.get(board_id)
+        if board is None or board.locate(post_id) is None:
+            return None
+        return Post(board, post_id, self._authors)
+
+    def get_rendered_post(
+        self, board_id: UUID, post_id: int
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns a post and all of its replies as a dict of plain values,
+        ready to be serialized, or None if there is no such post. When the
+        projection has a query cache, rendered posts are cached until a post
+        in them is replied to or approved, and must not be changed.
+        """
+        if self.query_cache is None:
+            return self._render_post(board_id, post_id)[0]
+        return self.query_cache.get_or_compute(
+            ("rendered_post", board_id, post_id),
+            lambda: self._render_post(board_id, post_id),
+        )
+
+    def _render_post(
+        self, board_id: UUID, post_id: int
+    ) -> Tuple[Optional[Dict[str, Any]], List[Hashable]]:
+        """
+        Renders a post and its replies, and returns the tags of the board
+        and of each post rendered
+        """
+        tags: List[Hashable] = [("board", board_id), ("message", board_id, post_id)]
+        post = self.get_post(board_id, post_id)
+        if post is None:
+            return None, tags
+        rendered: Dict[str, Any] = {}
+        # Deep threads exceed the recursion limit, so the replies are
+        # rendered with an explicit stack
+        stack = [(post, rendered)]
+        while stack:
+            post, rendered_post = stack.pop()
+            replies: List[Dict[str, Any]] = []
+            rendered_post.update(
+                message_id=post.message_id,
+                text=post.test,
+                author=str(post.author),
+                published=post.published,
+                replies=replies,
+            )
+            for reply in post.replies:
+                rendered_reply: Dict[str, Any] = {}
+                replies.append(rendered_reply)
+                stack.append((reply, rendered_reply))
+                tags.append(("message", board_id, reply.message_id))
+        return rendered, tags
+
+    def _get_board_of(self, domain_event: AggregateEvent) -> Board:
+        return self._get_board(
+            board_id_of(domain_event), getattr(domain_event, "partitions", 1)
+        )
+
+    def _get_board(self, board_id: UUID, partitions: int = 1) -> Board:
+        board = self._posts_by_board.get(board_id)
+        if board is None:
+            board = self._posts_by_board[board_id] = (
+                BoardPosts() if partitions == 1 else PartitionedBoardPosts(partitions)
+            )
+            self._invalidate_queries(("board", board_id))
+        return board
+
+    def _get_author_index(self, author: UUID) -> int:
+        index = self._author_indexes.get(author)
+        if index is None:
+            index = self._author_indexes[author] = len(self._authors)
+            self._authors.append(author)
+        return index
+
+    def _add_post(
+        self, board: Board, domain_event: MessageBoard.MessagePostedEvent
+    ) -> None:
+        board.add(
+            domain_event.message_id,
+            domain_event.text,
+            self._get_author_index(domain_event.author_id),
+            not domain_event.requires_moderation,
+            domain_event.reply_to,
+        )
+        board_id = board_id_of(domain_event)
+        if domain_event.reply_to is None:
+            self._invalidate_queries(("message", board_id, domain_event.message_id))
+        else:
+            # Rendered posts that include the parent of the post now include
+            # the post too
+            self._invalidate_queries(
+                ("message", board_id, domain_event.message_id),
+                ("message", board_id, domain_event.reply_to),
+            )
+
+    def _publish(self, board_id: UUID, board: Board, message_id: int) -> None:
+        board.publish(message_id)
+        self._invalidate_queries(("message", board_id, message_id))
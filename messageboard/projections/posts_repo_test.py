@@ -1,8 +1,10 @@
 from uuid import uuid4
 
+import pytest
 from eventsourcing.system import SingleThreadedRunner, System
 
 from messageboard.application import MessageBoards
+from messageboard.domain import MESSAGE_ID_LIMIT
 from messageboard.projections.posts_repo import PostRepository
 
 ADMIN_ID = uuid4()
@@ -60,3 +62,133 @@ def test_published_field_is_set_when_moderated_post_is_approved() -> None:
 
     message_boards.approve_message(board_id, message_id, ADMIN_ID)
     assert posts_repo.get_post(board_id, message_id).published
+
+
+def test_posts_are_read_back_from_storage() -> None:
+    system = System(pipes=[[MessageBoards, PostRepository]])
+    runner = SingleThreadedRunner(system)
+    runner.start()
+
+    message_boards = runner.get(MessageBoards)
+    posts_repo = runner.get(PostRepository)
+
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    other_user_id = uuid4()
+    original_id = message_boards.post_message(board_id, "Original", None, USER_ID)
+    reply_ids = [
+        message_boards.post_message(board_id, text, original_id, other_user_id)
+        for text in ("Först", "Second 🎉", "Third")
+    ]
+
+    original = posts_repo.get_post(board_id, original_id)
+    assert original is not None
+    assert original.author == USER_ID
+    assert [(reply.message_id, reply.test) for reply in original.replies] == [
+        (reply_ids[0], "Först"),
+        (reply_ids[1], "Second 🎉"),
+        (reply_ids[2], "Third"),
+    ]
+    assert original.replies[1].author == other_user_id
+    assert posts_repo.get_post(board_id, reply_ids[2] + 1) is None
+    assert posts_repo.get_post(uuid4(), original_id) is None
+
+    state = posts_repo.get_state()
+    restored = PostRepository()
+    restored.set_state(state)
+    assert restored.get_state() == state
+    restored_original = restored.get_post(board_id, original_id)
+    assert restored_original is not None
+    assert [reply.test for reply in restored_original.replies] == [
+        "Först",
+        "Second 🎉",
+        "Third",
+    ]
+
+
+def test_partitioned_board_is_one_board() -> None:
+    system = System(pipes=[[MessageBoards, PostRepository]])
+    runner = SingleThreadedRunner(system)
+    runner.start()
+
+    message_boards = runner.get(MessageBoards)
+    posts_repo = runner.get(PostRepository)
+
+    board_id = message_boards.create_message_board(
+        "Foobar board", ADMIN_ID, partitions=2
+    )
+    # The batch goes to one partition, and the posts after it alternate
+    # between the partitions
+    original, other = message_boards.post_messages(
+        board_id, [("Original", None, USER_ID), ("Other", None, USER_ID)]
+    )
+    first = message_boards.post_message(board_id, "First", original, USER_ID)
+    second = message_boards.post_message(board_id, "Second", original, USER_ID)
+    reply = message_boards.post_message(board_id, "Reply", first, USER_ID)
+    assert (other, second, reply) == (original + 1, original + 2, first + 1)
+
+    for repo in (posts_repo, PostRepository()):
+        if repo is not posts_repo:
+            repo.set_state(posts_repo.get_state())
+            assert repo.get_state() == posts_repo.get_state()
+        original_post = repo.get_post(board_id, original)
+        assert original_post is not None
+        assert [(r.message_id, r.test) for r in original_post.replies] == sorted(
+            [(first, "First"), (second, "Second")]
+        )
+        replies = {r.message_id: r for r in original_post.replies}
+        assert [r.test for r in replies[first].replies] == ["Reply"]
+        other_post = repo.get_post(board_id, other)
+        assert other_post is not None and other_post.test == "Other"
+        for missing_id in (second + 1, reply + 1, -1, MESSAGE_ID_LIMIT):
+            assert repo.get_post(board_id, missing_id) is None
+
+
+def test_rendered_posts_are_cached_until_changed(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("QUERY_CACHE_MAXSIZE", "100")
+    system = System(pipes=[[MessageBoards, PostRepository]])
+    runner = SingleThreadedRunner(system)
+    runner.start()
+    message_boards = runner.get(MessageBoards)
+    posts_repo = runner.get(PostRepository)
+    assert posts_repo.query_cache is not None
+    other_user_id = uuid4()
+
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    message_boards.moderate_user(board_id, other_user_id, ADMIN_ID)
+    assert posts_repo.get_rendered_post(board_id, 0) is None
+    original_id = message_boards.post_message(board_id, "Original", None, USER_ID)
+    reply_id = message_boards.post_message(
+        board_id, "Reply", original_id, other_user_id
+    )
+    other_id = message_boards.post_message(board_id, "Other", None, USER_ID)
+    rendered = posts_repo.get_rendered_post(board_id, original_id)
+    assert rendered == {
+        "message_id": original_id,
+        "text": "Original",
+        "author": str(USER_ID),
+        "published": True,
+        "replies": [
+            {
+                "message_id": reply_id,
+                "text": "Reply",
+                "author": str(other_user_id),
+                "published": False,
+                "replies": [],
+            }
+        ],
+    }
+    assert posts_repo.get_rendered_post(board_id, original_id) is rendered
+    other = posts_repo.get_rendered_post(board_id, other_id)
+
+    message_boards.approve_message(board_id, reply_id, ADMIN_ID)
+    rendered = posts_repo.get_rendered_post(board_id, original_id)
+    assert rendered is not None
+    assert rendered["replies"][0]["published"]
+    assert posts_repo.get_rendered_post(board_id, other_id) is other
+
+    message_boards.post_message(board_id, "Reply to reply", reply_id, USER_ID)
+    rendered = posts_repo.get_rendered_post(board_id, original_id)
+    assert rendered is not None
+    assert rendered["replies"][0]["replies"][0]["text"] == "Reply to reply"
@@ -0,0 +1,361 @@
+import time
+from abc import abstractmethod
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Mapping, Optional
+from uuid import NAMESPACE_URL, UUID, uuid5
+
+from eventsourcing.application import NotificationLog
+from eventsourcing.domain import AggregateEvent
+from eventsourcing.persistence import (
+    AggregateRecorder,
+    InfrastructureFactory,
+    Mapper,
+    StoredEvent,
+    Tracking,
+)
+from eventsourcing.system import (
+    NotificationLogReader,
+    ProcessApplication,
+    ProcessEvent,
+)
+
+from messageboard.codec import CompactMapper
+from messageboard.domain import board_id_of
+from messageboard.metrics import Metrics, construct_metrics
+from messageboard.persistence import ConfiguredFactory, construct_factory
+from messageboard.projections.query_cache import QueryCache
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class Projection(ProcessApplication):
+    """
+    Base class for read models that checkpoint their state.
+
+    Every ``checkpoint_interval`` notifications (the ``CHECKPOINT_INTERVAL``
+    environment variable) the projection saves its state, together with the
+    position it has reached in each notification log it follows. When a
+    projection that has a checkpoint starts following a log, it restores its
+    state from the checkpoint and then processes only the notifications
+    after the checkpointed position. A checkpoint replaces the previous one, in the
+    stores that support it. As the state grows, checkpoints are saved less
+    often, so that on average no more than ``CHECKPOINT_BYTES_PER_NOTIFICATION``
+    bytes of checkpoint are written for each notification processed.
+
+    Notifications are processed in chunks of up to ``batch_size`` (the
+    ``PROCESSING_BATCH_SIZE`` environment variable), with one tracking
+    record per chunk. A single notification goes through :func:`policy`,
+    while larger chunks go through :func:`process_batch`, which subclasses
+    can override to apply a chunk of events in one pass.
+
+    Notifications are read from the logs it follows in sections of
+    ``NOTIFICATION_SECTION_SIZE`` notifications. Settings can be given to
+    the constructor as a mapping, which is read before the environment, and
+    the store is picked as described in
+    :func:`~messageboard.persistence.construct_factory`.
+
+    When a metrics sink is given (either with the constructor argument or
+    the ``METRICS`` environment variable) the projection records the time
+    taken to handle single events by event type, and to handle chunks, with
+    the number of events of each type in them, and its position in each log.
+
+    When a query cache size is configured (the ``QUERY_CACHE_MAXSIZE``
+    environment variable) projections that support it cache the results of
+    their queries in :attr:`query_cache`, for at most ``QUERY_CACHE_TTL``
+    seconds if that is set, and invalidate them as events change what they
+    were computed from.
+
+    Subclasses implement :func:`get_state`, :func:`set_state`,
+    :func:`merge_states` and :func:`reset`. The state must be encodable by
+    the application's transcoder.
+    """
+
+    CHECKPOINT_INTERVAL = "CHECKPOINT_INTERVAL"
+    DEFAULT_CHECKPOINT_INTERVAL = 1000
+    CHECKPOINT_BYTES_PER_NOTIFICATION = "CHECKPOINT_BYTES_PER_NOTIFICATION"
+    DEFAULT_CHECKPOINT_BYTES_PER_NOTIFICATION = 1000
+    PROCESSING_BATCH_SIZE = "PROCESSING_BATCH_SIZE"
+    DEFAULT_PROCESSING_BATCH_SIZE = 100
+    NOTIFICATION_SECTION_SIZE = "NOTIFICATION_SECTION_SIZE"
+    DEFAULT_NOTIFICATION_SECTION_SIZE = 10
+    QUERY_CACHE_MAXSIZE = "QUERY_CACHE_MAXSIZE"
+    QUERY_CACHE_TTL = "QUERY_CACHE_TTL"
+
+    def __init__(
+        self,
+        env: Optional[Mapping[str, str]] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        self.env = env
+        super().__init__()
+        self.metrics = construct_metrics(self.factory) if metrics is None else metrics
+        self.checkpoint_interval = int(
+            self.factory.getenv(self.CHECKPOINT_INTERVAL)
+            or self.DEFAULT_CHECKPOINT_INTERVAL
+        )
+        self.batch_size = int(
+            self.factory.getenv(self.PROCESSING_BATCH_SIZE)
+            or self.DEFAULT_PROCESSING_BATCH_SIZE
+        )
+        self.query_cache: Optional[QueryCache] = None
+        query_cache_maxsize = self.factory.getenv(self.QUERY_CACHE_MAXSIZE)
+        if query_cache_maxsize:
+            query_cache_ttl = self.factory.getenv(self.QUERY_CACHE_TTL)
+            self.query_cache = QueryCache(
+                int(query_cache_maxsize),
+                float(query_cache_ttl) if query_cache_ttl else None,
+            )
+        self.checkpoint_bytes_per_notification = int(
+            self.factory.getenv(self.CHECKPOINT_BYTES_PER_NOTIFICATION)
+            or self.DEFAULT_CHECKPOINT_BYTES_PER_NOTIFICATION
+        )
+        self.checkpoint_recorder = self.construct_checkpoint_recorder()
+        self.checkpoint_id = uuid5(
+            NAMESPACE_URL, f"/projections/{self.__class__.__name__}/checkpoints"
+        )
+        self.checkpoint_version = 0
+        self.positions: Dict[str, int] = {}
+        # Called with the name of a leader and the position processed up to,
+        # after each batch of its notifications
+        self.on_processed: Optional[Callable[[str, int], None]] = None
+        self._is_restored = False
+        self._processed_since_checkpoint = 0
+        self._next_checkpoint_after = self.checkpoint_interval
+
+    def construct_factory(self) -> InfrastructureFactory:
+        return construct_factory(self.__class__.__name__, self.env)
+
+    def construct_checkpoint_recorder(self) -> AggregateRecorder:
+        if isinstance(self.factory, ConfiguredFactory):
+            return self.factory.checkpoint_recorder()
+        return self.factory.aggregate_recorder(purpose="checkpoints")
+
+    def construct_mapper(self, application_name: str = "") -> Mapper:
+        # Reads the events of the applications it follows in either format
+        mapper = super().construct_mapper(application_name)
+        return CompactMapper(
+            mapper.transcoder,
+            compressor=mapper.compressor,
+            cipher=mapper.cipher,
+            encode_binary=False,
+        )
+
+    @abstractmethod
+    def get_state(self) -> Dict[str, Any]:
+        """
+        Returns the projection state to be checkpointed
+        """
+
+    @abstractmethod
+    def set_state(self, state: Dict[str, Any]) -> None:
+        """
+        Replaces the projection state with checkpointed state
+        """
+
+    @abstractmethod
+    def merge_states(self, states: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Merges states built from disjoint sets of boards into one state
+        """
+
+    @abstractmethod
+    def reset(self) -> None:
+        """
+        Replaces the projection state with empty state
+        """
+
+    def follow(self, name: str, log: NotificationLog, catch_up: bool = True) -> None:
+        """
+        Follows a notification log, restoring the latest checkpoint first.
+        Unless ``catch_up`` is False, the notifications recorded after the
+        checkpoint are then processed, so reads don't wait for the next
+        prompt to reflect them.
+        """
+        section_size = int(
+            self.factory.getenv(self.NOTIFICATION_SECTION_SIZE)
+            or self.DEFAULT_NOTIFICATION_SECTION_SIZE
+        )
+        reader = NotificationLogReader(log, section_size=section_size)
+        self.readers[name] = (reader, self.construct_mapper(name))
+        if not self._is_restored:
+            self.restore_checkpoint()
+        if catch_up:
+            self.pull_and_process(name)
+
+    def pull_and_process(self, name: str) -> None:
+        """
+        Processes the notifications after the last processed position.
+
+        Notifications that were processed before the projection last
+        stopped, but after its latest checkpoint, are processed again to
+        rebuild the state without being recorded again.
+        """
+        reader, mapper = self.readers[name]
+        recorded_position = self.recorder.max_tracking_id(name)
+        notifications = reader.read(start=self.positions.get(name, 0) + 1)
+        while True:
+            chunk = list(islice(notifications, self.batch_size))
+            if not chunk:
+                break
+            position = chunk[-1].id
+            process_event = ProcessEvent(
+                Tracking(application_name=name, notification_id=position)
+            )
+            domain_events = [mapper.to_domain_event(n) for n in chunk]
+            if self.metrics.enabled:
+                self._process_timed(domain_events, process_event)
+            elif len(domain_events) == 1:
+                self.policy(domain_events[0], process_event)
+            else:
+                self.process_batch(domain_events, process_event)
+            if position > recorded_position:
+                self.record(process_event)
+            self.positions[name] = position
+            if self.on_processed is not None:
+                self.on_processed(name, position)
+            if self.metrics.enabled:
+                self.metrics.set_gauge(
+                    "messageboard_projection_position",
+                    position,
+                    projection=self.__class__.__name__,
+                    leader=name,
+                )
+            self._processed_since_checkpoint += len(chunk)
+            if self._processed_since_checkpoint >= self._next_checkpoint_after:
+                self.save_checkpoint()
+
+    def _process_timed(
+        self, domain_events: List[AggregateEvent], process_event: ProcessEvent
+    ) -> None:
+        start = time.perf_counter()
+        if len(domain_events) == 1:
+            self.policy(domain_events[0], process_event)
+            self.metrics.observe(
+                "messageboard_projection_event_seconds",
+                time.perf_counter() - start,
+                projection=self.__class__.__name__,
+                event=type(domain_events[0]).__qualname__,
+            )
+        else:
+            self.process_batch(domain_events, process_event)
+            self.metrics.observe(
+                "messageboard_projection_batch_seconds",
+                time.perf_counter() - start,
+                projection=self.__class__.__name__,
+            )
+        counts: Dict[str, int] = {}
+        for domain_event in domain_events:
+            event_name = type(domain_event).__qualname__
+            counts[event_name] = counts.get(event_name, 0) + 1
+        for event_name, count in counts.items():
+            self.metrics.increment(
+                "messageboard_projection_events_total",
+                count,
+                projection=self.__class__.__name__,
+                event=event_name,
+            )
+
+    def process_batch(
+        self, domain_events: List[AggregateEvent], process_event: ProcessEvent
+    ) -> None:
+        """
+        Applies a chunk of domain events, in the order they were recorded
+        """
+        for domain_event in domain_events:
+            self.policy(domain_event, process_event)
+
+    def save_checkpoint(self) -> None:
+        """
+        Saves the projection state and positions
+        """
+        self.checkpoint_version += 1
+        state = self.mapper.transcoder.encode(
+            {"positions": self.positions, "state": self.get_state()}
+        )
+        self.checkpoint_recorder.insert_events(
+            [
+                StoredEvent(
+                    originator_id=self.checkpoint_id,
+                    originator_version=self.checkpoint_version,
+                    topic="checkpoint",
+                    state=state,
+                )
+            ]
+        )
+        self._processed_since_checkpoint = 0
+        self._set_next_checkpoint(len(state))
+
+    def _set_next_checkpoint(self, checkpoint_size: int) -> None:
+        self._next_checkpoint_after = max(
+            self.checkpoint_interval,
+            checkpoint_size // self.checkpoint_bytes_per_notification,
+        )
+
+    def restore_checkpoint(self) -> None:
+        """
+        Restores the projection state and positions from the latest checkpoint
+        """
+        checkpoint = self._latest_checkpoint()
+        if checkpoint is not None:
+            self.checkpoint_version = checkpoint.originator_version
+            data = self.mapper.transcoder.decode(checkpoint.state)
+            self.positions = data["positions"]
+            self.set_state(data["state"])
+            self._set_next_checkpoint(len(checkpoint.state))
+        self._is_restored = True
+
+    def rebuild(self) -> None:
+        """
+        Discards the projection state and rebuilds it by processing every
+        notification from the logs it follows, then saves a checkpoint
+        """
+        self.reset()
+        self.positions = {}
+        for name in self.readers:
+            self.pull_and_process(name)
+        self.save_checkpoint()
+
+    def _invalidate_queries(self, *tags: Hashable) -> None:
+        if self.query_cache is not None:
+            self.query_cache.invalidate(*tags)
+
+    def _latest_checkpoint(self) -> Optional[StoredEvent]:
+        checkpoints = self.checkpoint_recorder.select_events(
+            self.checkpoint_id, desc=True, limit=1
+        )
+        return checkpoints[0] if checkpoints else None
+
+
+def group_events(
+    domain_events: Iterable[AggregateEvent], *event_types: type
+) -> Dict[UUID, List[List[AggregateEvent]]]:
+    """
+    Groups events by board, and then by type in the order of ``event_types``,
+    keeping the recorded order within each group. Events of subclasses of
+    the types, such as the events of board partitions, are grouped with
+    them. Events of other types are left out.
+    """
+    type_indexes = {}
+    for i, event_type in enumerate(event_types):
+        for subclass in (event_type, *event_type.__subclasses__()):
+            type_indexes[subclass] = i
+    groups: Dict[UUID, List[List[AggregateEvent]]] = {}
+    for domain_event in domain_events:
+        type_index = type_indexes.get(type(domain_event))
+        if type_index is None:
+            continue
+        board_id = board_id_of(domain_event)
+        board_groups = groups.get(board_id)
+        if board_groups is None:
+            board_groups = groups[board_id] = [[] for _ in event_types]
+        board_groups[type_index].append(domain_event)
+    return groups
+
+
+def event_time(domain_event: AggregateEvent) -> int:
+    """
+    Returns the time of an event in microseconds since the epoch
+    """
+    return (domain_event.timestamp - EPOCH) // MICROSECOND
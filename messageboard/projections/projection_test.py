@@ -0,0 +1,330 @@
+from pathlib import Path
+from typing import Any, Iterator, List, Type
+from uuid import uuid4
+
+import pytest
+from eventsourcing.persistence import Notification
+from eventsourcing.system import SingleThreadedRunner, System
+
+from messageboard.application import MessageBoards
+from messageboard.projections.board_statistics import BoardStatistics
+from messageboard.projections.feed import LatestPostsFeed
+from messageboard.projections.moderation_queue import ModerationQueue
+from messageboard.projections.posts_by_user_index import PostsByUserIndex
+from messageboard.projections.posts_repo import PostRepository
+from messageboard.projections.projection import Projection
+from messageboard.projections.rebuild import main as rebuild_main
+from messageboard.projections.rebuild import rebuild_parallel
+from messageboard.projections.search_index import SearchIndex
+from messageboard.projections.thread_index import ThreadIndex
+
+ADMIN_ID = uuid4()
+USER_ID = uuid4()
+
+
+@pytest.fixture(autouse=True)
+def sqlite_stores(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    monkeypatch.setenv("INFRASTRUCTURE_FACTORY", "eventsourcing.sqlite:Factory")
+    for app_cls in (MessageBoards, PostRepository, PostsByUserIndex):
+        name = app_cls.__name__.upper()
+        monkeypatch.setenv(f"{name}_SQLITE_DBNAME", str(tmp_path / f"{name}.db"))
+    yield
+
+
+class FailingRepository(PostRepository):
+    def process_batch(self, domain_events: Any, process_event: Any) -> None:
+        raise RuntimeError("Failed")
+
+
+def start_runner() -> SingleThreadedRunner:
+    runner = SingleThreadedRunner(
+        System(
+            pipes=[[MessageBoards, PostRepository], [MessageBoards, PostsByUserIndex]]
+        )
+    )
+    runner.start()
+    return runner
+
+
+def test_projection_state_is_restored_from_checkpoint(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("CHECKPOINT_INTERVAL", "2")
+    runner = start_runner()
+    message_boards = runner.get(MessageBoards)
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    original_id = message_boards.post_message(board_id, "Original", None, USER_ID)
+    reply_id = message_boards.post_message(board_id, "Reply", original_id, USER_ID)
+    runner.stop()
+
+    runner = start_runner()
+    posts_repo = runner.get(PostRepository)
+    posts_by_user_index = runner.get(PostsByUserIndex)
+
+    original = posts_repo.get_post(board_id, original_id)
+    assert original is not None
+    assert original.test == "Original"
+    assert original.replies == [posts_repo.get_post(board_id, reply_id)]
+    assert posts_by_user_index.get_posts_for_user(USER_ID).posts == (
+        (board_id, original_id),
+        (board_id, reply_id),
+    )
+
+
+def test_only_notifications_after_checkpoint_are_processed(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("CHECKPOINT_INTERVAL", "3")
+    monkeypatch.setenv("PROCESSING_BATCH_SIZE", "1")
+    runner = start_runner()
+    message_boards = runner.get(MessageBoards)
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    message_boards.post_message(board_id, "First", None, USER_ID)
+    message_boards.post_message(board_id, "Second", None, USER_ID)
+    runner.stop()
+
+    processed: List[int] = []
+    policy = PostRepository.__dict__["policy"]
+
+    def recording_policy(self, domain_event, process_event):  # type: ignore
+        processed.append(process_event.tracking.notification_id)
+        policy.__get__(self, PostRepository)(domain_event, process_event)
+
+    monkeypatch.setattr(PostRepository, "policy", recording_policy)
+    runner = start_runner()
+    message_boards = runner.get(MessageBoards)
+    third_id = message_boards.post_message(board_id, "Third", None, USER_ID)
+
+    assert processed == [4, 5]
+    assert runner.get(PostRepository).get_post(board_id, third_id) is not None
+    assert runner.get(PostRepository).get_post(board_id, 0) is not None
+
+
+def test_notifications_after_the_checkpoint_are_processed_on_start(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("CHECKPOINT_INTERVAL", "3")
+    monkeypatch.setenv("PROCESSING_BATCH_SIZE", "1")
+    runner = start_runner()
+    message_boards = runner.get(MessageBoards)
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    message_boards.post_message(board_id, "First", None, USER_ID)
+    second_id = message_boards.post_message(board_id, "Second", None, USER_ID)
+    posts_repo = runner.get(PostRepository)
+    runner.stop()
+    # The checkpoint is at notification 3, before the second post
+    assert posts_repo.checkpoint_version == 1
+    assert posts_repo.positions == {MessageBoards.__name__: 4}
+
+    runner = start_runner()
+
+    assert runner.get(PostRepository).get_post(board_id, second_id) is not None
+    assert runner.get(PostsByUserIndex).count_posts_for_user(USER_ID) == 2
+
+
+def test_only_the_latest_checkpoint_is_kept(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CHECKPOINT_INTERVAL", "1")
+    monkeypatch.setenv("PROCESSING_BATCH_SIZE", "1")
+    runner = start_runner()
+    message_boards = runner.get(MessageBoards)
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    for i in range(5):
+        message_boards.post_message(board_id, f"Post {i}", None, USER_ID)
+    posts_repo = runner.get(PostRepository)
+    runner.stop()
+
+    checkpoints = posts_repo.checkpoint_recorder.select_events(posts_repo.checkpoint_id)
+    assert [c.originator_version for c in checkpoints] == [7]
+
+
+def test_checkpoints_are_saved_less_often_as_the_state_grows(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("CHECKPOINT_INTERVAL", "1")
+    monkeypatch.setenv("PROCESSING_BATCH_SIZE", "1")
+    monkeypatch.setenv("CHECKPOINT_BYTES_PER_NOTIFICATION", "1")
+    runner = start_runner()
+    message_boards = runner.get(MessageBoards)
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    for i in range(5):
+        message_boards.post_message(board_id, f"Post {i}", None, USER_ID)
+    posts_repo = runner.get(PostRepository)
+    runner.stop()
+
+    # The first checkpoint is larger than one byte for each notification
+    assert posts_repo.checkpoint_version == 1
+    assert posts_repo._next_checkpoint_after > 7
+
+
+def test_rebuild_command_rebuilds_projection_from_scratch(
+    capsys: pytest.CaptureFixture,
+) -> None:
+    runner = start_runner()
+    message_boards = runner.get(MessageBoards)
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    message_id = message_boards.post_message(board_id, "Message", None, USER_ID)
+    runner.stop()
+
+    rebuild_main(["PostRepository"])
+    assert "Rebuilt PostRepository up to notification 3" in capsys.readouterr().out
+
+    runner = start_runner()
+    assert runner.get(PostRepository).get_post(board_id, message_id) is not None
+
+
+def test_parallel_rebuild_merges_projections_built_per_board() -> None:
+    runner = start_runner()
+    message_boards = runner.get(MessageBoards)
+    other_user_id = uuid4()
+    board_ids = [
+        message_boards.create_message_board(f"Board {i}", ADMIN_ID) for i in range(4)
+    ]
+    for board_id in board_ids:
+        message_boards.moderate_user(board_id, other_user_id, ADMIN_ID)
+        original_id = message_boards.post_message(board_id, "Original", None, USER_ID)
+        message_boards.post_message(board_id, "Reply", original_id, other_user_id)
+        message_boards.approve_message(board_id, 1, ADMIN_ID)
+        message_boards.post_message(board_id, "Pending", None, other_user_id)
+    expected_state = runner.get(PostRepository).get_state()
+    runner.stop()
+
+    posts_repo = rebuild_parallel(PostRepository, processes=3)
+    posts_by_user_index = rebuild_parallel(PostsByUserIndex, processes=3)
+
+    assert sorted(posts_repo.get_state()["boards"]) == sorted(expected_state["boards"])
+    assert posts_by_user_index.get_posts_for_user(USER_ID).posts == tuple(
+        (board_id, 0) for board_id in board_ids
+    )
+    assert posts_by_user_index.get_posts_for_user(other_user_id).posts == tuple(
+        (board_id, 1) for board_id in board_ids
+    )
+
+    runner = start_runner()
+    message_boards = runner.get(MessageBoards)
+    message_boards.approve_message(board_ids[0], 2, ADMIN_ID)
+    assert runner.get(PostsByUserIndex).get_posts_for_user(
+        other_user_id
+    ).posts == tuple((board_id, 1) for board_id in board_ids) + ((board_ids[0], 2),)
+    post = runner.get(PostRepository).get_post(board_ids[0], 0)
+    assert post is not None
+    assert [reply.test for reply in post.replies] == ["Reply"]
+
+
+def test_parallel_rebuild_keeps_partitions_with_their_board() -> None:
+    runner = start_runner()
+    message_boards = runner.get(MessageBoards)
+    for i in range(4):
+        board_id = message_boards.create_message_board(
+            f"Board {i}", ADMIN_ID, partitions=3
+        )
+        for _ in range(4):
+            original_id = message_boards.post_message(
+                board_id, "Original", None, USER_ID
+            )
+            message_boards.post_message(board_id, "Reply", original_id, USER_ID)
+    expected_state = runner.get(PostRepository).get_state()
+    expected_posts = runner.get(PostsByUserIndex).get_posts_for_user(USER_ID).posts
+    runner.stop()
+
+    posts_repo = rebuild_parallel(PostRepository, processes=3)
+    posts_by_user_index = rebuild_parallel(PostsByUserIndex, processes=3)
+
+    assert sorted(posts_repo.get_state()["boards"]) == sorted(expected_state["boards"])
+    posts = posts_by_user_index.get_posts_for_user(USER_ID).posts
+    assert sorted(posts) == sorted(expected_posts)
+
+
+def test_parallel_rebuild_reads_the_log_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    message_boards = MessageBoards(env={"PERSISTENCE_MODE": "memory"})
+    for i in range(4):
+        board_id = message_boards.create_message_board(
+            f"Board {i}", ADMIN_ID, partitions=i + 1
+        )
+        for _ in range(3):
+            message_boards.post_message(board_id, "Original", None, USER_ID)
+    expected = PostRepository(env={"PERSISTENCE_MODE": "memory"})
+    expected.follow(MessageBoards.__name__, message_boards.log)
+    sections: List[int] = []
+    select_notifications = message_boards.recorder.select_notifications
+
+    def record_section(start: int, limit: int) -> List[Notification]:
+        sections.append(start)
+        return select_notifications(start, limit)
+
+    monkeypatch.setattr(message_boards.recorder, "select_notifications", record_section)
+
+    # The workers can't read the leader's in-memory log
+    posts_repo = rebuild_parallel(PostRepository, 3, message_boards)
+
+    assert sections == sorted(set(sections))
+    assert sorted(posts_repo.get_state()["boards"]) == sorted(
+        expected.get_state()["boards"]
+    )
+
+
+def test_parallel_rebuild_raises_the_error_of_a_worker(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("FAILINGREPOSITORY_SQLITE_DBNAME", str(tmp_path / "f.db"))
+    message_boards = MessageBoards(env={"PERSISTENCE_MODE": "memory"})
+    board_id = message_boards.create_message_board("Board", ADMIN_ID)
+    message_boards.post_message(board_id, "Original", None, USER_ID)
+
+    with pytest.raises(RuntimeError, match="Failed"):
+        rebuild_parallel(FailingRepository, 2, message_boards)
+
+
+@pytest.mark.parametrize(
+    "projection_cls",
+    [
+        PostRepository,
+        PostsByUserIndex,
+        ThreadIndex,
+        LatestPostsFeed,
+        ModerationQueue,
+        SearchIndex,
+        BoardStatistics,
+    ],
+)
+def test_batches_give_the_same_state_as_single_events(
+    projection_cls: Type[Projection], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("INFRASTRUCTURE_FACTORY", "eventsourcing.popo:Factory")
+    message_boards = MessageBoards()
+    other_user_id = uuid4()
+    for i in range(3):
+        board_id = message_boards.create_message_board(f"Board {i}", ADMIN_ID)
+        message_boards.moderate_user(board_id, other_user_id, ADMIN_ID)
+        original_id = message_boards.post_message(board_id, "Original", None, USER_ID)
+        approved_id = message_boards.post_message(
+            board_id, "Approved", original_id, other_user_id
+        )
+        message_boards.approve_message(board_id, approved_id, ADMIN_ID)
+        message_boards.post_message(board_id, "Reply", approved_id, USER_ID)
+        rejected_id = message_boards.post_message(
+            board_id, "Rejected", None, other_user_id
+        )
+        message_boards.reject_message(board_id, rejected_id, ADMIN_ID)
+        message_boards.post_message(board_id, "Pending", None, other_user_id)
+    board_id = message_boards.create_message_board(
+        "Partitioned board", ADMIN_ID, partitions=3
+    )
+    message_boards.moderate_user(board_id, other_user_id, ADMIN_ID)
+    root_ids = message_boards.post_messages(board_id, [("Original", None, USER_ID)] * 2)
+    approved_id = message_boards.post_message(
+        board_id, "Approved", root_ids[1], other_user_id
+    )
+    message_boards.post_message(board_id, "Reply", root_ids[0], USER_ID)
+    message_boards.approve_message(board_id, approved_id, ADMIN_ID)
+
+    states = []
+    for batch_size in (1, 4, 1000):
+        monkeypatch.setenv("PROCESSING_BATCH_SIZE", str(batch_size))
+        projection = projection_cls()
+        projection.follow(MessageBoards.__name__, message_boards.log)
+        projection.pull_and_process(MessageBoards.__name__)
+        assert projection.recorder.max_tracking_id(MessageBoards.__name__) == 42
+        states.append(projection.get_state())
+
+    assert states[1] == states[0]
+    assert states[2] == states[0]
@@ -0,0 +1,120 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+V = TypeVar("V")
+
+
+class _Entry:
+    __slots__ = ("value", "expires", "tags")
+
+    def __init__(self, value: Any, expires: Optional[float], tags: Set[Hashable]):
+        self.value = value
+        self.expires = expires
+        self.tags = tags
+
+
+class QueryCache:
+    """
+    Bounded cache of query results, which evicts the least recently used
+    result when it is full, and results older than ``ttl`` seconds.
+
+    Each result is cached with the tags of what it was computed from, such
+    as ``("message", board_id, message_id)``, and a projection invalidates
+    the tags of what each event changes as it processes the event, so the
+    results it returns are never older than the projection. Results are
+    shared between callers, who must not change them.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if maxsize < 1:
+            raise ValueError("Cache size must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._keys_by_tag: Dict[Hashable, Set[Hashable]] = {}
+        # Counts invalidations, so results computed while something they
+        # were computed from changed aren't cached
+        self._generation = 0
+        self._lock = Lock()
+
+    def get_or_compute(
+        self, key: Hashable, compute: Callable[[], Tuple[V, Iterable[Hashable]]]
+    ) -> V:
+        """
+        Returns the cached result for a key, or computes it, caching the
+        result with the tags returned by ``compute``
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires is None or entry.expires > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                self._remove(key)
+            self.misses += 1
+            generation = self._generation
+        value, tags = compute()
+        with self._lock:
+            if generation == self._generation and key not in self._entries:
+                self._put(key, value, set(tags))
+        return value
+
+    def invalidate(self, *tags: Hashable) -> None:
+        """
+        Drops the results cached with any of the tags
+        """
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in self._keys_by_tag.pop(tag, ()):
+                    self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _put(self, key: Hashable, value: Any, tags: Set[Hashable]) -> None:
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        self._entries[key] = _Entry(value, expires, tags)
+        for tag in tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
@@ -0,0 +1,68 @@
+from typing import Hashable, List, Tuple
+
+import pytest
+
+from messageboard.projections.query_cache import QueryCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def compute(value: str, *tags: Hashable) -> Tuple[str, List[Hashable]]:
+    return value, list(tags)
+
+
+def test_results_are_cached_until_a_tag_is_invalidated() -> None:
+    cache = QueryCache(maxsize=10)
+    assert cache.get_or_compute("a", lambda: compute("A", "x", "y")) == "A"
+    assert cache.get_or_compute("b", lambda: compute("B", "y")) == "B"
+    assert cache.get_or_compute("a", lambda: compute("new A")) == "A"
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    cache.invalidate("x")
+    assert cache.get_or_compute("a", lambda: compute("new A")) == "new A"
+    assert cache.get_or_compute("b", lambda: compute("new B")) == "B"
+    cache.invalidate("y", "unknown")
+    assert cache.get_or_compute("b", lambda: compute("new B")) == "new B"
+    assert len(cache) == 2
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_least_recently_used_results_are_evicted() -> None:
+    cache = QueryCache(maxsize=2)
+    cache.get_or_compute("a", lambda: compute("A", "x"))
+    cache.get_or_compute("b", lambda: compute("B", "x"))
+    cache.get_or_compute("a", lambda: compute("new A"))
+    cache.get_or_compute("c", lambda: compute("C", "x"))
+
+    assert cache.get_or_compute("b", lambda: compute("new B")) == "new B"
+    assert cache.get_or_compute("c", lambda: compute("new C")) == "C"
+    with pytest.raises(ValueError):
+        QueryCache(maxsize=0)
+
+
+def test_results_expire() -> None:
+    clock = Clock()
+    cache = QueryCache(maxsize=10, ttl=5, clock=clock)
+    cache.get_or_compute("a", lambda: compute("A"))
+    clock.now = 4.9
+    assert cache.get_or_compute("a", lambda: compute("new A")) == "A"
+    clock.now = 5
+    assert cache.get_or_compute("a", lambda: compute("new A")) == "new A"
+
+
+def test_results_computed_during_an_invalidation_are_not_cached() -> None:
+    cache = QueryCache(maxsize=10)
+
+    def compute_while_invalidating() -> Tuple[str, List[Hashable]]:
+        cache.invalidate("x")
+        return compute("A", "x")
+
+    assert cache.get_or_compute("a", compute_while_invalidating) == "A"
+    assert cache.get_or_compute("a", lambda: compute("new A")) == "new A"
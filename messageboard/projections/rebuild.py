@@ -0,0 +1,235 @@
+"""
+Rebuilds a projection from scratch from the MessageBoards notification log,
+using the stores configured in the environment, and saves a checkpoint of
+the result.
+
+With ``--processes`` greater than one, the log is split by board across a
+process pool. The log is read once, and the notifications of each board,
+and of its partitions, are sent to one process, which decodes them and
+builds the projection for its share of the boards. The partial states are
+then merged.
+
+Usage: python -m messageboard.projections.rebuild PostRepository [-p 4]
+"""
+
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import suppress
+from itertools import islice
+from queue import Full
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
+from uuid import UUID
+
+from eventsourcing.application import Application
+from eventsourcing.persistence import Mapper, Notification, Tracking
+from eventsourcing.system import NotificationLogReader, ProcessEvent
+from eventsourcing.utils import get_topic
+
+from messageboard.application import MessageBoards
+from messageboard.domain import BoardPartition
+from messageboard.projections.board_statistics import BoardStatistics
+from messageboard.projections.feed import LatestPostsFeed
+from messageboard.projections.moderation_queue import ModerationQueue
+from messageboard.projections.posts_by_user_index import PostsByUserIndex
+from messageboard.projections.posts_repo import PostRepository
+from messageboard.projections.projection import Projection
+from messageboard.projections.search_index import SearchIndex
+from messageboard.projections.thread_index import ThreadIndex
+
+PROJECTIONS: Dict[str, Type[Projection]] = {
+    cls.__name__: cls
+    for cls in (
+        PostRepository,
+        PostsByUserIndex,
+        ThreadIndex,
+        LatestPostsFeed,
+        ModerationQueue,
+        SearchIndex,
+        BoardStatistics,
+    )
+}
+# The events of partitions are split by the ID of their board, which is
+# only known from the events that create the partitions
+PARTITION_CREATED_TOPIC = get_topic(BoardPartition.BoardPartitionCreatedEvent)
+# Notifications are sent to the processes in chunks of this size, and up
+# to SHARD_QUEUE_SIZE chunks can wait for each process
+CHUNK_SIZE = 1000
+SHARD_QUEUE_SIZE = 4
+# Notifications are sent as (id, originator ID bytes, originator version,
+# topic, state) tuples, since UUIDs are slow to pickle
+SentNotification = Tuple[int, bytes, int, str, bytes]
+# The queue of each shard, in the worker processes
+_shard_queues: List[Any] = []
+
+
+def rebuild(projection_cls: Type[Projection]) -> Projection:
+    message_boards = MessageBoards()
+    projection = projection_cls()
+    projection.follow(MessageBoards.__name__, message_boards.log, catch_up=False)
+    projection.rebuild()
+    return projection
+
+
+def rebuild_parallel(
+    projection_cls: Type[Projection],
+    processes: int,
+    leader: Optional[Application] = None,
+) -> Projection:
+    """
+    Rebuilds the projection with the leader's notifications split by board
+    across ``processes`` worker processes. The leader is MessageBoards by
+    default.
+    """
+    if leader is None:
+        leader = MessageBoards()
+    name = leader.__class__.__name__
+    stop = leader.recorder.max_notification_id()
+    projection = projection_cls()
+    mapper = projection.construct_mapper(name)
+    queues: List[Any] = [
+        multiprocessing.Queue(SHARD_QUEUE_SIZE) for _ in range(processes)
+    ]
+    with ProcessPoolExecutor(
+        processes, initializer=_set_shard_queues, initargs=(queues,)
+    ) as executor:
+        # Each task takes a worker until the end of its queue
+        futures = [
+            executor.submit(_project_shard, projection_cls, name, shard, stop)
+            for shard in range(processes)
+        ]
+        try:
+            chunks: List[List[SentNotification]] = [[] for _ in range(processes)]
+            for shard, n in _route(leader, mapper, processes, stop):
+                chunk = chunks[shard]
+                chunk.append(
+                    (
+                        n.id,
+                        n.originator_id.bytes,
+                        n.originator_version,
+                        n.topic,
+                        n.state,
+                    )
+                )
+                if len(chunk) == CHUNK_SIZE:
+                    _put(queues[shard], futures[shard], chunk)
+                    chunks[shard] = []
+            for queue, future, chunk in zip(queues, futures, chunks):
+                if chunk:
+                    _put(queue, future, chunk)
+        finally:
+            # Ends the tasks, also when reading the log has failed
+            for queue, future in zip(queues, futures):
+                with suppress(RuntimeError):
+                    _put(queue, future, None)
+        states = [future.result() for future in futures]
+
+    projection.follow(name, leader.log, catch_up=False)
+    projection.set_state(projection.merge_states(states))
+    projection.positions = {name: stop}
+    if stop > projection.recorder.max_tracking_id(name):
+        projection.record(ProcessEvent(Tracking(name, stop)))
+    projection.save_checkpoint()
+    return projection
+
+
+def _route(
+    leader: Application, mapper: Mapper, shards: int, stop: int
+) -> Iterator[Tuple[int, Notification]]:
+    """
+    Yields the leader's notifications up to and including ``stop``, each
+    with the shard of its board. Only the events that create partitions are
+    decoded, to find the board of each partition.
+    """
+    board_ids: Dict[UUID, UUID] = {}
+    for notification in NotificationLogReader(leader.log).read(start=1):
+        if notification.id > stop:
+            break
+        originator_id = notification.originator_id
+        if notification.topic == PARTITION_CREATED_TOPIC:
+            created = mapper.to_domain_event(notification)
+            assert isinstance(created, BoardPartition.BoardPartitionCreatedEvent)
+            board_ids[originator_id] = created.board_id
+        board_id = board_ids.get(originator_id, originator_id)
+        yield board_id.int % shards, notification
+
+
+def _put(queue: Any, future: "Future[Dict[str, Any]]", item: Any) -> None:
+    """
+    Puts an item on the queue of a worker, raising the worker's error if it
+    stops before taking it
+    """
+    while True:
+        try:
+            queue.put(item, timeout=0.1)
+            return
+        except Full:
+            if future.done():
+                raise RuntimeError(
+                    "The worker stopped before the end of the log"
+                ) from future.exception()
+
+
+def _set_shard_queues(queues: List[Any]) -> None:
+    global _shard_queues
+    _shard_queues = queues
+
+
+def _project_shard(
+    projection_cls: Type[Projection], name: str, shard: int, stop: int
+) -> Dict[str, Any]:
+    """
+    Builds the projection state from the chunks of notifications on the
+    queue of a shard, up to the None that ends them. ``stop`` is the
+    position of the last notification in the leader's log.
+    """
+    projection = projection_cls()
+    mapper = projection.construct_mapper(name)
+    process_event = ProcessEvent(Tracking(name, stop))
+    for chunk in iter(_shard_queues[shard].get, None):
+        notifications = iter(chunk)
+        while True:
+            batch = list(islice(notifications, projection.batch_size))
+            if not batch:
+                break
+            projection.process_batch(
+                [
+                    mapper.to_domain_event(
+                        Notification(
+                            id=id,
+                            originator_id=UUID(bytes=originator_id),
+                            originator_version=originator_version,
+                            topic=topic,
+                            state=state,
+                        )
+                    )
+                    for id, originator_id, originator_version, topic, state in batch
+                ],
+                process_event,
+            )
+    return projection.get_state()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("projection", choices=sorted(PROJECTIONS))
+    parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=1,
+        help=f"number of worker processes (this machine has {os.cpu_count()})",
+    )
+    args = parser.parse_args(argv)
+    projection_cls = PROJECTIONS[args.projection]
+    if args.processes > 1:
+        projection = rebuild_parallel(projection_cls, args.processes)
+    else:
+        projection = rebuild(projection_cls)
+    position = projection.positions.get(MessageBoards.__name__, 0)
+    print(f"Rebuilt {args.projection} up to notification {position}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+import re
+from array import array
+from base64 import b64decode, b64encode
+from collections import Counter
+from functools import singledispatchmethod
+from heapq import nlargest
+from itertools import accumulate, chain, compress
+from math import log
+from operator import neg
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    cast,
+)
+from uuid import UUID
+
+from eventsourcing.domain import AggregateEvent
+from eventsourcing.system import ProcessEvent
+
+from messageboard.domain import (
+    MESSAGE_APPROVED_EVENTS,
+    MESSAGE_POSTED_EVENTS,
+    MESSAGE_REJECTED_EVENTS,
+    MessageBoard,
+    board_id_of,
+)
+from messageboard.metrics import Metrics
+from messageboard.projections.projection import Projection
+
+BLOCK_SIZE = 128
+MAX_TERM_FREQUENCY = 255
+TOKEN = re.compile(r"\w+")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lower case words
+    """
+    return TOKEN.findall(text.lower())
+
+
+class SearchHit(NamedTuple):
+    """
+    A post that matches a query, and its relevance score
+    """
+
+    board_id: UUID
+    message_id: int
+    score: float
+
+
+# A sealed block of postings: the first document number, the typecode of
+# the packed gaps to the following document numbers, the packed gaps, the
+# term frequency of each document, and the shortest document length for
+# each term frequency in the block, which give the block's largest weight
+Block = Tuple[int, str, bytes, bytes, Tuple[Tuple[int, int], ...]]
+
+
+def encode_block(
+    docs: Sequence[int], tfs: Sequence[int], min_lengths: Dict[int, int]
+) -> Block:
+    gaps = [b - a for a, b in zip(docs, docs[1:])]
+    largest = max(gaps, default=0)
+    typecode = "B" if largest < 1 << 8 else "H" if largest < 1 << 16 else "I"
+    return (
+        docs[0],
+        typecode,
+        array(typecode, gaps).tobytes(),
+        bytes(tfs),
+        tuple(min_lengths.items()),
+    )
+
+
+def decode_docs(block: Block) -> List[int]:
+    return list(accumulate(array(block[1], block[2]), initial=block[0]))
+
+
+class PostingList:
+    """
+    The documents that contain a term, in increasing order, with the number
+    of times the term occurs in each. Postings are appended to an open tail,
+    which is sealed into a block every BLOCK_SIZE postings. A sealed block
+    packs the gaps between document numbers in the fewest bytes that hold
+    its largest gap, which is one byte for most terms.
+    """
+
+    __slots__ = ("blocks", "docs", "tfs", "tail_min_lengths", "min_lengths")
+
+    def __init__(self) -> None:
+        self.blocks: List[Block] = []
+        self.docs = array("I")
+        self.tfs = bytearray()
+        # The shortest document length for each term frequency, in the
+        # tail and in the whole list
+        self.tail_min_lengths: Dict[int, int] = {}
+        self.min_lengths: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.blocks) * BLOCK_SIZE + len(self.docs)
+
+    def append(self, doc: int, tf: int, length: int) -> None:
+        tf = min(tf, MAX_TERM_FREQUENCY)
+        if length < self.tail_min_lengths.get(tf, length + 1):
+            self.tail_min_lengths[tf] = length
+        if length < self.min_lengths.get(tf, length + 1):
+            self.min_lengths[tf] = length
+        self.docs.append(doc)
+        self.tfs.append(tf)
+        if len(self.docs) == BLOCK_SIZE:
+            self.blocks.append(encode_block(self.docs, self.tfs, self.tail_min_lengths))
+            self.docs = array("I")
+            self.tfs = bytearray()
+            self.tail_min_lengths = {}
+
+    def sealed(self) -> Iterator[Block]:
+        """
+        Yields the sealed blocks, and then the tail sealed as a block
+        """
+        yield from self.blocks
+        if self.docs:
+            yield encode_block(self.docs, self.tfs, self.tail_min_lengths)
+
+    def to_state(self) -> List[List[Any]]:
+        return [
+            [
+                first,
+                typecode,
+                b64encode(gaps).decode(),
+                b64encode(tfs).decode(),
+                [tf_and_length for pair in min_lengths for tf_and_length in pair],
+            ]
+            for first, typecode, gaps, tfs, min_lengths in self.sealed()
+        ]
+
+    @classmethod
+    def from_state(cls, state: List[List[Any]]) -> "PostingList":
+        postings = cls()
+        for first, typecode, gaps, tfs, min_lengths in state:
+            block: Block = (
+                first,
+                typecode,
+                b64decode(gaps),
+                b64decode(tfs),
+                tuple(zip(min_lengths[::2], min_lengths[1::2])),
+            )
+            if len(block[3]) == BLOCK_SIZE and not postings.docs:
+                postings.blocks.append(block)
+                for tf, length in block[4]:
+                    if length < postings.min_lengths.get(tf, length + 1):
+                        postings.min_lengths[tf] = length
+            else:
+                # Merged states have partial blocks before the last block
+                lengths = dict(block[4])
+                for doc, tf in zip(decode_docs(block), block[3]):
+                    postings.append(doc, tf, lengths[tf])
+        return postings
+
+
+class Weights(Dict[Tuple[int, int], float]):
+    """
+    The BM25 weight of a term in a document, by term frequency and
+    document length, computed when first looked up
+    """
+
+    def __init__(self, idf: float, average_length: float) -> None:
+        super().__init__()
+        self.idf = idf
+        self.average_length = average_length
+
+    def __missing__(self, key: Tuple[int, int]) -> float:
+        tf, length = key
+        norm = K1 * (1 - B + B * length / self.average_length)
+        weight = self[key] = self.idf * tf * (K1 + 1) / (tf + norm)
+        return weight
+
+
+class SearchIndex(Projection):
+    """
+    Keeps an inverted index of the text of published posts, for ranked
+    full-text search on one board or on all boards.
+
+    Each published post is a document, numbered in the order it is indexed.
+    Posts that require moderation are held back until they are approved, and
+    are dropped when they are rejected, so only published posts can be found.
+    The posting lists are checkpointed in their compressed form, so the
+    index is restored without tokenizing the posts again. The whole index is
+    written in each checkpoint, which replaces the previous checkpoint, and
+    checkpoints are saved less often as the index grows, so the bytes
+    written stay in proportion to the posts indexed (see ``Projection``).
+    """
+
+    def __init__(
+        self,
+        env: Optional[Mapping[str, str]] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        super().__init__(env, metrics)
+        self._boards: List[UUID] = []
+        self._board_indexes: Dict[UUID, int] = {}
+        self._doc_boards = array("I")
+        self._doc_messages = array("q")
+        self._doc_lengths = array("I")
+        self._total_length = 0
+        self._terms: Dict[str, PostingList] = {}
+        self._pending: Dict[Tuple[UUID, int], str] = {}
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            "boards": self._boards,
+            "doc_boards": self._doc_boards.tolist(),
+            "doc_messages": self._doc_messages.tolist(),
+            "doc_lengths": self._doc_lengths.tolist(),
+            "terms": [
+                [term, postings.to_state()] for term, postings in self._terms.items()
+            ],
+            "pending": [
+                [board_id, message_id, text]
+                for (board_id, message_id), text in self._pending.items()
+            ],
+        }
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self.reset()
+        self._boards = list(state["boards"])
+        self._board_indexes = {
+            board_id: index for index, board_id in enumerate(self._boards)
+        }
+        self._doc_boards = array("I", state["doc_boards"])
+        self._doc_messages = array("q", state["doc_messages"])
+        self._doc_lengths = array("I", state["doc_lengths"])
+        self._total_length = sum(self._doc_lengths)
+        self._terms = {
+            term: PostingList.from_state(blocks) for term, blocks in state["terms"]
+        }
+        self._pending = {
+            (board_id, message_id): text
+            for board_id, message_id, text in state["pending"]
+        }
+
+    def merge_states(self, states: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Documents of later states are numbered after those of earlier ones
+        merged: Dict[str, Any] = {
+            "boards": [],
+            "doc_boards": [],
+            "doc_messages": [],
+            "doc_lengths": [],
+            "terms": [],
+            "pending": [],
+        }
+        terms: Dict[str, List[List[Any]]] = {}
+        for state in states:
+            board_offset = len(merged["boards"])
+            doc_offset = len(merged["doc_messages"])
+            merged["boards"].extend(state["boards"])
+            merged["doc_boards"].extend(
+                board + board_offset for board in state["doc_boards"]
+            )
+            merged["doc_messages"].extend(state["doc_messages"])
+            merged["doc_lengths"].extend(state["doc_lengths"])
+            merged["pending"].extend(state["pending"])
+            for term, blocks in state["terms"]:
+                terms.setdefault(term, []).extend(
+                    [first + doc_offset, *block] for first, *block in blocks
+                )
+        merged["terms"] = [[term, blocks] for term, blocks in terms.items()]
+        return merged
+
+    def reset(self) -> None:
+        self._boards = []
+        self._board_indexes = {}
+        self._doc_boards = array("I")
+        self._doc_messages = array("q")
+        self._doc_lengths = array("I")
+        self._total_length = 0
+        self._terms = {}
+        self._pending = {}
+
+    @singledispatchmethod
+    def policy(self, domain_event: AggregateEvent, process_event: ProcessEvent) -> None:
+        pass
+
+    @policy.register(MessageBoard.MessagePostedEvent)
+    def _handle_post_created(
+        self, domain_event: MessageBoard.MessagePostedEvent, process_event: Any
+    ) -> None:
+        self._add_post(domain_event)
+
+    @policy.register(MessageBoard.MessageApprovedEvent)
+    def _handle_post_approved(
+        self, domain_event: MessageBoard.MessageApprovedEvent, process_event: Any
+    ) -> None:
+        board_id = board_id_of(domain_event)
+        text = self._pending.pop((board_id, domain_event.message_id))
+        self._add_document(board_id, domain_event.message_id, text)
+
+    @policy.register(MessageBoard.MessageRejectedEvent)
+    def _handle_post_rejected(
+        self, domain_event: MessageBoard.MessageRejectedEvent, process_event: Any
+    ) -> None:
+        del self._pending[(board_id_of(domain_event), domain_event.message_id)]
+
+    def process_batch(
+        self, domain_events: List[AggregateEvent], process_event: ProcessEvent
+    ) -> None:
+        # Approvals must follow their posts, so the chunk is applied in order
+        for domain_event in domain_events:
+            event_type = type(domain_event)
+            if event_type in MESSAGE_POSTED_EVENTS:
+                self._add_post(cast(MessageBoard.MessagePostedEvent, domain_event))
+            elif event_type in MESSAGE_APPROVED_EVENTS:
+                self._handle_post_approved(
+                    cast(MessageBoard.MessageApprovedEvent, domain_event),
+                    process_event,
+                )
+            elif event_type in MESSAGE_REJECTED_EVENTS:
+                self._handle_post_rejected(
+                    cast(MessageBoard.MessageRejectedEvent, domain_event),
+                    process_event,
+                )
+
+    def search(
+        self, query: str, board_id: Optional[UUID] = None, limit: int = 10
+    ) -> Tuple[SearchHit, ...]:
+        """
+        Returns the ``limit`` published posts that best match the words of
+        a query, on one board or on all boards, best first. Posts match if
+        they contain any of the words, and are ranked by BM25. Posts with
+        equal scores are returned in the order they were indexed.
+        """
+        board: Optional[int] = None
+        if board_id is not None:
+            if board_id not in self._board_indexes:
+                return ()
+            board = self._board_indexes[board_id]
+        doc_count = len(self._doc_messages)
+        if not doc_count or limit < 1:
+            return ()
+        average_length = self._total_length / doc_count
+        terms = []
+        for term in set(tokenize(query)):
+            postings = self._terms.get(term)
+            if postings is not None:
+                frequency = len(postings)
+                idf = log(1 + (doc_count - frequency + 0.5) / (frequency + 0.5))
+                terms.append((postings, Weights(idf, average_length)))
+        if len(terms) == 1:
+            top = self._search_term(*terms[0], board, limit)
+        else:
+            top = self._search_terms(terms, board, limit)
+        doc_boards = self._doc_boards
+        return tuple(
+            SearchHit(self._boards[doc_boards[-doc]], self._doc_messages[-doc], score)
+            for score, doc in top
+        )
+
+    def _search_term(
+        self, postings: PostingList, weights: Weights, board: Optional[int], limit: int
+    ) -> List[Tuple[float, int]]:
+        """
+        Returns the top (score, -document) pairs for one word. Blocks whose
+        largest weight cannot beat the worst of the top documents found so
+        far are skipped without being decoded.
+        """
+        top: List[Tuple[float, int]] = []
+        for block in postings.sealed():
+            if len(top) == limit:
+                if max(map(weights.__getitem__, block[4])) <= top[-1][0]:
+                    continue
+            docs, doc_weights = self._weigh_block(block, weights, board)
+            top = nlargest(limit, chain(top, zip(doc_weights, map(neg, docs))))
+        return top
+
+    def _search_terms(
+        self,
+        terms: List[Tuple[PostingList, Weights]],
+        board: Optional[int],
+        limit: int,
+    ) -> List[Tuple[float, int]]:
+        """
+        Returns the top (score, -document) pairs for several words, adding
+        up the weights of each word in turn, rarest first. Once the weights
+        of the words that are left cannot lift a document without a score
+        up to the top documents, those words only add to the scores of the
+        documents that already have one.
+        """
+        terms = sorted(terms, key=lambda term: len(term[0]))
+        bounds = [
+            max(map(weights.__getitem__, postings.min_lengths.items()))
+            for postings, weights in terms
+        ]
+        remaining = sum(bounds)
+        doc_lengths = self._doc_lengths
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for (postings, weights), bound in zip(terms, bounds):
+            add_docs = (
+                len(scores) < limit or remaining >= nlargest(limit, scores.values())[-1]
+            )
+            remaining -= bound
+            for block in postings.sealed():
+                if add_docs:
+                    docs, doc_weights = self._weigh_block(block, weights, board)
+                    for doc, weight in zip(docs, doc_weights):
+                        scores[doc] = get(doc, 0.0) + weight
+                    continue
+                docs = decode_docs(block)
+                found = scores.keys() & docs
+                if found:
+                    tfs = dict(zip(docs, block[3]))
+                    for doc in found:
+                        scores[doc] += weights[tfs[doc], doc_lengths[doc]]
+        return nlargest(limit, ((score, -doc) for doc, score in scores.items()))
+
+    def _weigh_block(
+        self, block: Block, weights: Weights, board: Optional[int]
+    ) -> Tuple[List[int], Iterator[float]]:
+        """
+        Decodes the documents of a block that are on a board, or on any
+        board, and their weights
+        """
+        docs = decode_docs(block)
+        tfs = block[3]
+        if board is not None:
+            on_board = list(map(board.__eq__, map(self._doc_boards.__getitem__, docs)))
+            docs = list(compress(docs, on_board))
+            tfs = bytes(compress(tfs, on_board))
+        return docs, map(
+            weights.__getitem__, zip(tfs, map(self._doc_lengths.__getitem__, docs))
+        )
+
+    def _add_post(self, domain_event: MessageBoard.MessagePostedEvent) -> None:
+        board_id = board_id_of(domain_event)
+        if domain_event.requires_moderation:
+            self._pending[(board_id, domain_event.message_id)] = domain_event.text
+        else:
+            self._add_document(board_id, domain_event.message_id, domain_event.text)
+
+    def _add_document(self, board_id: UUID, message_id: int, text: str) -> None:
+        board = self._board_indexes.get(board_id)
+        if board is None:
+            board = self._board_indexes[board_id] = len(self._boards)
+            self._boards.append(board_id)
+        doc = len(self._doc_messages)
+        tokens = tokenize(text)
+        self._doc_boards.append(board)
+        self._doc_messages.append(message_id)
+        self._doc_lengths.append(len(tokens))
+        self._total_length += len(tokens)
+        for term, tf in Counter(tokens).items():
+            postings = self._terms.get(term)
+            if postings is None:
+                postings = self._terms[term] = PostingList()
+            postings.append(doc, tf, len(tokens))
@@ -0,0 +1,137 @@
+from typing import Tuple
+from uuid import uuid4
+
+import pytest
+from eventsourcing.persistence import Tracking
+from eventsourcing.system import (
+    NotificationLogReader,
+    ProcessEvent,
+    SingleThreadedRunner,
+    System,
+)
+
+from messageboard.application import MessageBoards
+from messageboard.projections import search_index
+from messageboard.projections.search_index import SearchIndex, tokenize
+
+ADMIN_ID = uuid4()
+USER_ID = uuid4()
+
+
+def start() -> Tuple[MessageBoards, SearchIndex]:
+    system = System(pipes=[[MessageBoards, SearchIndex]])
+    runner = SingleThreadedRunner(system)
+    runner.start()
+    return runner.get(MessageBoards), runner.get(SearchIndex)
+
+
+def test_tokenize() -> None:
+    assert tokenize("Hello, World! it's 2021") == ["hello", "world", "it", "s", "2021"]
+
+
+def test_search_ranks_posts_on_one_board_or_all_boards() -> None:
+    message_boards, index = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    other_board_id = message_boards.create_message_board("Other board", ADMIN_ID)
+    cats = message_boards.post_message(board_id, "Cats cats cats", None, USER_ID)
+    dogs = message_boards.post_message(board_id, "Dogs and cats", None, USER_ID)
+    message_boards.post_message(board_id, "Nothing to see here", None, USER_ID)
+    other_cats = message_boards.post_message(
+        other_board_id, "Cats, dogs and birds", None, USER_ID
+    )
+
+    hits = index.search("CATS")
+    assert [(hit.board_id, hit.message_id) for hit in hits] == [
+        (board_id, cats),
+        (board_id, dogs),
+        (other_board_id, other_cats),
+    ]
+    assert hits[0].score > hits[1].score > hits[2].score
+
+    assert [hit.message_id for hit in index.search("cats", board_id, limit=1)] == [cats]
+    assert [hit.message_id for hit in index.search("dogs birds", other_board_id)] == [
+        other_cats
+    ]
+    assert [hit.message_id for hit in index.search("dogs birds")] == [
+        other_cats,
+        dogs,
+    ]
+    assert index.search("cats", uuid4()) == ()
+    assert index.search("unicorns") == ()
+
+
+def test_only_published_posts_are_found() -> None:
+    message_boards, index = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    message_boards.moderate_user(board_id, USER_ID, ADMIN_ID)
+    approved = message_boards.post_message(board_id, "approved words", None, USER_ID)
+    rejected = message_boards.post_message(board_id, "rejected words", None, USER_ID)
+    assert index.search("words") == ()
+
+    message_boards.approve_message(board_id, approved, ADMIN_ID)
+    message_boards.reject_message(board_id, rejected, ADMIN_ID)
+    assert [hit.message_id for hit in index.search("words")] == [approved]
+    assert index.search("rejected") == ()
+
+
+def test_state_round_trip_and_merge(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(search_index, "BLOCK_SIZE", 4)
+    message_boards, index = start()
+    board_ids = [
+        message_boards.create_message_board(f"Board {i}", ADMIN_ID) for i in range(2)
+    ]
+    message_boards.moderate_user(board_ids[0], USER_ID, ADMIN_ID)
+    pending = message_boards.post_message(board_ids[0], "pending", None, USER_ID)
+    for i in range(10):
+        for board_id in board_ids:
+            message_boards.post_message(board_id, f"common {i}", None, ADMIN_ID)
+
+    assert index.search("common", limit=3) == index.search("common", limit=20)[:3]
+    assert index.search("3 common 7", limit=3) == (
+        index.search("3 common 7", limit=30)[:3]
+    )
+
+    restored = SearchIndex()
+    restored.set_state(index.get_state())
+    assert restored.search("common", limit=20) == index.search("common", limit=20)
+
+    domain_events = [
+        message_boards.mapper.to_domain_event(notification)
+        for notification in NotificationLogReader(message_boards.log).read(start=1)
+    ]
+    partial_states = []
+    for board_id in board_ids:
+        partial = SearchIndex()
+        partial.process_batch(
+            [event for event in domain_events if event.originator_id == board_id],
+            ProcessEvent(Tracking("MessageBoards", len(domain_events))),
+        )
+        partial_states.append(partial.get_state())
+    merged = SearchIndex()
+    merged.set_state(index.merge_states(partial_states))
+    assert sorted(merged.search("common", limit=20)) == sorted(
+        index.search("common", limit=20)
+    )
+    assert merged.search("common 3", board_ids[1])[0].message_id == 3
+
+    message_boards.approve_message(board_ids[0], pending, ADMIN_ID)
+    assert [hit.message_id for hit in index.search("pending")] == [pending]
+
+
+def test_checkpoints_of_a_growing_index_are_replaced_and_spaced_out(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("CHECKPOINT_INTERVAL", "1")
+    monkeypatch.setenv("PROCESSING_BATCH_SIZE", "1")
+    monkeypatch.setenv("CHECKPOINT_BYTES_PER_NOTIFICATION", "20")
+    message_boards, index = start()
+    board_id = message_boards.create_message_board("Board", ADMIN_ID)
+    for i in range(50):
+        message_boards.post_message(board_id, f"post number {i}", None, USER_ID)
+
+    checkpoints = index.checkpoint_recorder.select_events(index.checkpoint_id)
+    assert [c.originator_version for c in checkpoints] == [index.checkpoint_version]
+    # Each checkpoint is larger than the one before, so fewer are saved
+    # than notifications are processed
+    assert index.checkpoint_version < 20
+    assert len(checkpoints[0].state) // 20 == index._next_checkpoint_after
@@ -0,0 +1,351 @@
+from array import array
+from functools import singledispatchmethod
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple, cast
+from uuid import UUID
+
+from eventsourcing.domain import AggregateEvent
+from eventsourcing.system import ProcessEvent
+
+from messageboard.domain import (
+    FIRST_MESSAGE_ID,
+    MESSAGE_APPROVED_EVENTS,
+    MESSAGE_POSTED_EVENTS,
+    BoardPartition,
+    MessageBoard,
+    board_id_of,
+)
+from messageboard.metrics import Metrics
+from messageboard.projections.projection import Projection
+
+NO_POST = -1
+BLOCK_SIZE = 1024
+
+
+class ThreadPost(NamedTuple):
+    """
+    A post in a thread, its depth below the root of the thread, and the
+    number of published replies below it
+    """
+
+    message_id: int
+    depth: int
+    descendants: int
+
+
+class ThreadPage(NamedTuple):
+    """
+    A page of a thread in pre-order, and the offset of the next page, or
+    None if this is the last page
+    """
+
+    posts: Tuple[ThreadPost, ...]
+    next_offset: Optional[int]
+
+
+class Thread:
+    """
+    The message IDs of a thread's published posts in pre-order, so every
+    post's replies follow it in the order they were published. The IDs are
+    kept in blocks of up to 2 * BLOCK_SIZE, so finding and inserting a post
+    only searches and shifts one block.
+    """
+
+    __slots__ = ("blocks",)
+
+    def __init__(self, message_ids: List[int]) -> None:
+        self.blocks = [
+            array("i", message_ids[start : start + BLOCK_SIZE])
+            for start in range(0, max(len(message_ids), 1), BLOCK_SIZE)
+        ]
+
+    def __len__(self) -> int:
+        return sum(len(block) for block in self.blocks)
+
+    def tolist(self) -> List[int]:
+        return [message_id for block in self.blocks for message_id in block]
+
+    def position(self, message_id: int, block: "array[int]") -> int:
+        """
+        Returns the position of a post in the thread, given its block
+        """
+        start = 0
+        for other in self.blocks:
+            if other is block:
+                return start + block.index(message_id)
+            start += len(other)
+        raise ValueError(f"Message {message_id} is not in the thread")
+
+    def locate(self, position: int) -> Tuple[int, int]:
+        """
+        Returns the block number and offset in the block of a position
+        """
+        for number, block in enumerate(self.blocks):
+            if position < len(block):
+                return number, position
+            position -= len(block)
+        return len(self.blocks) - 1, position + len(self.blocks[-1])
+
+    def insert(
+        self, position: int, message_id: int
+    ) -> Tuple["array[int]", Optional["array[int]"]]:
+        """
+        Inserts a post at a position. Returns the block the post is in, and
+        the new block if the block it went into was split.
+        """
+        number, offset = self.locate(position)
+        block = self.blocks[number]
+        block.insert(offset, message_id)
+        if len(block) <= 2 * BLOCK_SIZE:
+            return block, None
+        new_block = block[BLOCK_SIZE:]
+        del block[BLOCK_SIZE:]
+        self.blocks.insert(number + 1, new_block)
+        return (block if offset < BLOCK_SIZE else new_block), new_block
+
+
+class ThreadColumns:
+    """
+    The parent, root, depth, descendant count and thread block of posts
+    with consecutive message IDs, indexed from the first of them. A post
+    has no root or block until it is published.
+    """
+
+    __slots__ = ("parents", "roots", "depths", "descendants", "blocks")
+
+    def __init__(self) -> None:
+        self.parents = array("i")
+        self.roots = array("i")
+        self.depths = array("I")
+        self.descendants = array("I")
+        self.blocks: List[Optional["array[int]"]] = []
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def add(self, reply_to: Optional[int]) -> None:
+        self.parents.append(NO_POST if reply_to is None else reply_to)
+        self.roots.append(NO_POST)
+        self.depths.append(0)
+        self.descendants.append(0)
+        self.blocks.append(None)
+
+
+class BoardThreads:
+    """
+    The threads on one board, indexed by root message ID, and the columns
+    of its posts. A partitioned board has columns for each partition, as
+    each partition has its own range of message IDs.
+    """
+
+    __slots__ = ("columns", "id_range", "threads")
+
+    def __init__(self, partitions: int = 1) -> None:
+        self.columns = [ThreadColumns() for _ in range(partitions)]
+        self.id_range = BoardPartition.id_range(partitions)
+        self.threads: Dict[int, Thread] = {}
+
+    def locate(self, message_id: int) -> Tuple[ThreadColumns, int]:
+        """
+        Returns the columns of a post and its index in them
+        """
+        number, index = divmod(message_id - FIRST_MESSAGE_ID, self.id_range)
+        return self.columns[number], index
+
+    def add(self, message_id: int, reply_to: Optional[int]) -> None:
+        columns, index = self.locate(message_id)
+        if index != len(columns):
+            expected = message_id - index + len(columns)
+            raise AssertionError(f"Expected message {expected}, got {message_id}")
+        columns.add(reply_to)
+
+    def publish(self, message_id: int) -> None:
+        locate = self.locate
+        columns, index = locate(message_id)
+        parent = columns.parents[index]
+        if parent == NO_POST:
+            columns.roots[index] = message_id
+            thread = self.threads[message_id] = Thread([message_id])
+            columns.blocks[index] = thread.blocks[0]
+            return
+        parent_columns, parent_index = locate(parent)
+        root = columns.roots[index] = parent_columns.roots[parent_index]
+        columns.depths[index] = parent_columns.depths[parent_index] + 1
+        thread = self.threads[root]
+        parent_block = parent_columns.blocks[parent_index]
+        assert parent_block is not None
+        position = thread.position(parent, parent_block)
+        block, new_block = thread.insert(
+            position + 1 + parent_columns.descendants[parent_index], message_id
+        )
+        if new_block is not None:
+            self._set_block(new_block)
+        columns.blocks[index] = block
+        all_columns = self.columns
+        id_range = self.id_range
+        while parent != NO_POST:
+            number, parent_index = divmod(parent - FIRST_MESSAGE_ID, id_range)
+            parent_columns = all_columns[number]
+            parent_columns.descendants[parent_index] += 1
+            parent = parent_columns.parents[parent_index]
+
+    def add_thread(self, message_ids: List[int]) -> None:
+        thread = self.threads[message_ids[0]] = Thread(message_ids)
+        for block in thread.blocks:
+            self._set_block(block)
+
+    def _set_block(self, block: "array[int]") -> None:
+        for message_id in block:
+            columns, index = self.locate(message_id)
+            columns.blocks[index] = block
+
+
+class ThreadIndex(Projection):
+    """
+    Keeps the published posts of each thread, indexed by board and root
+    message ID, flattened in pre-order for paging
+    """
+
+    def __init__(
+        self,
+        env: Optional[Mapping[str, str]] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        super().__init__(env, metrics)
+        self._threads_by_board: Dict[UUID, BoardThreads] = {}
+
+    def get_state(self) -> Dict[str, Any]:
+        boards = []
+        for board_id, board in self._threads_by_board.items():
+            columns = board.columns
+            row = [
+                board_id,
+                [parent for c in columns for parent in c.parents],
+                [root for c in columns for root in c.roots],
+                [depth for c in columns for depth in c.depths],
+                [count for c in columns for count in c.descendants],
+                [thread.tolist() for thread in board.threads.values()],
+            ]
+            if len(columns) > 1:
+                # The columns of the partitions are stored one after another
+                row.append([len(c) for c in columns])
+            boards.append(row)
+        return {"boards": boards}
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self.reset()
+        for row in state["boards"]:
+            board_id, parents, roots, depths, descendants, threads, *partitioning = row
+            lengths = partitioning[0] if partitioning else [len(parents)]
+            board = self._threads_by_board[board_id] = BoardThreads(len(lengths))
+            start = 0
+            for columns, length in zip(board.columns, lengths):
+                end = start + length
+                columns.parents = array("i", parents[start:end])
+                columns.roots = array("i", roots[start:end])
+                columns.depths = array("I", depths[start:end])
+                columns.descendants = array("I", descendants[start:end])
+                columns.blocks = [None] * length
+                start = end
+            for thread in threads:
+                board.add_thread(thread)
+
+    def merge_states(self, states: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {"boards": [board for state in states for board in state["boards"]]}
+
+    def reset(self) -> None:
+        self._threads_by_board = {}
+
+    @singledispatchmethod
+    def policy(self, domain_event: AggregateEvent, process_event: ProcessEvent) -> None:
+        pass
+
+    @policy.register(MessageBoard.MessagePostedEvent)
+    def _handle_post_created(
+        self, domain_event: MessageBoard.MessagePostedEvent, process_event: Any
+    ) -> None:
+        self._add_post(domain_event)
+
+    @policy.register(MessageBoard.MessageApprovedEvent)
+    def _handle_post_approved(
+        self, domain_event: MessageBoard.MessageApprovedEvent, process_event: Any
+    ) -> None:
+        self._get_board(board_id_of(domain_event)).publish(domain_event.message_id)
+
+    def process_batch(
+        self, domain_events: List[AggregateEvent], process_event: ProcessEvent
+    ) -> None:
+        # Replies are ordered by publication, so the chunk is applied in order
+        for domain_event in domain_events:
+            event_type = type(domain_event)
+            if event_type in MESSAGE_POSTED_EVENTS:
+                self._add_post(cast(MessageBoard.MessagePostedEvent, domain_event))
+            elif event_type in MESSAGE_APPROVED_EVENTS:
+                self._get_board(board_id_of(domain_event)).publish(
+                    cast(MessageBoard.MessageApprovedEvent, domain_event).message_id
+                )
+
+    def get_thread(
+        self,
+        board_id: UUID,
+        root_id: int,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> Optional[ThreadPage]:
+        """
+        Returns a page of at most ``limit`` posts of a thread in pre-order,
+        starting at ``offset`` in the thread, or None if there is no such
+        thread. Posts deeper than ``max_depth`` are left out, and their
+        subtrees are skipped without being visited. Raises ValueError if
+        ``offset`` is negative or ``limit`` is less than one.
+        """
+        if offset < 0:
+            raise ValueError(f"Offsets are never negative, not {offset}")
+        if limit is not None and limit < 1:
+            raise ValueError(f"Pages hold at least one post, not {limit}")
+        board = self._threads_by_board.get(board_id)
+        if board is None or root_id not in board.threads:
+            return None
+        thread = board.threads[root_id]
+        locate = board.locate
+        blocks = thread.blocks
+        number, offset = thread.locate(offset)
+        posts: List[ThreadPost] = []
+        while number < len(blocks) and (limit is None or len(posts) < limit):
+            block = blocks[number]
+            if offset >= len(block):
+                offset -= len(block)
+                number += 1
+                continue
+            message_id = block[offset]
+            columns, index = locate(message_id)
+            depth = columns.depths[index]
+            descendants = columns.descendants[index]
+            if max_depth is not None and depth >= max_depth:
+                offset += 1 + descendants
+                if depth > max_depth:
+                    continue
+            else:
+                offset += 1
+            posts.append(ThreadPost(message_id, depth, descendants))
+        while number < len(blocks) and offset >= len(blocks[number]):
+            offset -= len(blocks[number])
+            number += 1
+        if number == len(blocks):
+            return ThreadPage(tuple(posts), None)
+        next_offset = sum(len(block) for block in blocks[:number]) + offset
+        return ThreadPage(tuple(posts), next_offset)
+
+    def _get_board(self, board_id: UUID, partitions: int = 1) -> BoardThreads:
+        board = self._threads_by_board.get(board_id)
+        if board is None:
+            board = self._threads_by_board[board_id] = BoardThreads(partitions)
+        return board
+
+    def _add_post(self, domain_event: MessageBoard.MessagePostedEvent) -> None:
+        board = self._get_board(
+            board_id_of(domain_event), getattr(domain_event, "partitions", 1)
+        )
+        board.add(domain_event.message_id, domain_event.reply_to)
+        if not domain_event.requires_moderation:
+            board.publish(domain_event.message_id)
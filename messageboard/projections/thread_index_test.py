@@ -0,0 +1,193 @@
+import random
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+import pytest
+from eventsourcing.system import SingleThreadedRunner, System
+
+from messageboard.application import MessageBoards
+from messageboard.projections import thread_index as thread_index_module
+from messageboard.projections.thread_index import ThreadIndex, ThreadPost
+
+ADMIN_ID = uuid4()
+USER_ID = uuid4()
+
+
+def start() -> Tuple[MessageBoards, ThreadIndex]:
+    system = System(pipes=[[MessageBoards, ThreadIndex]])
+    runner = SingleThreadedRunner(system)
+    runner.start()
+    return runner.get(MessageBoards), runner.get(ThreadIndex)
+
+
+def post(message_boards: MessageBoards, board_id: UUID, reply_to: Optional[int]) -> int:
+    return message_boards.post_message(board_id, "text", reply_to, USER_ID)
+
+
+def test_thread_is_flattened_in_pre_order() -> None:
+    message_boards, thread_index = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    root = post(message_boards, board_id, None)
+    first = post(message_boards, board_id, root)
+    second = post(message_boards, board_id, root)
+    first_reply = post(message_boards, board_id, first)
+    first_reply_reply = post(message_boards, board_id, first_reply)
+    second_reply = post(message_boards, board_id, second)
+    other_root = post(message_boards, board_id, None)
+
+    page = thread_index.get_thread(board_id, root)
+    assert page is not None
+    assert page.posts == (
+        ThreadPost(root, 0, 5),
+        ThreadPost(first, 1, 2),
+        ThreadPost(first_reply, 2, 1),
+        ThreadPost(first_reply_reply, 3, 0),
+        ThreadPost(second, 1, 1),
+        ThreadPost(second_reply, 2, 0),
+    )
+    assert page.next_offset is None
+    other_page = thread_index.get_thread(board_id, other_root)
+    assert other_page is not None
+    assert other_page.posts == (ThreadPost(other_root, 0, 0),)
+    assert thread_index.get_thread(board_id, first) is None
+    assert thread_index.get_thread(uuid4(), root) is None
+
+
+def test_threads_are_paged_and_limited_in_depth() -> None:
+    message_boards, thread_index = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    root = post(message_boards, board_id, None)
+    chain: List[int] = []
+    for _ in range(3):
+        reply = post(message_boards, board_id, root)
+        chain = [reply]
+        for _ in range(50):
+            chain.append(post(message_boards, board_id, chain[-1]))
+
+    pages = []
+    offset: Optional[int] = 0
+    while offset is not None:
+        page = thread_index.get_thread(board_id, root, offset, limit=2, max_depth=1)
+        assert page is not None
+        pages.append([thread_post.depth for thread_post in page.posts])
+        offset = page.next_offset
+    assert pages == [[0, 1], [1, 1]]
+
+    page = thread_index.get_thread(board_id, root, offset=150, limit=10)
+    assert page is not None
+    assert [thread_post.message_id for thread_post in page.posts] == chain[-4:]
+    assert page.next_offset is None
+
+    page = thread_index.get_thread(board_id, root, offset=100, limit=2, max_depth=1)
+    assert page is not None
+    assert [thread_post.depth for thread_post in page.posts] == [1]
+
+
+def test_negative_offsets_and_empty_pages_are_rejected() -> None:
+    message_boards, thread_index = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    root = post(message_boards, board_id, None)
+    post(message_boards, board_id, root)
+
+    with pytest.raises(ValueError):
+        thread_index.get_thread(board_id, root, offset=-1)
+    with pytest.raises(ValueError):
+        thread_index.get_thread(board_id, root, offset=1, limit=0)
+
+
+def test_moderated_replies_are_added_when_approved() -> None:
+    message_boards, thread_index = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    root = post(message_boards, board_id, None)
+    moderated_user_id = uuid4()
+    message_boards.moderate_user(board_id, moderated_user_id, ADMIN_ID)
+    moderated = message_boards.post_message(board_id, "text", root, moderated_user_id)
+    reply = post(message_boards, board_id, root)
+
+    page = thread_index.get_thread(board_id, root)
+    assert page is not None
+    assert [thread_post.message_id for thread_post in page.posts] == [root, reply]
+
+    message_boards.approve_message(board_id, moderated, ADMIN_ID)
+    post(message_boards, board_id, moderated)
+    page = thread_index.get_thread(board_id, root)
+    assert page is not None
+    assert [thread_post.message_id for thread_post in page.posts] == [
+        root,
+        reply,
+        moderated,
+        moderated + 2,
+    ]
+
+    restored = ThreadIndex()
+    restored.set_state(thread_index.get_state())
+    assert restored.get_thread(board_id, root) == page
+
+
+def test_large_threads_are_split_into_blocks(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(thread_index_module, "BLOCK_SIZE", 4)
+    message_boards, thread_index = start()
+    board_id = message_boards.create_message_board("Foobar board", ADMIN_ID)
+    root = post(message_boards, board_id, None)
+    replies: Dict[int, List[int]] = {root: []}
+    rng = random.Random(1)
+    for _ in range(200):
+        parent = rng.choice(list(replies))
+        reply = post(message_boards, board_id, parent)
+        replies[parent].append(reply)
+        replies[reply] = []
+
+    expected: List[int] = []
+    stack = [root]
+    while stack:
+        message_id = stack.pop()
+        expected.append(message_id)
+        stack.extend(reversed(replies[message_id]))
+
+    page = thread_index.get_thread(board_id, root)
+    assert page is not None
+    assert [thread_post.message_id for thread_post in page.posts] == expected
+    assert page.posts[0].descendants == 200
+    page = thread_index.get_thread(board_id, root, offset=97, limit=50)
+    assert page is not None
+    assert [thread_post.message_id for thread_post in page.posts] == expected[97:147]
+    assert page.next_offset == 147
+
+    restored = ThreadIndex()
+    restored.set_state(thread_index.get_state())
+    assert restored.get_thread(board_id, root, offset=97, limit=50) == page
+
+
+def test_threads_on_partitioned_board_span_partitions() -> None:
+    message_boards, thread_index = start()
+    board_id = message_boards.create_message_board(
+        "Foobar board", ADMIN_ID, partitions=2
+    )
+    # The batch goes to one partition, and the posts after it alternate
+    # between the partitions
+    root, other_root = message_boards.post_messages(
+        board_id, [("text", None, USER_ID), ("text", None, USER_ID)]
+    )
+    first = post(message_boards, board_id, root)
+    second = post(message_boards, board_id, root)
+    first_reply = post(message_boards, board_id, first)
+
+    assert (other_root, second, first_reply) == (root + 1, root + 2, first + 1)
+    page = thread_index.get_thread(board_id, root)
+    assert page is not None
+    assert page.posts == (
+        ThreadPost(root, 0, 3),
+        ThreadPost(first, 1, 1),
+        ThreadPost(first_reply, 2, 0),
+        ThreadPost(second, 1, 0),
+    )
+    # Only the posts are given columns, not the IDs between the partitions
+    board = thread_index._threads_by_board[board_id]
+    assert [len(columns) for columns in board.columns] in ([3, 2], [2, 3])
+
+    restored = ThreadIndex()
+    restored.set_state(thread_index.get_state())
+    assert restored.get_thread(board_id, root) == page
+    other_page = thread_index.get_thread(board_id, other_root)
+    assert other_page is not None
+    assert other_page.posts == (ThreadPost(other_root, 0, 0),)
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from copy import copy
+from threading import Lock
+from typing import Generic, Optional, TypeVar
+from uuid import UUID
+
+from eventsourcing.application import Repository
+from eventsourcing.domain import Aggregate, AggregateEvent, Snapshot
+from eventsourcing.persistence import EventStore
+
+TAggregate = TypeVar("TAggregate", bound=Aggregate)
+
+
+def copy_aggregate(aggregate: TAggregate) -> TAggregate:
+    """
+    Copy an aggregate and each of its attributes, without pending events.
+
+    This is enough to make an independent copy of aggregates whose
+    attributes are immutable values, or containers of immutable values.
+    """
+    aggregate_copy = object.__new__(type(aggregate))
+    for name, value in aggregate.__dict__.items():
+        aggregate_copy.__dict__[name] = copy(value)
+    aggregate_copy.__dict__["_pending_events"] = []
+    return aggregate_copy
+
+
+class AggregateCache(Generic[TAggregate]):
+    """
+    Bounded cache of aggregates keyed by aggregate ID, which evicts the
+    least recently used aggregate when it is full.
+
+    Aggregates are copied into and out of the cache, so callers can change
+    the aggregates they get without affecting other callers.
+    """
+
+    def __init__(self, maxsize: int):
+        if maxsize < 1:
+            raise ValueError("Cache size must be at least 1")
+        self.maxsize = maxsize
+        self._aggregates: OrderedDict[UUID, TAggregate] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, aggregate_id: UUID) -> Optional[TAggregate]:
+        with self._lock:
+            aggregate = self._aggregates.get(aggregate_id)
+            if aggregate is None:
+                return None
+            self._aggregates.move_to_end(aggregate_id)
+        return copy_aggregate(aggregate)
+
+    def put(self, aggregate: TAggregate) -> None:
+        """
+        Cache a copy of the aggregate, unless a newer version is already cached
+        """
+        if aggregate.pending_events:
+            raise ValueError("Aggregates with unsaved changes can't be cached")
+        aggregate_copy = copy_aggregate(aggregate)
+        with self._lock:
+            cached = self._aggregates.get(aggregate.id)
+            if cached is None or cached.version < aggregate_copy.version:
+                self._aggregates[aggregate.id] = aggregate_copy
+            self._aggregates.move_to_end(aggregate.id)
+            while len(self._aggregates) > self.maxsize:
+                self._aggregates.popitem(last=False)
+
+    def evict(self, aggregate_id: UUID) -> None:
+        with self._lock:
+            self._aggregates.pop(aggregate_id, None)
+
+    def __contains__(self, aggregate_id: UUID) -> bool:
+        with self._lock:
+            return aggregate_id in self._aggregates
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._aggregates)
+
+
+class CachingRepository(Repository[TAggregate]):
+    """
+    Repository that keeps recently used aggregates in an
+    :class:`AggregateCache` and brings a cached aggregate up to date by
+    replaying only the events recorded after its cached version.
+    """
+
+    def __init__(
+        self,
+        event_store: EventStore[AggregateEvent],
+        cache: AggregateCache[TAggregate],
+        snapshot_store: Optional[EventStore[Snapshot]] = None,
+    ):
+        super().__init__(event_store, snapshot_store)
+        self.cache = cache
+
+    def get(self, aggregate_id: UUID, version: Optional[int] = None) -> TAggregate:
+        if version is not None:
+            return super().get(aggregate_id, version)
+        aggregate = self.cache.get(aggregate_id)
+        if aggregate is None:
+            aggregate = super().get(aggregate_id)
+        else:
+            for domain_event in self.event_store.get(
+                originator_id=aggregate_id, gt=aggregate.version
+            ):
+                domain_event.mutate(aggregate)
+        self.cache.put(aggregate)
+        return aggregate
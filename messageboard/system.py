@@ -0,0 +1,340 @@
+from threading import Condition, Event, Lock, Thread
+from typing import Callable, Dict, List, Optional, Type, TypeVar, cast
+
+from eventsourcing.application import Application
+from eventsourcing.domain import AggregateEvent
+from eventsourcing.system import Follower, Leader, Promptable, Runner, System
+
+from messageboard.application import MessageBoards
+from messageboard.metrics import NULL_METRICS, Metrics
+from messageboard.projections.posts_by_user_index import PostsByUserIndex
+from messageboard.projections.posts_repo import PostRepository
+from messageboard.projections.projection import Projection
+
+A = TypeVar("A")
+
+MESSAGE_BOARDS_SYSTEM = System(
+    pipes=[[MessageBoards, PostRepository], [MessageBoards, PostsByUserIndex]]
+)
+
+
+class FollowerThread(Promptable, Thread):
+    """
+    Runs one follower of a :class:`ThreadedRunner`, pulling and processing
+    the notifications of its leaders whenever it is prompted.
+
+    The notification logs of the leaders are the queues between the leaders
+    and the follower, and a leader is prompted by every save. When the
+    follower is more than ``max_lag`` notifications behind a leader, the
+    prompt blocks until it has caught up, so the thread that saved is held
+    back rather than the queue growing without bound. Prompts come after
+    the leader's events are recorded, so they never raise: once the
+    follower has stopped they are ignored, and the failure is reported by
+    :func:`wait_for` and :func:`ThreadedRunner.errors`.
+
+    The position of each leader is counted from the notifications its saves
+    report (see :class:`PositionReportingLeader`), so prompts don't query
+    the leader's log. The lag behind each leader is reported to the
+    follower's metrics sink, if it has one, whenever the follower is
+    prompted or has processed.
+    """
+
+    def __init__(self, app: Follower, leaders: Dict[str, Leader], max_lag: int):
+        super().__init__(name=f"{app.__class__.__name__}Thread", daemon=True)
+        self.app = app
+        self.leaders = leaders
+        self.max_lag = max_lag
+        self.error: Optional[BaseException] = None
+        self.is_stopping = Event()
+        self._prompted_names: List[str] = []
+        self._prompted_names_lock = Lock()
+        self._is_prompted = Event()
+        self._processed = Condition()
+        self._leader_positions = {
+            name: leader.recorder.max_notification_id()
+            for name, leader in leaders.items()
+        }
+        # The positions of followers that aren't projections, which are
+        # only known once they have finished processing
+        self._positions: Dict[str, int] = {}
+        if isinstance(app, Projection):
+            app.on_processed = self._notify_processed
+        self.metrics: Metrics = getattr(app, "metrics", NULL_METRICS)
+
+    def run(self) -> None:
+        try:
+            while True:
+                self._is_prompted.wait()
+                if self.is_stopping.is_set():
+                    break
+                with self._prompted_names_lock:
+                    prompted_names = self._prompted_names
+                    self._prompted_names = []
+                    self._is_prompted.clear()
+                for name in prompted_names:
+                    self.app.pull_and_process(name)
+                    if not isinstance(self.app, Projection):
+                        self._notify_processed(
+                            name, self.app.recorder.max_tracking_id(name)
+                        )
+                    if self.metrics.enabled:
+                        self.lag(name)
+        except BaseException as e:
+            self.error = e
+            raise
+        finally:
+            self.is_stopping.set()
+            with self._processed:
+                self._processed.notify_all()
+
+    def prompt(self, leader_name: str) -> None:
+        """
+        Prompts the follower to process a leader's notifications, without
+        waiting for it to catch up
+        """
+        with self._prompted_names_lock:
+            if leader_name not in self._prompted_names:
+                self._prompted_names.append(leader_name)
+            self._is_prompted.set()
+
+    def receive_prompt(self, leader_name: str) -> None:
+        if self.is_stopping.is_set():
+            return
+        self.prompt(leader_name)
+        if self.lag(leader_name) > self.max_lag:
+            position = self._leader_positions[leader_name] - self.max_lag
+            self._wait_until(lambda: self.position(leader_name) >= position)
+
+    def record_saved(self, leader_name: str, notifications: int) -> None:
+        """
+        Moves the position of a leader on by the number of notifications
+        that a save has just recorded
+        """
+        with self._processed:
+            self._leader_positions[leader_name] += notifications
+
+    def stop(self) -> None:
+        self.is_stopping.set()
+        self._is_prompted.set()
+        self.join()
+
+    def position(self, leader_name: str) -> int:
+        """
+        Returns the position the follower has processed up to in a leader's
+        notification log
+        """
+        if isinstance(self.app, Projection):
+            return self.app.positions.get(leader_name, 0)
+        position = self._positions.get(leader_name)
+        if position is None:
+            position = self.app.recorder.max_tracking_id(leader_name)
+        return position
+
+    def leader_position(self, leader_name: str) -> int:
+        """
+        Returns the position of the last notification in a leader's log
+        """
+        with self._processed:
+            return self._leader_positions[leader_name]
+
+    def lag(self, leader_name: str) -> int:
+        """
+        Returns the number of notifications in a leader's log that the
+        follower has yet to process
+        """
+        lag = max(self.leader_position(leader_name) - self.position(leader_name), 0)
+        if self.metrics.enabled:
+            self.metrics.set_gauge(
+                "messageboard_projection_lag",
+                lag,
+                projection=self.app.__class__.__name__,
+                leader=leader_name,
+            )
+        return lag
+
+    def wait_for(
+        self, leader_name: str, position: int, timeout: Optional[float] = None
+    ) -> None:
+        """
+        Waits until the follower has processed a leader's log up to the given
+        position. Raises :class:`TimeoutError` if it hasn't after ``timeout``
+        seconds, or :class:`FollowerStopped` if the follower stops first.
+        """
+        if not self._wait_until(
+            lambda: self.position(leader_name) >= position, timeout
+        ):
+            raise TimeoutError(
+                f"{self.app.__class__.__name__} has not processed "
+                f"{leader_name} up to {position}"
+            )
+        if self.position(leader_name) < position:
+            raise FollowerStopped(self.app.__class__.__name__) from self.error
+
+    def _notify_processed(self, leader_name: str, position: int) -> None:
+        with self._processed:
+            if not isinstance(self.app, Projection):
+                self._positions[leader_name] = position
+            self._processed.notify_all()
+
+    def _wait_until(
+        self, predicate: Callable[[], bool], timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Waits until the predicate is true or the follower has stopped. Returns
+        False if neither happens within ``timeout`` seconds.
+        """
+        with self._processed:
+            return self._processed.wait_for(
+                lambda: self.is_stopping.is_set() or predicate(), timeout
+            )
+
+
+class FollowerStopped(Exception):
+    """
+    Raised when waiting for a follower that has stopped, because the runner
+    was stopped or processing failed
+    """
+
+
+class PositionReportingLeader(Leader):
+    """
+    Leader that tells the followers run by a :class:`ThreadedRunner` how
+    many notifications each save has recorded, before prompting them
+    """
+
+    def notify(self, new_events: List[AggregateEvent]) -> None:
+        if new_events:
+            name = self.__class__.__name__
+            for follower in self.followers:
+                if isinstance(follower, FollowerThread):
+                    follower.record_saved(name, len(new_events))
+        super().notify(new_events)
+
+
+class ThreadedRunner(Runner):
+    """
+    Runs a :class:`System` with a :class:`FollowerThread` for each follower,
+    so commands return as soon as their events are saved, without waiting
+    for the followers to process them. Each follower is allowed to fall up
+    to ``max_lag`` notifications behind each of its leaders, after which
+    saving waits for it to catch up.
+
+    Reads that have to see a command's effects can wait for the follower
+    to reach the leader's position with :func:`wait_for`.
+    """
+
+    DEFAULT_MAX_LAG = 1000
+
+    def __init__(self, system: System, max_lag: Optional[int] = None):
+        super().__init__(system)
+        self.max_lag = self.DEFAULT_MAX_LAG if max_lag is None else max_lag
+        self.apps: Dict[str, Application] = {}
+        self.threads: Dict[str, FollowerThread] = {}
+
+    def start(self) -> None:
+        super().start()
+        for name in self.system.followers:
+            self.apps[name] = self._app_cls(self.system.follower_cls(name))()
+        for name in self.system.leaders_only:
+            self.apps[name] = self._app_cls(self.system.leader_cls(name))()
+        for name in self.system.followers:
+            follower = self.apps[name]
+            assert isinstance(follower, Follower)
+            leaders: Dict[str, Leader] = {}
+            for leader_name in self.system.follows[name]:
+                leader = self.apps[leader_name]
+                assert isinstance(leader, Leader)
+                leaders[leader_name] = leader
+            self.threads[name] = FollowerThread(follower, leaders, self.max_lag)
+        for leader_name, follower_name in self.system.edges:
+            leader = self.apps[leader_name]
+            follower = self.apps[follower_name]
+            assert isinstance(leader, Leader)
+            assert isinstance(follower, Follower)
+            if isinstance(follower, Projection):
+                # The follower thread catches up once it has started
+                follower.follow(leader_name, leader.log, catch_up=False)
+            else:
+                follower.follow(leader_name, leader.log)
+            leader.lead(self.threads[follower_name])
+        for thread in self.threads.values():
+            thread.start()
+            # Catch up with anything already recorded
+            for leader_name in thread.leaders:
+                thread.prompt(leader_name)
+
+    def stop(self) -> None:
+        for thread in self.threads.values():
+            thread.stop()
+
+    def _app_cls(self, cls: Type[A]) -> Type[A]:
+        """
+        Makes the leaders report the notifications they record to the
+        follower threads, keeping the application's name
+        """
+        if issubclass(cls, Leader) and cls.__name__ in self.system.leaders:
+            return cast(Type[A], type(cls.__name__, (PositionReportingLeader, cls), {}))
+        return cls
+
+    def get(self, cls: Type[A]) -> A:
+        app = self.apps[cls.__name__]
+        assert isinstance(app, cls)
+        return app
+
+    def lag(self, cls: Type[Follower]) -> int:
+        """
+        Returns the number of notifications that a follower has yet to
+        process, from all of its leaders
+        """
+        return self.lags()[cls.__name__]
+
+    def lags(self) -> Dict[str, int]:
+        """
+        Returns the lag of each follower, by name
+        """
+        return {
+            name: sum(thread.lag(leader_name) for leader_name in thread.leaders)
+            for name, thread in self.threads.items()
+        }
+
+    def errors(self) -> Dict[str, BaseException]:
+        """
+        Returns the error that stopped each follower that has failed, by name
+        """
+        return {
+            name: thread.error
+            for name, thread in self.threads.items()
+            if thread.error is not None
+        }
+
+    def wait_for(
+        self,
+        cls: Type[Follower],
+        position: Optional[int] = None,
+        leader: Optional[Type[Leader]] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """
+        Waits until a follower has processed a leader's notification log up
+        to the given position, by default the last notification recorded
+        when it is called, so it has processed every command that has
+        returned. The leader can be left out when the follower follows only
+        one application.
+
+        :raises TimeoutError: If the follower hasn't reached the position
+            after ``timeout`` seconds
+        :raises FollowerStopped: If the follower stops first
+        """
+        thread = self.threads[cls.__name__]
+        if leader is None:
+            if len(thread.leaders) != 1:
+                raise ValueError(
+                    f"{cls.__name__} follows {sorted(thread.leaders)}, "
+                    "so the leader must be given"
+                )
+            (leader_name,) = thread.leaders
+        else:
+            leader_name = leader.__name__
+        if position is None:
+            position = thread.leaders[leader_name].recorder.max_notification_id()
+        thread.wait_for(leader_name, position, timeout)
@@ -0,0 +1,191 @@
+import threading
+from typing import List
+from uuid import uuid4
+
+import pytest
+from eventsourcing.system import System
+
+from messageboard.application import MessageBoards
+from messageboard.projections.posts_by_user_index import PostsByUserIndex
+from messageboard.projections.posts_repo import PostRepository
+from messageboard.system import MESSAGE_BOARDS_SYSTEM, FollowerStopped, ThreadedRunner
+
+ADMIN_ID = uuid4()
+USER_ID = uuid4()
+
+
+class GatedIndex(PostsByUserIndex):
+    """
+    Only processes notifications while the gate is open
+    """
+
+    gate = threading.Event()
+
+    def pull_and_process(self, name: str) -> None:
+        self.gate.wait()
+        super().pull_and_process(name)
+
+
+class FailingIndex(PostsByUserIndex):
+    def pull_and_process(self, name: str) -> None:
+        raise RuntimeError("Failed")
+
+
+@pytest.fixture
+def gate() -> threading.Event:
+    GatedIndex.gate.clear()
+    return GatedIndex.gate
+
+
+def test_projections_are_read_after_waiting_for_them() -> None:
+    runner = ThreadedRunner(MESSAGE_BOARDS_SYSTEM)
+    runner.start()
+    try:
+        message_boards = runner.get(MessageBoards)
+        board_id = message_boards.create_message_board("Test board", ADMIN_ID)
+        message_id = message_boards.post_message(board_id, "hello", None, USER_ID)
+
+        runner.wait_for(PostRepository)
+        post = runner.get(PostRepository).get_post(board_id, message_id)
+        assert post is not None and post.test == "hello"
+        runner.wait_for(PostsByUserIndex, timeout=5)
+        posts_by_user = runner.get(PostsByUserIndex).get_posts_for_user(USER_ID)
+        assert posts_by_user.posts == ((board_id, message_id),)
+        assert runner.lags() == {"PostRepository": 0, "PostsByUserIndex": 0}
+    finally:
+        runner.stop()
+
+
+def test_commands_do_not_wait_for_projections(gate: threading.Event) -> None:
+    runner = ThreadedRunner(System(pipes=[[MessageBoards, GatedIndex]]))
+    runner.start()
+    try:
+        message_boards = runner.get(MessageBoards)
+        board_id = message_boards.create_message_board("Test board", ADMIN_ID)
+        message_boards.post_message(board_id, "hello", None, USER_ID)
+        # The board was created with its administrator added, and then posted to
+        assert runner.lag(GatedIndex) == 3
+        with pytest.raises(TimeoutError):
+            runner.wait_for(GatedIndex, timeout=0.05)
+
+        gate.set()
+        runner.wait_for(GatedIndex, timeout=5)
+        assert runner.lag(GatedIndex) == 0
+        assert len(runner.get(GatedIndex).get_posts_for_user(USER_ID).posts) == 1
+    finally:
+        gate.set()
+        runner.stop()
+
+
+def test_commands_wait_when_a_projection_falls_too_far_behind(
+    gate: threading.Event,
+) -> None:
+    runner = ThreadedRunner(System(pipes=[[MessageBoards, GatedIndex]]), max_lag=3)
+    runner.start()
+    try:
+        message_boards = runner.get(MessageBoards)
+        board_id = message_boards.create_message_board("Test board", ADMIN_ID)
+
+        def post_messages() -> None:
+            for i in range(5):
+                message_boards.post_message(board_id, f"post {i}", None, USER_ID)
+
+        thread = threading.Thread(target=post_messages)
+        thread.start()
+        thread.join(timeout=0.2)
+        assert thread.is_alive()
+        assert runner.lag(GatedIndex) == 4
+
+        gate.set()
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+        runner.wait_for(GatedIndex, timeout=5)
+        assert len(runner.get(GatedIndex).get_posts_for_user(USER_ID).posts) == 5
+    finally:
+        gate.set()
+        runner.stop()
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_waiting_for_a_failed_projection_raises_an_error() -> None:
+    runner = ThreadedRunner(System(pipes=[[MessageBoards, FailingIndex]]))
+    runner.start()
+    try:
+        message_boards = runner.get(MessageBoards)
+        # The index fails on the prompt to catch up when the runner starts
+        with pytest.raises(FollowerStopped):
+            runner.wait_for(FailingIndex, position=1, timeout=5)
+        assert list(runner.errors()) == ["FailingIndex"]
+        # Saving still succeeds, and the failure is reported to readers
+        board_id = message_boards.create_message_board("Test board", ADMIN_ID)
+        assert message_boards.repository.get(board_id).id == board_id
+        with pytest.raises(FollowerStopped):
+            runner.wait_for(FailingIndex, timeout=5)
+        assert runner.lag(FailingIndex) == 2
+    finally:
+        runner.stop()
+
+
+def test_saves_do_not_query_the_leader_log() -> None:
+    runner = ThreadedRunner(MESSAGE_BOARDS_SYSTEM, max_lag=0)
+    runner.start()
+    try:
+        message_boards = runner.get(MessageBoards)
+        queries = []
+        max_notification_id = message_boards.recorder.max_notification_id
+
+        def record_query() -> int:
+            queries.append(1)
+            return max_notification_id()
+
+        message_boards.recorder.max_notification_id = record_query  # type: ignore
+        board_id = message_boards.create_message_board("Test board", ADMIN_ID)
+        for i in range(3):
+            message_boards.post_message(board_id, f"post {i}", None, USER_ID)
+
+        assert runner.lags() == {"PostRepository": 0, "PostsByUserIndex": 0}
+        assert queries == []
+    finally:
+        runner.stop()
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_saves_succeed_when_a_projection_fails(gate: threading.Event) -> None:
+    class FailingGatedIndex(GatedIndex):
+        def pull_and_process(self, name: str) -> None:
+            self.gate.wait()
+            raise RuntimeError("Failed")
+
+    runner = ThreadedRunner(System(pipes=[[MessageBoards, FailingGatedIndex]]), 2)
+    runner.start()
+    try:
+        message_boards = runner.get(MessageBoards)
+        board_id = message_boards.create_message_board("Test board", ADMIN_ID)
+        errors: List[BaseException] = []
+
+        def post_message() -> None:
+            try:
+                message_boards.post_message(board_id, "post", None, USER_ID)
+            except BaseException as e:
+                errors.append(e)
+
+        # The post waits for the projection, which fails after the post's
+        # events are recorded
+        thread = threading.Thread(target=post_message)
+        thread.start()
+        thread.join(timeout=0.1)
+        assert thread.is_alive()
+        gate.set()
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+        assert errors == []
+
+        # Later saves don't wait for the failed projection
+        message_boards.post_message(board_id, "post", None, USER_ID)
+        assert message_boards.repository.get(board_id).next_message_id == 2
+        assert [type(e) for e in runner.errors().values()] == [RuntimeError]
+        with pytest.raises(FollowerStopped):
+            runner.wait_for(FailingGatedIndex, timeout=5)
+    finally:
+        gate.set()
+        runner.stop()
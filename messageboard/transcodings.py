@@ -0,0 +1,39 @@
+from typing import Any, List
+
+from eventsourcing.persistence import Transcoding
+
+from messageboard.intset import IntRangeSet
+
+
+class SetAsList(Transcoding):
+    """
+    Transcoding that represents :class:`set` objects as lists, so
+    that aggregate state such as user ID sets can be snapshotted.
+    """
+
+    type = set
+    name = "set"
+
+    def encode(self, obj: set) -> List[Any]:
+        return list(obj)
+
+    def decode(self, data: List[Any]) -> set:
+        assert isinstance(data, list)
+        return set(data)
+
+
+class IntRangeSetAsList(Transcoding):
+    """
+    Transcoding that represents :class:`IntRangeSet` objects as
+    their list of range boundaries.
+    """
+
+    type = IntRangeSet
+    name = "int_range_set"
+
+    def encode(self, obj: IntRangeSet) -> List[int]:
+        return obj.bounds()
+
+    def decode(self, data: List[int]) -> IntRangeSet:
+        assert isinstance(data, list)
+        return IntRangeSet.from_bounds(data)